@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+# Read by the database settings, loaded by get_asgi_application() below.
+os.environ["DJANGO_ASGI"] = "1"
 
 application = get_asgi_application()
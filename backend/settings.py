@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "social_django",
     "rest_framework",
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -53,6 +55,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "social_django.middleware.SocialAuthExceptionMiddleware",
+    "core.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -86,9 +90,49 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "your_password"),
         "HOST": os.environ.get("POSTGRES_HOST", "postgres"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Each worker process shares a psycopg connection pool among its threads. A
+# thread holds a connection for one request at a time, so a worker needs at
+# most one per thread plus one for background work; the pool is also capped
+# so that all workers together stay within DB_MAX_CONNECTIONS. A thread
+# waits up to DB_POOL_TIMEOUT seconds for a free connection.
+#
+# With DB_POOL=0 connections are instead kept open across requests for
+# DB_CONN_MAX_AGE seconds, one per thread. That is only the default when
+# every worker thread fits in DB_MAX_CONNECTIONS, and never under the ASGI
+# worker, whose threads don't close their connections at the end of a
+# request.
+GUNICORN_WORKERS = int(
+    os.environ.get("GUNICORN_WORKERS", str(2 * (os.cpu_count() or 1) + 1))
+)
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "10"))
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "90"))
+DB_POOL = os.environ.get("DB_POOL", "1") == "1"
+DB_POOL_MAX_SIZE = int(
+    os.environ.get(
+        "DB_POOL_MAX_SIZE",
+        str(max(1, min(GUNICORN_THREADS + 1, DB_MAX_CONNECTIONS // GUNICORN_WORKERS))),
+    )
+)
+if DB_POOL:
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(
+                os.environ.get("DB_POOL_MIN_SIZE", str(min(2, DB_POOL_MAX_SIZE)))
+            ),
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    }
+elif os.environ.get("DJANGO_ASGI") != "1":
+    fits = GUNICORN_WORKERS * (GUNICORN_THREADS + 1) <= DB_MAX_CONNECTIONS
+    DATABASES["default"]["CONN_MAX_AGE"] = int(
+        os.environ.get("DB_CONN_MAX_AGE", "60" if fits else "0")
+    )
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -155,6 +199,19 @@ SOCIAL_AUTH_LOGIN_REDIRECT_URL = f"http://{os.getenv("ALLOWED_HOST")}:3000/"
 SOCIAL_AUTH_LOGIN_ERROR_URL = f"http://{os.getenv("ALLOWED_HOST")}:3000/"
 SOCIAL_AUTH_NEW_USER_REDIRECT_URL = f"http://{os.getenv("ALLOWED_HOST")}:3000/"
 SOCIAL_AUTH_NEW_USER_SEND_EMAIL = False
+# The default pipeline, with a create_user that turns a duplicate email into
+# an auth error (shown on the error URL) instead of a 500.
+SOCIAL_AUTH_PIPELINE = (
+    "social_core.pipeline.social_auth.social_details",
+    "social_core.pipeline.social_auth.social_uid",
+    "social_core.pipeline.social_auth.auth_allowed",
+    "social_core.pipeline.social_auth.social_user",
+    "social_core.pipeline.user.get_username",
+    "core.pipeline.create_user",
+    "social_core.pipeline.social_auth.associate_user",
+    "social_core.pipeline.social_auth.load_extra_data",
+    "social_core.pipeline.user.user_details",
+)
 
 AUTH_USER_MODEL = "core.User"
 
@@ -185,10 +242,213 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 REST_FRAMEWORK = {
+    # Bearer JWTs are checked without touching the database; sessions remain
+    # for the admin and the browsable API.
     "DEFAULT_AUTHENTICATION_CLASSES": (
+        "core.authentication.JWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.BasicAuthentication",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    # Keyset pagination; clients sending ?page= still get page numbers.
+    "DEFAULT_PAGINATION_CLASS": "core.pagination.KeysetPagination",
     "PAGE_SIZE": 10,
 }
+
+# Request metrics served on /metrics in the Prometheus text format. With
+# several workers, point METRICS_DIR at a directory they share (emptied on
+# start-up) so a scrape sees the sum over all of them. If METRICS_TOKEN is
+# set, scrapes must send it as a bearer token; otherwise only scrapes from
+# loopback and from staff are answered.
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# On-demand request profiling: staff send an X-Profile header, and a
+# REQUEST_PROFILE_SAMPLE_RATE fraction of all requests is profiled too.
+# Captures are browsed in the admin; the newest REQUEST_PROFILE_KEEP stay.
+REQUEST_PROFILE_SAMPLE_RATE = float(os.environ.get("REQUEST_PROFILE_SAMPLE_RATE", "0"))
+REQUEST_PROFILE_KEEP = int(os.environ.get("REQUEST_PROFILE_KEEP", "500"))
+REQUEST_PROFILE_MAX_QUERIES = int(os.environ.get("REQUEST_PROFILE_MAX_QUERIES", "500"))
+REQUEST_PROFILE_LINES = int(os.environ.get("REQUEST_PROFILE_LINES", "60"))
+
+# Signed API tokens issued by /api/login/. Access tokens are short-lived and
+# verified from their claims alone; refresh tokens are exchanged at
+# /api/token/refresh/.
+JWT_SIGNING_KEY = os.environ.get("JWT_SIGNING_KEY", SECRET_KEY)
+JWT_ALGORITHM = "HS256"
+JWT_ACCESS_TTL = int(os.environ.get("JWT_ACCESS_TTL", "300"))
+JWT_REFRESH_TTL = int(os.environ.get("JWT_REFRESH_TTL", str(7 * 24 * 3600)))
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Optional shared tier for company profiles and symbol lookups, e.g.
+# django.core.cache.backends.db.DatabaseCache with a table created by
+# `manage.py createcachetable`, or FileBasedCache with a directory.
+if os.environ.get("REFERENCE_CACHE_BACKEND"):
+    CACHES["reference"] = {
+        "BACKEND": os.environ["REFERENCE_CACHE_BACKEND"],
+        "LOCATION": os.environ.get("REFERENCE_CACHE_LOCATION", "reference_cache"),
+    }
+
+# Sessions are stored in the database. With a shared SESSION_CACHE_BACKEND
+# (Redis, Memcached) the default engine becomes core.sessions, which reads
+# them from the "sessions" cache, writes through to the database and skips
+# saves that would not change anything. It is not the default with the
+# local-memory cache: that is per process, so a logout would only be seen by
+# the worker that served it.
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE",
+    (
+        "core.sessions"
+        if os.environ.get("SESSION_CACHE_BACKEND")
+        else "django.contrib.sessions.backends.db"
+    ),
+)
+SESSION_CACHE_ALIAS = "sessions"
+CACHES["sessions"] = {
+    "BACKEND": os.environ.get(
+        "SESSION_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+    ),
+    "LOCATION": os.environ.get("SESSION_CACHE_LOCATION", "sessions"),
+}
+SESSION_SAVE_EVERY_REQUEST = os.environ.get("SESSION_SAVE_EVERY_REQUEST", "") == "1"
+# Unchanged sessions are written back at most this often (seconds), to keep
+# their expiry sliding when SESSION_SAVE_EVERY_REQUEST is on.
+SESSION_TOUCH_INTERVAL = int(os.environ.get("SESSION_TOUCH_INTERVAL", "300"))
+
+# Finnhub upstream client. One pooled session is shared by the request
+# threads of a worker and its UPSTREAM_FANOUT_WORKERS fan-out threads (batch
+# quotes etc.), so the pool keeps a connection for each of them. Past that,
+# extra connections are opened and dropped after use rather than waited for.
+FINNHUB_API_KEY = os.environ.get(
+    "FINNHUB_API_KEY", "d01tecpr01qt2u30mpkgd01tecpr01qt2u30mpl0"
+)
+FINNHUB_API_URL = os.environ.get("FINNHUB_API_URL", "https://api.finnhub.io/api/v1")
+FINNHUB_CONNECT_TIMEOUT = float(os.environ.get("FINNHUB_CONNECT_TIMEOUT", "3.05"))
+FINNHUB_READ_TIMEOUT = float(os.environ.get("FINNHUB_READ_TIMEOUT", "5"))
+UPSTREAM_FANOUT_WORKERS = int(os.environ.get("UPSTREAM_FANOUT_WORKERS", "8"))
+FINNHUB_POOL_MAXSIZE = int(
+    os.environ.get(
+        "FINNHUB_POOL_MAXSIZE", str(GUNICORN_THREADS + UPSTREAM_FANOUT_WORKERS)
+    )
+)
+# Connections one ASGI worker may hold open to Finnhub for the async views.
+FINNHUB_ASYNC_MAX_CONNECTIONS = int(
+    os.environ.get("FINNHUB_ASYNC_MAX_CONNECTIONS", "100")
+)
+
+# Per-endpoint circuit breakers: after FAILURES consecutive timeouts,
+# connection errors or 5xx answers, calls fail fast for RESET_TIMEOUT seconds
+# before a single probe is let through. While open, quotes fall back to the
+# last known good value, kept for QUOTE_LKG_TTL seconds.
+CIRCUIT_BREAKER_FAILURES = int(os.environ.get("CIRCUIT_BREAKER_FAILURES", "5"))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get("CIRCUIT_BREAKER_RESET_TIMEOUT", "30")
+)
+QUOTE_LKG_TTL = int(os.environ.get("QUOTE_LKG_TTL", str(24 * 3600)))
+
+# Client-side token bucket for the Finnhub quota. FINNHUB_RATE_LIMIT_SHARED
+# keeps the bucket in the default cache so all workers draw from it (needs a
+# shared CACHE_BACKEND). User-facing calls wait up to MAX_WAIT seconds for a
+# token; background refreshes wait longer but leave RESERVE tokens unused.
+FINNHUB_RATE_LIMIT_PER_MINUTE = float(
+    os.environ.get("FINNHUB_RATE_LIMIT_PER_MINUTE", "60")
+)
+FINNHUB_RATE_LIMIT_BURST = int(os.environ.get("FINNHUB_RATE_LIMIT_BURST", "30"))
+FINNHUB_RATE_LIMIT_SHARED = os.environ.get("FINNHUB_RATE_LIMIT_SHARED", "") == "1"
+FINNHUB_RATE_LIMIT_MAX_WAIT = float(os.environ.get("FINNHUB_RATE_LIMIT_MAX_WAIT", "2"))
+FINNHUB_RATE_LIMIT_BACKGROUND_MAX_WAIT = float(
+    os.environ.get("FINNHUB_RATE_LIMIT_BACKGROUND_MAX_WAIT", "30")
+)
+FINNHUB_RATE_LIMIT_RESERVE = int(os.environ.get("FINNHUB_RATE_LIMIT_RESERVE", "5"))
+
+# Seconds a quote is served from cache before going upstream again.
+QUOTE_CACHE_TTL = int(os.environ.get("QUOTE_CACHE_TTL", "5"))
+
+# Background quote warmer (`manage.py prefetch_quotes`, or a thread in each
+# process with QUOTE_PREFETCH_THREAD=1). Every INTERVAL seconds it refreshes
+# the LIMIT most-favorited symbols whose cached quote is within MARGIN
+# seconds of expiring. When gunicorn.conf.py preloads the application in the
+# master (SERVER_PRELOAD), the thread is started in each worker after the
+# fork instead of at start-up.
+QUOTE_PREFETCH_THREAD = os.environ.get("QUOTE_PREFETCH_THREAD", "") == "1"
+SERVER_PRELOAD = os.environ.get("GUNICORN_PRELOAD", "") == "1"
+QUOTE_PREFETCH_LIMIT = int(os.environ.get("QUOTE_PREFETCH_LIMIT", "20"))
+QUOTE_PREFETCH_INTERVAL = float(os.environ.get("QUOTE_PREFETCH_INTERVAL", "1"))
+QUOTE_PREFETCH_MARGIN = float(os.environ.get("QUOTE_PREFETCH_MARGIN", "1.5"))
+
+# Price alert worker (`manage.py run_alert_engine`): checks cached quotes
+# every INTERVAL seconds and reloads active alerts every RELOAD_INTERVAL.
+ALERT_ENGINE_INTERVAL = float(os.environ.get("ALERT_ENGINE_INTERVAL", "1"))
+ALERT_ENGINE_RELOAD_INTERVAL = float(
+    os.environ.get("ALERT_ENGINE_RELOAD_INTERVAL", "30")
+)
+
+# The most tickers one batch quote request may ask for.
+QUOTE_BATCH_MAX_TICKERS = int(os.environ.get("QUOTE_BATCH_MAX_TICKERS", "50"))
+
+# Most symbols one batch favorites request may add or remove.
+FAVORITES_BATCH_MAX = int(os.environ.get("FAVORITES_BATCH_MAX", "500"))
+
+# Live quote streams (/api/favorite-stocks/stream/): seconds between upstream
+# polls per symbol, seconds between keep-alive comments, and how many unsent
+# updates a slow client may have queued.
+QUOTE_STREAM_INTERVAL = float(os.environ.get("QUOTE_STREAM_INTERVAL", "5"))
+QUOTE_STREAM_KEEPALIVE = float(os.environ.get("QUOTE_STREAM_KEEPALIVE", "15"))
+QUOTE_STREAM_QUEUE_SIZE = int(os.environ.get("QUOTE_STREAM_QUEUE_SIZE", "100"))
+
+# Company profiles and symbol lookups change rarely. Past their TTL they are
+# still served for REFERENCE_CACHE_STALE_TTL seconds while a refresh runs.
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", str(24 * 3600)))
+LOOKUP_CACHE_TTL = int(os.environ.get("LOOKUP_CACHE_TTL", str(6 * 3600)))
+REFERENCE_CACHE_STALE_TTL = int(
+    os.environ.get("REFERENCE_CACHE_STALE_TTL", str(7 * 24 * 3600))
+)
+REFERENCE_CACHE_MAXSIZE = int(os.environ.get("REFERENCE_CACHE_MAXSIZE", "2048"))
+# Stale entries are refreshed by REFERENCE_REFRESH_WORKERS threads per
+# worker. With REFERENCE_REFRESH_MAX_PENDING refreshes already queued or
+# running, further stale entries are served without scheduling another;
+# a later request for them tries again.
+REFERENCE_REFRESH_WORKERS = int(os.environ.get("REFERENCE_REFRESH_WORKERS", "2"))
+REFERENCE_REFRESH_MAX_PENDING = int(
+    os.environ.get("REFERENCE_REFRESH_MAX_PENDING", "32")
+)
+
+# Results returned by the local symbol search (see `manage.py load_symbols`).
+SYMBOL_SEARCH_LIMIT = int(os.environ.get("SYMBOL_SEARCH_LIMIT", "20"))
+
+# Seconds the serialized /api/user/ payload is cached. Edits invalidate it
+# right away; the TTL only bounds how long unused payloads linger. With the
+# per-process local-memory cache other workers don't see the invalidation,
+# so payloads are then kept for USER_CACHE_LOCAL_TTL seconds instead.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "3600"))
+USER_CACHE_LOCAL_TTL = int(os.environ.get("USER_CACHE_LOCAL_TTL", "5"))
+
+# Historical candles are stored locally as 1-minute bars. Missing spans are
+# fetched from Finnhub in chunks of CANDLE_BACKFILL_CHUNK_DAYS; a single
+# request may cover at most CANDLE_MAX_RANGE_DAYS, less at the finer
+# resolutions (core.candles.MAX_RANGE_DAYS). Bars may be published a
+# little late, so the last CANDLE_SETTLE_MINUTES are not marked as done; they
+# are fetched again at most every CANDLE_TAIL_TTL seconds per symbol.
+CANDLE_BACKFILL_CHUNK_DAYS = int(os.environ.get("CANDLE_BACKFILL_CHUNK_DAYS", "30"))
+CANDLE_MAX_RANGE_DAYS = int(os.environ.get("CANDLE_MAX_RANGE_DAYS", "366"))
+CANDLE_SETTLE_MINUTES = int(os.environ.get("CANDLE_SETTLE_MINUTES", "15"))
+CANDLE_TAIL_TTL = int(os.environ.get("CANDLE_TAIL_TTL", "60"))
+
+# Favorites analytics are computed from daily closes and cached per
+# (symbol set, window) for ANALYTICS_CACHE_TTL seconds, or only
+# ANALYTICS_PARTIAL_CACHE_TTL when the upstream quota ran out before every
+# symbol was fetched. A symbol's daily closes are stored and fetched again,
+# one upstream call, once older than ANALYTICS_SERIES_TTL seconds, by
+# ANALYTICS_LOAD_WORKERS threads per worker.
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL", "900"))
+ANALYTICS_PARTIAL_CACHE_TTL = int(os.environ.get("ANALYTICS_PARTIAL_CACHE_TTL", "60"))
+ANALYTICS_SERIES_TTL = int(os.environ.get("ANALYTICS_SERIES_TTL", "3600"))
+ANALYTICS_LOAD_WORKERS = int(os.environ.get("ANALYTICS_LOAD_WORKERS", "2"))
+ANALYTICS_DEFAULT_WINDOW = int(os.environ.get("ANALYTICS_DEFAULT_WINDOW", "90"))
@@ -2,11 +2,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.metrics_views import MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("core.urls")),
     path("auth/", include("social_django.urls", namespace="social")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
 
 if settings.DEBUG:
@@ -1,3 +1,82 @@
-from django.contrib import admin
+import json
 
-# Register your models here.
+from django.contrib import admin, messages
+from django.http import HttpResponse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Read-only browser for captures made by ProfilingMiddleware."""
+
+    list_display = (
+        "created_on",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_ms",
+        "trigger",
+        "user",
+    )
+    list_filter = ("trigger", "method", "status_code", "view_name")
+    search_fields = ("path", "view_name")
+    date_hierarchy = "created_on"
+    list_select_related = ("user",)
+    fields = (
+        "created_on",
+        "user",
+        "trigger",
+        "method",
+        "path",
+        "view_name",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_ms",
+        "upstream_calls",
+        "sql_log",
+        "profile_report",
+    )
+    readonly_fields = fields
+    actions = ["download_stats"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Upstream calls")
+    def upstream_calls(self, obj):
+        return format_html("<pre>{}</pre>", json.dumps(obj.upstream, indent=2))
+
+    @admin.display(description="SQL")
+    def sql_log(self, obj):
+        lines = [f"{q['ms']:9.3f} ms  {q['sql']}" for q in obj.queries]
+        if obj.query_count > len(obj.queries):
+            lines.append(f"... {obj.query_count - len(obj.queries)} more")
+        return format_html("<pre>{}</pre>", "\n".join(lines))
+
+    @admin.display(description="Profile")
+    def profile_report(self, obj):
+        return format_html("<pre>{}</pre>", obj.profile)
+
+    @admin.action(description="Download cProfile stats (.prof)")
+    def download_stats(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(
+                request, "Select exactly one profile to download.", messages.WARNING
+            )
+            return None
+        profile = queryset.get()
+        response = HttpResponse(
+            bytes(profile.stats), content_type="application/octet-stream"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="request-{profile.pk}.prof"'
+        )
+        return response
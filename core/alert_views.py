@@ -0,0 +1,23 @@
+from rest_framework.generics import ListCreateAPIView, DestroyAPIView
+from rest_framework import permissions
+from .models import PriceAlert
+from .serializers import PriceAlertSerializer
+
+
+class PriceAlertListCreateView(ListCreateAPIView):
+    """The user's price alerts; new ones are picked up by the alert engine
+    on its next reload (ALERT_ENGINE_RELOAD_INTERVAL)."""
+
+    serializer_class = PriceAlertSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return PriceAlert.objects.filter(user=self.request.user).order_by("-created_on")
+
+
+class PriceAlertDeleteView(DestroyAPIView):
+    serializer_class = PriceAlertSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return PriceAlert.objects.filter(user=self.request.user)
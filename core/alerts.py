@@ -0,0 +1,172 @@
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .cache import QUOTE_KEY, refresh_quote
+from .models import PriceAlert
+from .throttle import UpstreamThrottled, background_priority
+
+logger = logging.getLogger(__name__)
+
+# Sent with ``alerts`` (ids), ``symbol`` and ``price`` once alerts have been
+# marked triggered; connect a receiver to deliver the notifications.
+alert_triggered = Signal()
+
+
+class AlertEngine:
+    """In-memory index of active price alerts.
+
+    Each symbol has two lists of ``(threshold, alert_id)`` kept sorted.
+    "Above" alerts fire when the price reaches their threshold, so the ones
+    a quote triggers are a prefix of their list; "below" alerts are a
+    suffix. Checking a quote is one bisect per list and no database access.
+    Triggered alerts are one-shot and leave the index.
+    """
+
+    def __init__(self):
+        self._above = {}
+        self._below = {}
+
+    def load(self, alerts):
+        """Replace the index with ``(id, symbol, direction, threshold)`` rows."""
+        index = {
+            PriceAlert.ABOVE: defaultdict(list),
+            PriceAlert.BELOW: defaultdict(list),
+        }
+        for alert_id, symbol, direction, threshold in alerts:
+            index[direction][symbol.upper()].append((float(threshold), alert_id))
+        for lists in index.values():
+            for thresholds in lists.values():
+                thresholds.sort()
+        self._above = dict(index[PriceAlert.ABOVE])
+        self._below = dict(index[PriceAlert.BELOW])
+
+    def symbols(self):
+        return {
+            s for lists in (self._above, self._below) for s, t in lists.items() if t
+        }
+
+    def __len__(self):
+        return sum(
+            len(t) for lists in (self._above, self._below) for t in lists.values()
+        )
+
+    def evaluate(self, symbol, price):
+        """Return the ids of alerts ``price`` triggers, dropping them from the index."""
+        fired = []
+        above = self._above.get(symbol)
+        if above:
+            i = bisect_right(above, (price, math.inf))
+            fired += [alert_id for _, alert_id in above[:i]]
+            del above[:i]
+        below = self._below.get(symbol)
+        if below:
+            i = bisect_left(below, (price, -math.inf))
+            fired += [alert_id for _, alert_id in below[i:]]
+            del below[i:]
+        return fired
+
+
+def load_alerts(engine):
+    engine.load(
+        PriceAlert.objects.filter(is_active=True).values_list(
+            "id", "symbol", "direction", "threshold"
+        )
+    )
+
+
+def fire_alerts(alert_ids, symbol, price):
+    """Mark alerts triggered; alerts deleted or fired meanwhile are skipped."""
+    fired = list(
+        PriceAlert.objects.filter(id__in=alert_ids, is_active=True).values_list(
+            "id", flat=True
+        )
+    )
+    PriceAlert.objects.filter(id__in=fired).update(
+        is_active=False, triggered_at=timezone.now(), triggered_price=price
+    )
+    if fired:
+        logger.info(f"{len(fired)} alerts triggered for {symbol} at {price}")
+        alert_triggered.send(
+            sender=PriceAlert, alerts=fired, symbol=symbol, price=price
+        )
+    return len(fired)
+
+
+def check_quotes(engine, seen):
+    """Evaluate every quote that changed since the last round.
+
+    Quotes are read from the default cache. When that is shared
+    (CACHE_BACKEND), a quote fetched by any process (a user request, the
+    prefetcher) is seen; with the local-memory default only this process'
+    own fetches are. Symbols whose cached quote is about to expire are
+    refreshed at background priority. ``seen`` maps a
+    symbol to the fetch time of the last quote evaluated for it. Returns
+    the number of alerts triggered.
+    """
+    symbols = sorted(engine.symbols())
+    entries = cache.get_many([QUOTE_KEY.format(s) for s in symbols])
+    can_refresh = True
+    triggered = 0
+    with background_priority():
+        for symbol in symbols:
+            entry = entries.get(QUOTE_KEY.format(symbol))
+            expiring = (
+                entry is None
+                or time.time() - entry["fetched_at"]
+                >= settings.QUOTE_CACHE_TTL - settings.QUOTE_PREFETCH_MARGIN
+            )
+            if can_refresh and expiring:
+                try:
+                    data = refresh_quote(symbol)
+                    entry = {"data": data, "fetched_at": time.time()}
+                except UpstreamThrottled:
+                    can_refresh = False
+                except Exception as e:
+                    logger.warning(f"Quote refresh for {symbol} failed: {e}")
+            if entry is None or entry["fetched_at"] <= seen.get(symbol, 0):
+                continue
+            seen[symbol] = entry["fetched_at"]
+            # Finnhub answers unknown symbols with a zero price.
+            price = entry["data"].get("c")
+            if not price:
+                continue
+            alert_ids = engine.evaluate(symbol, price)
+            if alert_ids:
+                triggered += fire_alerts(alert_ids, symbol, price)
+    return triggered
+
+
+def run_alert_engine(interval=None, reload_interval=None, stop=None):
+    """Check quotes against alerts every ``interval`` seconds until ``stop``.
+
+    The index is rebuilt from the database every ``reload_interval`` seconds
+    to pick up alerts created or deleted in the meantime.
+    """
+    stop = stop or threading.Event()
+    interval = interval or settings.ALERT_ENGINE_INTERVAL
+    reload_interval = reload_interval or settings.ALERT_ENGINE_RELOAD_INTERVAL
+    engine = AlertEngine()
+    seen = {}
+    loaded_at = None
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            if loaded_at is None or started - loaded_at >= reload_interval:
+                load_alerts(engine)
+                loaded_at = started
+            check_quotes(engine, seen)
+        except Exception as e:
+            logger.error(f"Alert engine round failed: {e}")
+        finally:
+            close_old_connections()
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import fan_out, normalize_ticker
+from .candles import from_epoch
+from .models import DailyClose, DailySeries
+from .throttle import UpstreamThrottled
+from .utils import call_finnhub
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_KEY = "analytics:{}:{}"
+TRADING_DAYS = 252
+
+_load_pool = None
+_load_lock = threading.Lock()
+
+
+def get_load_pool():
+    """Return the worker's pool for fetching daily closes for analytics.
+
+    Kept apart from the shared fan-out pool, so a large portfolio can't hold
+    up batch quotes for everyone else.
+    """
+    global _load_pool
+    if _load_pool is None:
+        with _load_lock:
+            if _load_pool is None:
+                _load_pool = ThreadPoolExecutor(
+                    max_workers=settings.ANALYTICS_LOAD_WORKERS,
+                    thread_name_prefix="analytics-load",
+                )
+    return _load_pool
+
+
+def fetch_daily_closes(symbol):
+    """``{day: close}`` of ``symbol`` over CANDLE_MAX_RANGE_DAYS, in one call."""
+    end = int(time.time())
+    start = end - settings.CANDLE_MAX_RANGE_DAYS * 86400
+    data = call_finnhub("stock_candles", symbol, "D", start, end)
+    if data.get("s") != "ok":
+        return {}
+    return {from_epoch(t).date(): c for t, c in zip(data["t"], data["c"])}
+
+
+def store_daily_closes(fetched):
+    """Save ``{symbol: {day: close}}`` and mark those symbols as fetched now."""
+    DailyClose.objects.bulk_create(
+        [
+            DailyClose(symbol=symbol, day=day, close=close)
+            for symbol, closes in fetched.items()
+            for day, close in closes.items()
+        ],
+        batch_size=2000,
+        update_conflicts=True,
+        unique_fields=["symbol", "day"],
+        update_fields=["close"],
+    )
+    now = timezone.now()
+    DailySeries.objects.bulk_create(
+        [DailySeries(symbol=symbol, fetched_at=now) for symbol in fetched],
+        update_conflicts=True,
+        unique_fields=["symbol"],
+        update_fields=["fetched_at"],
+    )
+
+
+def daily_closes(symbols, start, end):
+    """Load the daily closing prices of ``symbols`` in one query.
+
+    Returns ``(days, prices)`` where ``prices`` has one row per day and one
+    column per symbol; days a symbol has no close for are NaN.
+    """
+    rows = list(
+        DailyClose.objects.filter(
+            symbol__in=symbols, day__gte=start.date(), day__lte=end.date()
+        ).values_list("day", "symbol", "close")
+    )
+    days = sorted({row[0] for row in rows})
+    day_index = {d: i for i, d in enumerate(days)}
+    column = {s: i for i, s in enumerate(symbols)}
+    prices = np.full((len(days), len(symbols)), np.nan)
+    if rows:
+        d, s, close = zip(*rows)
+        prices[[day_index[x] for x in d], [column[x] for x in s]] = close
+    return days, prices
+
+
+def _forward_fill(prices):
+    """Carry the last known price over days without one (e.g. halts)."""
+    index = np.where(np.isnan(prices), 0, np.arange(len(prices))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    return prices[index, np.arange(prices.shape[1])]
+
+
+def compute_metrics(prices):
+    """Vectorized return, volatility, drawdown and correlation statistics.
+
+    ``prices`` is a days x symbols array of closes (NaN where missing). The
+    portfolio is the equally weighted, daily rebalanced mix of all symbols.
+    """
+    prices = _forward_fill(prices)
+    # Symbols without data give all-NaN columns; their statistics are NaN.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        returns = prices[1:] / prices[:-1] - 1
+        first = np.argmax(~np.isnan(prices), axis=0)
+        first_prices = prices[first, np.arange(prices.shape[1])]
+        total_return = prices[-1] / first_prices - 1
+        volatility = np.nanstd(returns, axis=0, ddof=1) * math.sqrt(TRADING_DAYS)
+        drawdown = np.nanmin(prices / np.fmax.accumulate(prices, axis=0) - 1, axis=0)
+
+        portfolio_returns = np.nanmean(returns, axis=1)
+        portfolio_returns = portfolio_returns[~np.isnan(portfolio_returns)]
+        growth = np.cumprod(1 + portfolio_returns)
+        # The running peak starts from the initial value of 1, so a fall on
+        # the first day counts too.
+        peaks = np.maximum.accumulate(np.concatenate(([1.0], growth)))[1:]
+        portfolio = {
+            "return": growth[-1] - 1 if len(growth) else np.nan,
+            "volatility": np.std(portfolio_returns, ddof=1) * math.sqrt(TRADING_DAYS),
+            "max_drawdown": (
+                min(0.0, np.min(growth / peaks - 1)) if len(growth) else np.nan
+            ),
+        }
+
+        # Missing returns are zeroed after demeaning so they add nothing to
+        # the pairwise sums.
+        valid = ~np.isnan(returns)
+        centered = np.where(valid, returns - np.nanmean(returns, axis=0), 0.0)
+        covariance = centered.T @ centered
+        scale = np.sqrt(np.diag(covariance))
+        correlation = covariance / np.outer(scale, scale)
+    return {
+        "return": total_return,
+        "volatility": volatility,
+        "max_drawdown": drawdown,
+        "portfolio": portfolio,
+        "correlation": correlation,
+    }
+
+
+def _clean(value):
+    """NaN is not valid JSON; report undefined statistics as null."""
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, 6)
+
+
+def analytics_key(symbols, window):
+    """Cache key of the analytics for a sorted list of normalized symbols."""
+    digest = hashlib.sha1(",".join(symbols).encode()).hexdigest()
+    return ANALYTICS_KEY.format(window, digest)
+
+
+def portfolio_analytics(symbols, window):
+    """Analytics over the last ``window`` days for a set of symbols.
+
+    Daily closes are stored locally and fetched again, one upstream call per
+    symbol on a small dedicated pool, once older than ANALYTICS_SERIES_TTL.
+    When the upstream quota runs out the symbols not fetched yet are reported
+    as unavailable, rather than waited for, and their stored closes are used.
+    Results are cached per (symbol set, window) for ANALYTICS_CACHE_TTL
+    seconds, or ANALYTICS_PARTIAL_CACHE_TTL with symbols unavailable.
+    """
+    symbols = sorted({normalize_ticker(s) for s in symbols})
+    key = analytics_key(symbols, window)
+    result = cache.get(key)
+    if result is not None:
+        return result, "hit"
+
+    end = timezone.now()
+    start = end - timedelta(days=window)
+    fresh = set(
+        DailySeries.objects.filter(
+            symbol__in=symbols,
+            fetched_at__gte=end - timedelta(seconds=settings.ANALYTICS_SERIES_TTL),
+        ).values_list("symbol", flat=True)
+    )
+    throttled = []
+
+    def fetch(symbol):
+        if throttled:
+            raise throttled[0]
+        try:
+            return fetch_daily_closes(symbol)
+        except UpstreamThrottled as e:
+            throttled.append(e)
+            raise
+
+    fetched, errors = fan_out(
+        fetch, [s for s in symbols if s not in fresh], pool=get_load_pool()
+    )
+    store_daily_closes(fetched)
+    unavailable = [symbol for symbol in symbols if symbol in errors]
+    for symbol in unavailable:
+        # Out of upstream budget is expected; a later request loads the rest.
+        if not isinstance(errors[symbol], UpstreamThrottled):
+            logger.error(
+                f"Error fetching candles for ticker {symbol}: {errors[symbol]}"
+            )
+
+    days, prices = daily_closes(symbols, start, end)
+    result = {
+        "window": window,
+        "symbols": symbols,
+        "days": len(days),
+        "unavailable": unavailable,
+    }
+    if len(days) < 2:
+        result.update(metrics={}, portfolio=None, correlation=[])
+    else:
+        stats = compute_metrics(prices)
+        result["metrics"] = {
+            symbol: {
+                name: _clean(stats[name][i])
+                for name in ("return", "volatility", "max_drawdown")
+            }
+            for i, symbol in enumerate(symbols)
+        }
+        result["portfolio"] = {
+            name: _clean(value) for name, value in stats["portfolio"].items()
+        }
+        result["correlation"] = [
+            [_clean(value) for value in row] for row in stats["correlation"]
+        ]
+    if unavailable:
+        cache.set(key, result, settings.ANALYTICS_PARTIAL_CACHE_TTL)
+    else:
+        cache.set(key, result, settings.ANALYTICS_CACHE_TTL)
+    return result, "miss"
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Preloaded in the gunicorn master: post_fork starts it per worker.
+        if settings.QUOTE_PREFETCH_THREAD and not settings.SERVER_PRELOAD:
+            from .prefetch import start_prefetch_thread
+
+            start_prefetch_thread()
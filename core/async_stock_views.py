@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import ACCESS, decode_token, get_bearer_token, user_from_claims
+from .cache import aget_cached_quote, lookup_cache, normalize_ticker, profile_cache
+from .models import FavoriteStock, StockSymbol
+from .stock_views import STALE_WARNING, upstream_error
+from .streaming import get_quote_hub
+from .symbol_index import as_lookup_response, search_symbols
+
+logger = logging.getLogger(__name__)
+
+# Async twins of the views in stock_views.py. Served by an ASGI worker they
+# never block on the upstream, so one worker keeps many calls in flight.
+
+
+def _error(message):
+    return JsonResponse({"error": message}, status=400)
+
+
+class AsyncStockView(View):
+    fetch = None
+
+    async def get(self, request, *args, **kwargs):
+        ticker = request.GET.get("ticker")
+        if not ticker:
+            return _error("Ticker is required")
+        try:
+            data, outcome = await self.fetch(ticker)
+        except Exception as e:
+            message, status, retry_after = upstream_error(e)
+            if not retry_after:
+                logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+            response = JsonResponse({"error": message}, status=status)
+            if retry_after:
+                response["Retry-After"] = str(retry_after)
+            return response
+        response = JsonResponse(data, safe=False)
+        response["X-Cache"] = outcome
+        if outcome == "stale":
+            response["Warning"] = STALE_WARNING
+        return response
+
+
+class AsyncStockDataView(AsyncStockView):
+    fetch = staticmethod(lookup_cache.aget)
+
+    async def get(self, request, *args, **kwargs):
+        ticker = request.GET.get("ticker")
+        if ticker:
+            symbols = await sync_to_async(search_symbols)(ticker)
+            if symbols or await StockSymbol.objects.aexists():
+                response = JsonResponse(as_lookup_response(symbols))
+                response["X-Cache"] = "index"
+                return response
+        return await super().get(request, *args, **kwargs)
+
+
+class AsyncStockProfileView(AsyncStockView):
+    fetch = staticmethod(profile_cache.aget)
+
+
+class AsyncStockPriceView(AsyncStockView):
+    fetch = staticmethod(aget_cached_quote)
+
+    async def get(self, request, *args, **kwargs):
+        tickers = request.GET.get("tickers")
+        if tickers is None:
+            return await super().get(request, *args, **kwargs)
+
+        tickers = list(
+            dict.fromkeys(normalize_ticker(t) for t in tickers.split(",") if t.strip())
+        )
+        if not tickers:
+            return _error("Ticker is required")
+        if len(tickers) > settings.QUOTE_BATCH_MAX_TICKERS:
+            return _error(
+                f"At most {settings.QUOTE_BATCH_MAX_TICKERS} tickers per request"
+            )
+        results = await asyncio.gather(
+            *(aget_cached_quote(t) for t in tickers), return_exceptions=True
+        )
+        quotes, errors = {}, {}
+        for ticker, result in zip(tickers, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching stock data for ticker {ticker}: {result}")
+                errors[ticker] = upstream_error(result)[0]
+            else:
+                quotes[ticker] = result[0]
+        return JsonResponse({"quotes": quotes, "errors": errors})
+
+
+class FavoriteQuoteStreamView(View):
+    """Server-Sent Events stream of quote updates for the user's favorites.
+
+    Needs an ASGI server: WSGI collects an async stream into a list before
+    sending it, so an endless one would never be sent and would hold the
+    worker thread forever; such requests get a 501. Accepts a bearer access
+    token as well as the session.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"detail": "Streaming needs the ASGI server."}, status=501
+            )
+        token = get_bearer_token(request)
+        if token is not None:
+            try:
+                user = user_from_claims(decode_token(token, ACCESS))
+            except AuthenticationFailed as e:
+                return JsonResponse({"detail": str(e.detail)}, status=403)
+        else:
+            # request.auser() needs every auth backend to be async-aware,
+            # which the social-auth backends are not.
+            user = await sync_to_async(get_user)(request)
+        if not user.is_authenticated:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=403,
+            )
+        symbols = [
+            symbol
+            async for symbol in FavoriteStock.objects.filter(user=user).values_list(
+                "stock_symbol", flat=True
+            )
+        ]
+        response = StreamingHttpResponse(
+            self.events(symbols), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def events(self, symbols):
+        hub = get_quote_hub()
+        queue = hub.subscribe(symbols)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    symbol, quote = await asyncio.wait_for(
+                        queue.get(), settings.QUOTE_STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                payload = json.dumps({"symbol": symbol, "quote": quote})
+                yield f"event: quote\ndata: {payload}\n\n"
+        finally:
+            hub.unsubscribe(queue)
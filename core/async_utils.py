@@ -0,0 +1,82 @@
+import asyncio
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .breaker import get_breaker
+from .metrics import observe_upstream
+from .throttle import UpstreamThrottled, upstream_bucket
+
+# httpx.AsyncClient is bound to the event loop it first ran on. Under an
+# ASGI server there is one loop per worker; under WSGI, Django runs each
+# async view in a fresh loop, so clients are kept per loop.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the pooled async Finnhub client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=settings.FINNHUB_API_URL,
+            headers={"Accept": "application/json", "User-Agent": "finnhub/python"},
+            params={"token": settings.FINNHUB_API_KEY},
+            timeout=httpx.Timeout(
+                settings.FINNHUB_READ_TIMEOUT,
+                connect=settings.FINNHUB_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.FINNHUB_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.FINNHUB_ASYNC_MAX_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def _get(method, path, **params):
+    # Breakers are shared with the sync helpers, keyed by finnhub.Client
+    # method name.
+    breaker = get_breaker(method)
+    breaker.before_call()
+    try:
+        await upstream_bucket.aacquire()
+    except BaseException:
+        breaker.abort()
+        raise
+    start = time.perf_counter()
+    try:
+        response = await get_async_client().get(path, params=params)
+        if response.status_code == 429:
+            breaker.record(None)
+            raise await upstream_bucket.arejected()
+        response.raise_for_status()
+    except UpstreamThrottled as e:
+        observe_upstream(method, time.perf_counter() - start, e)
+        raise
+    except Exception as e:
+        observe_upstream(method, time.perf_counter() - start, e)
+        breaker.record(e)
+        raise
+    except BaseException:
+        # Cancelled, e.g. the client went away; don't hold on to a probe.
+        breaker.abort()
+        raise
+    observe_upstream(method, time.perf_counter() - start)
+    breaker.record(None)
+    return response.json()
+
+
+async def aget_stock_data(ticker):
+    return await _get("symbol_lookup", "search", q=ticker)
+
+
+async def aget_stock_price_data(ticker):
+    return await _get("quote", "quote", symbol=ticker)
+
+
+async def aget_stock_profile(ticker):
+    return await _get("company_profile2", "stock/profile2", symbol=ticker)
@@ -0,0 +1,163 @@
+import threading
+import time
+import uuid
+
+import jwt
+from django.conf import settings
+from rest_framework import authentication, exceptions
+
+from .models import TokenUser, User
+
+ACCESS = "access"
+REFRESH = "refresh"
+# User fields copied into access tokens so requests need no user query.
+USER_CLAIMS = [
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "is_staff",
+    "is_superuser",
+]
+
+
+class RevocationList:
+    """In-process set of revoked token ids, kept until the tokens expire.
+
+    Each worker has its own list, so a revoked access token may still work
+    on other workers until it expires (JWT_ACCESS_TTL); refresh tokens are
+    also checked against the user's password, see ``refresh_tokens``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            now = time.time()
+            self._revoked = {k: v for k, v in self._revoked.items() if v > now}
+            self._revoked[jti] = exp
+
+    def is_revoked(self, jti):
+        return jti in self._revoked
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+
+
+revoked_tokens = RevocationList()
+
+
+def _encode(claims, token_type, ttl):
+    now = int(time.time())
+    claims = {
+        **claims,
+        "type": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + ttl,
+    }
+    return jwt.encode(claims, settings.JWT_SIGNING_KEY, settings.JWT_ALGORITHM)
+
+
+def issue_tokens(user):
+    """Return a fresh ``{"access": ..., "refresh": ...}`` pair for ``user``."""
+    access = {"sub": str(user.pk), **{f: getattr(user, f) for f in USER_CLAIMS}}
+    # A password change alters the session hash, which voids refresh tokens.
+    refresh = {"sub": str(user.pk), "pwd": user.get_session_auth_hash()[:16]}
+    return {
+        "access": _encode(access, ACCESS, settings.JWT_ACCESS_TTL),
+        "refresh": _encode(refresh, REFRESH, settings.JWT_REFRESH_TTL),
+    }
+
+
+def decode_token(token, token_type):
+    """Verify signature, expiry, type and revocation; return the claims."""
+    try:
+        claims = jwt.decode(
+            token,
+            settings.JWT_SIGNING_KEY,
+            algorithms=[settings.JWT_ALGORITHM],
+            options={"require": ["exp", "sub", "jti", "type"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed("Token has expired")
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed("Invalid token")
+    if claims["type"] != token_type:
+        raise exceptions.AuthenticationFailed("Invalid token")
+    if revoked_tokens.is_revoked(claims["jti"]):
+        raise exceptions.AuthenticationFailed("Token has been revoked")
+    return claims
+
+
+def revoke_token(token):
+    """Revoke a token we issued; invalid or expired tokens are ignored."""
+    try:
+        claims = jwt.decode(
+            token, settings.JWT_SIGNING_KEY, algorithms=[settings.JWT_ALGORITHM]
+        )
+    except jwt.InvalidTokenError:
+        return
+    revoked_tokens.revoke(claims["jti"], claims["exp"])
+
+
+def refresh_tokens(token):
+    """Exchange a refresh token for a new pair, revoking the old one."""
+    claims = decode_token(token, REFRESH)
+    user = User.objects.filter(pk=claims["sub"], is_active=True).first()
+    if user is None or user.get_session_auth_hash()[:16] != claims.get("pwd"):
+        raise exceptions.AuthenticationFailed("Invalid token")
+    revoked_tokens.revoke(claims["jti"], claims["exp"])
+    return issue_tokens(user)
+
+
+def get_bearer_token(request):
+    header = request.META.get("HTTP_AUTHORIZATION", "").split()
+    if len(header) == 2 and header[0].lower() == "bearer":
+        return header[1]
+    return None
+
+
+def user_from_claims(claims):
+    user = TokenUser(pk=int(claims["sub"]), is_active=True)
+    for field in USER_CLAIMS:
+        if field in claims:
+            setattr(user, field, claims[field])
+    user._state.adding = False
+    user._state.db = "default"
+    return user
+
+
+def is_staff_request(request):
+    """Whether a Django request comes from staff, before any view has run.
+
+    Checks the bearer access token's claims, or else the session user set by
+    AuthenticationMiddleware.
+    """
+    token = get_bearer_token(request)
+    if token is None:
+        user = request.user
+    else:
+        try:
+            user = user_from_claims(decode_token(token, ACCESS))
+        except exceptions.AuthenticationFailed:
+            return False
+    return user.is_authenticated and user.is_staff
+
+
+class JWTAuthentication(authentication.BaseAuthentication):
+    """``Authorization: Bearer <access token>``, checked without a DB query.
+
+    No ``authenticate_header``: unauthenticated requests keep getting 403,
+    as with session authentication.
+    """
+
+    def authenticate(self, request):
+        token = get_bearer_token(request)
+        if token is None:
+            return None
+        claims = decode_token(token, ACCESS)
+        return user_from_claims(claims), claims
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import finnhub
+import httpx
+import requests
+from django.conf import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """The upstream endpoint is failing; calls are short-circuited."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(e):
+    """Whether an exception means the upstream is unhealthy.
+
+    Timeouts, connection errors and 5xx answers count; 4xx answers (bad
+    symbol, rate limited) say nothing about upstream health.
+    """
+    if isinstance(e, finnhub.FinnhubAPIException):
+        return e.status_code >= 500
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(
+        e,
+        (
+            finnhub.FinnhubRequestException,
+            requests.RequestException,
+            httpx.TransportError,
+        ),
+    )
+
+
+class CircuitBreaker:
+    """Per-process circuit breaker for one upstream endpoint.
+
+    After CIRCUIT_BREAKER_FAILURES consecutive failures the circuit opens and
+    calls fail immediately with CircuitOpen. Once
+    CIRCUIT_BREAKER_RESET_TIMEOUT seconds have passed a single probe call is
+    let through (half-open); its outcome closes or re-opens the circuit. A
+    probe that never reports back is replaced by a new one after another
+    CIRCUIT_BREAKER_RESET_TIMEOUT.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = (
+                self.opened_at
+                + settings.CIRCUIT_BREAKER_RESET_TIMEOUT
+                - time.monotonic()
+            )
+            if remaining <= 0:
+                self.state = HALF_OPEN
+                # Time the probe out like an open circuit.
+                self.opened_at = time.monotonic()
+                return
+            raise CircuitOpen(self.name, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (
+                self.state == HALF_OPEN
+                or self.failures >= settings.CIRCUIT_BREAKER_FAILURES
+            ):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def record(self, error):
+        """Record the outcome of a call that was let through."""
+        if error is None:
+            self.record_success()
+        elif is_upstream_failure(error):
+            self.record_failure()
+        elif self.state == HALF_OPEN:
+            # The probe got a non-failure error (e.g. a 404): the upstream
+            # answered, so it is healthy again.
+            self.record_success()
+
+    def abort(self):
+        """The call let through never finished (e.g. throttled, cancelled)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+    def reset(self):
+        self.record_success()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+def reset_breakers():
+    with _breakers_lock:
+        for breaker in _breakers.values():
+            breaker.reset()
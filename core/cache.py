@@ -0,0 +1,471 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+from .breaker import CircuitOpen
+from .async_utils import aget_stock_data, aget_stock_price_data, aget_stock_profile
+from .stats import Counters
+from .throttle import background_priority
+from .utils import get_stock_data, get_stock_price_data, get_stock_profile
+
+logger = logging.getLogger(__name__)
+
+QUOTE_KEY = "quote:{}"
+# Last-known-good quotes, kept long after QUOTE_KEY expires and served
+# (marked stale) while the upstream circuit is open.
+QUOTE_LKG_KEY = "quote:lkg:{}"
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into a single call.
+
+    The first caller runs ``fn``; callers arriving while it is in flight
+    wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return ``(result, shared)``; ``shared`` is True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; calls are only shared within one loop."""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn):
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: make the call ourselves.
+                return await self.do(key, fn)
+
+        future = calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a flight without waiters does not warn.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del calls[key]
+            if not future.done():
+                # Cancelled (or another BaseException): release the waiters.
+                future.cancel()
+        return result, False
+
+
+quote_stats = Counters("hit", "miss", "coalesced", "stale")
+_quote_flight = SingleFlight()
+_aquote_flight = AsyncSingleFlight()
+
+
+def is_process_local(alias="default"):
+    """Whether entries of a cache are only seen by the process storing them."""
+    return isinstance(caches[alias], LocMemCache)
+
+
+def normalize_ticker(ticker):
+    return ticker.strip().upper()
+
+
+def get_cached_quote(ticker):
+    """Return ``(quote, outcome)`` for a ticker, going upstream on a miss.
+
+    ``outcome`` is ``"hit"``, ``"miss"``, ``"coalesced"`` (the quote came
+    from another thread's in-flight upstream call) or ``"stale"`` (the
+    upstream circuit is open and the last known good quote was used).
+    """
+    ticker = normalize_ticker(ticker)
+    entry = cache.get(QUOTE_KEY.format(ticker))
+    if entry is not None:
+        quote_stats.incr("hit")
+        return entry["data"], "hit"
+
+    try:
+        data, shared = _quote_flight.do(
+            QUOTE_KEY.format(ticker), lambda: _fetch_quote(ticker, recheck=True)
+        )
+    except CircuitOpen:
+        entry = cache.get(QUOTE_LKG_KEY.format(ticker))
+        if entry is None:
+            raise
+        quote_stats.incr("stale")
+        return entry["data"], "stale"
+    outcome = "coalesced" if shared else "miss"
+    quote_stats.incr(outcome)
+    return data, outcome
+
+
+def refresh_quote(ticker):
+    """Fetch a quote upstream and store it, even if a cached one exists."""
+    ticker = normalize_ticker(ticker)
+    data, _ = _quote_flight.do(
+        QUOTE_KEY.format(ticker), lambda: _fetch_quote(ticker, recheck=False)
+    )
+    return data
+
+
+def quote_age(ticker):
+    """Seconds since the cached quote was fetched, or None if not cached."""
+    entry = cache.get(QUOTE_KEY.format(normalize_ticker(ticker)))
+    if entry is None:
+        return None
+    return time.time() - entry["fetched_at"]
+
+
+def _fetch_quote(ticker, recheck):
+    key = QUOTE_KEY.format(ticker)
+    if recheck:
+        # A previous flight may have filled the cache after our lookup.
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["data"]
+    data = get_stock_price_data(ticker)
+    _store_quote(ticker, data)
+    return data
+
+
+def _store_quote(ticker, data):
+    entry = {"data": data, "fetched_at": time.time()}
+    cache.set(QUOTE_KEY.format(ticker), entry, settings.QUOTE_CACHE_TTL)
+    cache.set(QUOTE_LKG_KEY.format(ticker), entry, settings.QUOTE_LKG_TTL)
+
+
+async def aget_cached_quote(ticker):
+    """Async counterpart of ``get_cached_quote`` using the same cache keys."""
+    ticker = normalize_ticker(ticker)
+    key = QUOTE_KEY.format(ticker)
+    entry = await cache.aget(key)
+    if entry is not None:
+        quote_stats.incr("hit")
+        return entry["data"], "hit"
+
+    async def fetch():
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry["data"]
+        data = await aget_stock_price_data(ticker)
+        await sync_to_async(_store_quote)(ticker, data)
+        return data
+
+    try:
+        data, shared = await _aquote_flight.do(key, fetch)
+    except CircuitOpen:
+        entry = await cache.aget(QUOTE_LKG_KEY.format(ticker))
+        if entry is None:
+            raise
+        quote_stats.incr("stale")
+        return entry["data"], "stale"
+    outcome = "coalesced" if shared else "miss"
+    quote_stats.incr(outcome)
+    return data, outcome
+
+
+_fanout_pool = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout_pool():
+    """Return the worker's shared, bounded pool for parallel upstream calls."""
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _fanout_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(
+                    max_workers=settings.UPSTREAM_FANOUT_WORKERS,
+                    thread_name_prefix="upstream-fanout",
+                )
+    return _fanout_pool
+
+
+_refresh_pool = None
+_refresh_slots = None
+
+
+def get_refresh_pool():
+    """Return the worker's small pool for background reference refreshes."""
+    global _refresh_pool, _refresh_slots
+    if _refresh_pool is None:
+        with _fanout_lock:
+            if _refresh_pool is None:
+                _refresh_slots = threading.BoundedSemaphore(
+                    settings.REFERENCE_REFRESH_MAX_PENDING
+                )
+                _refresh_pool = ThreadPoolExecutor(
+                    max_workers=settings.REFERENCE_REFRESH_WORKERS,
+                    thread_name_prefix="reference-refresh",
+                )
+    return _refresh_pool
+
+
+def fan_out(fetch, args, pool=None):
+    """Call ``fetch(arg)`` for each distinct arg in parallel.
+
+    Runs on ``pool``, the shared fan-out pool by default. Returns
+    ``(results, errors)``, two dicts keyed by arg; a failure for one arg
+    never hides the results of the others.
+    """
+    # Each call runs in a copy of the caller's context, so per-request
+    # metrics and profiling see the queries and upstream calls it makes.
+    pool = pool or get_fanout_pool()
+    futures = {
+        arg: pool.submit(contextvars.copy_context().run, fetch, arg)
+        for arg in dict.fromkeys(args)
+    }
+    results, errors = {}, {}
+    for arg, future in futures.items():
+        try:
+            results[arg] = future.result()
+        except Exception as e:
+            errors[arg] = e
+    return results, errors
+
+
+def get_cached_quotes(tickers):
+    """Return ``(quotes, errors)`` for many tickers, fetching misses in parallel."""
+    tickers = [normalize_ticker(t) for t in tickers]
+    return fan_out(lambda t: get_cached_quote(t)[0], tickers)
+
+
+def get_market_data(tickers):
+    """Return ``(quotes, profiles)`` for tickers, all fetched in one parallel round.
+
+    Tickers whose lookup failed are missing from the corresponding dict.
+    """
+    tickers = [normalize_ticker(t) for t in tickers]
+    jobs = [("quote", t) for t in tickers] + [("profile", t) for t in tickers]
+
+    def fetch(job):
+        kind, ticker = job
+        if kind == "quote":
+            return get_cached_quote(ticker)[0]
+        return profile_cache.get(ticker)[0]
+
+    results, errors = fan_out(fetch, jobs)
+    for (kind, ticker), e in errors.items():
+        logger.error(f"Error fetching {kind} for ticker {ticker}: {e}")
+    quotes = {t: data for (kind, t), data in results.items() if kind == "quote"}
+    profiles = {t: data for (kind, t), data in results.items() if kind == "profile"}
+    return quotes, profiles
+
+
+class ReferenceCache:
+    """Long-lived cache for upstream data that rarely changes.
+
+    Entries are kept in a bounded in-process LRU and, when a ``reference``
+    cache alias is configured, in that shared backend as well (a
+    ``DatabaseCache`` table or ``FileBasedCache`` directory). An entry older
+    than its TTL but still within ``REFERENCE_CACHE_STALE_TTL`` is returned
+    immediately while a small background pool refreshes it.
+    """
+
+    def __init__(self, name, fetch, afetch, ttl_setting):
+        self.name = name
+        self.fetch = fetch
+        self.afetch = afetch
+        self.ttl_setting = ttl_setting
+        self.stats = Counters("hit", "stale", "miss", "coalesced")
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self._refreshing = set()
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting)
+
+    @property
+    def shared(self):
+        if "reference" in settings.CACHES:
+            return caches["reference"]
+        return None
+
+    def key(self, arg):
+        return f"{self.name}:{quote(normalize_ticker(arg))}"
+
+    def get(self, arg):
+        """Return ``(data, outcome)``; outcome is hit, stale, miss or coalesced.
+
+        An entry past its stale window is not served, except as a fallback
+        while the upstream circuit is open.
+        """
+        key = self.key(arg)
+        entry = self._get_entry(key)
+        served = self._serve(key, arg, entry)
+        if served is not None:
+            return served
+        try:
+            data, shared = self._flight.do(key, lambda: self._load(key, arg))
+        except CircuitOpen as e:
+            return self._fallback(entry, e)
+        outcome = "coalesced" if shared else "miss"
+        self.stats.incr(outcome)
+        return data, outcome
+
+    async def aget(self, arg):
+        """Async counterpart of ``get``; stale refreshes still run in the pool."""
+        key = self.key(arg)
+        entry = self._get_local(key)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.aget(key)
+            if entry is not None:
+                self._remember(key, entry)
+        served = self._serve(key, arg, entry)
+        if served is not None:
+            return served
+        try:
+            data, shared = await self._aflight.do(key, lambda: self._aload(key, arg))
+        except CircuitOpen as e:
+            return self._fallback(entry, e)
+        outcome = "coalesced" if shared else "miss"
+        self.stats.incr(outcome)
+        return data, outcome
+
+    def _serve(self, key, arg, entry):
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        if age < self.ttl:
+            self.stats.incr("hit")
+            return entry["data"], "hit"
+        if age < self.ttl + settings.REFERENCE_CACHE_STALE_TTL:
+            self._refresh_in_background(key, arg)
+            self.stats.incr("stale")
+            return entry["data"], "stale"
+        return None
+
+    def _fallback(self, entry, error):
+        if entry is None:
+            raise error
+        self.stats.incr("stale")
+        return entry["data"], "stale"
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+            return entry
+
+    def _get_entry(self, key):
+        entry = self._get_local(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.REFERENCE_CACHE_MAXSIZE:
+                self._lru.popitem(last=False)
+
+    def _load(self, key, arg):
+        entry = {"data": self.fetch(arg), "fetched_at": time.time()}
+        self._remember(key, entry)
+        if self.shared is not None:
+            self.shared.set(key, entry, self.ttl + settings.REFERENCE_CACHE_STALE_TTL)
+        return entry["data"]
+
+    async def _aload(self, key, arg):
+        entry = {"data": await self.afetch(arg), "fetched_at": time.time()}
+        self._remember(key, entry)
+        if self.shared is not None:
+            await self.shared.aset(
+                key, entry, self.ttl + settings.REFERENCE_CACHE_STALE_TTL
+            )
+        return entry["data"]
+
+    def _refresh_in_background(self, key, arg):
+        pool = get_refresh_pool()
+        with self._lock:
+            if key in self._refreshing:
+                return
+            # Saturated: keep serving the stale entry and let a later
+            # request schedule the refresh.
+            if not _refresh_slots.acquire(blocking=False):
+                return
+            self._refreshing.add(key)
+        pool.submit(self._refresh, key, arg)
+
+    def _refresh(self, key, arg):
+        try:
+            with background_priority():
+                self._load(key, arg)
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            _refresh_slots.release()
+            # A DatabaseCache write opens a connection owned by this thread.
+            connection.close()
+
+
+profile_cache = ReferenceCache(
+    "profile", get_stock_profile, aget_stock_profile, "PROFILE_CACHE_TTL"
+)
+lookup_cache = ReferenceCache(
+    "lookup", get_stock_data, aget_stock_data, "LOOKUP_CACHE_TTL"
+)
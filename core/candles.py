@@ -0,0 +1,243 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BigIntegerField, Func, Max, Min, Sum
+from django.utils import timezone
+
+from .cache import SingleFlight, normalize_ticker
+from .models import Candle, CandleRange
+from .utils import call_finnhub
+
+logger = logging.getLogger(__name__)
+
+# Bucket width in seconds for each resolution Finnhub understands. Only
+# 1-minute bars are stored; everything else is aggregated on read.
+RESOLUTIONS = {
+    "1": 60,
+    "5": 5 * 60,
+    "15": 15 * 60,
+    "30": 30 * 60,
+    "60": 60 * 60,
+    "D": 24 * 60 * 60,
+}
+
+# Longest span one request may ask for at the finer resolutions, in days, so
+# a response stays a few thousand bars; CANDLE_MAX_RANGE_DAYS caps the rest.
+MAX_RANGE_DAYS = {"1": 7, "5": 31, "15": 92, "30": 183}
+
+# Start of the unsettled span last fetched for a symbol, kept for
+# CANDLE_TAIL_TTL; until it expires nothing after it is fetched again.
+CANDLE_TAIL_KEY = "candles:tail:{}"
+
+_backfill_flight = SingleFlight()
+
+
+def _floor_minute(dt):
+    return dt.replace(second=0, microsecond=0)
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def missing_ranges(symbol, start, end):
+    """Spans of ``[start, end)`` not yet fetched for ``symbol``."""
+    gaps = []
+    cursor = start
+    covered = (
+        CandleRange.objects.filter(symbol=symbol, start__lt=end, end__gt=start)
+        .order_by("start")
+        .values_list("start", "end")
+    )
+    for range_start, range_end in covered:
+        if range_start > cursor:
+            gaps.append((cursor, range_start))
+        cursor = max(cursor, range_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _before(gaps, cutoff):
+    """The parts of ``gaps`` before ``cutoff``."""
+    return [(start, min(end, cutoff)) for start, end in gaps if start < cutoff]
+
+
+def _record_range(symbol, start, end):
+    """Mark ``[start, end)`` as fetched, merging it with touching spans."""
+    touching = CandleRange.objects.filter(symbol=symbol, start__lte=end, end__gte=start)
+    bounds = touching.aggregate(start=Min("start"), end=Max("end"))
+    if bounds["start"] is not None:
+        start = min(start, bounds["start"])
+        end = max(end, bounds["end"])
+    touching.delete()
+    CandleRange.objects.create(symbol=symbol, start=start, end=end)
+
+
+def _fetch_chunk(symbol, start, end, settled):
+    # Finnhub's range is inclusive at both ends; ours is half-open.
+    data = call_finnhub(
+        "stock_candles", symbol, "1", int(start.timestamp()), int(end.timestamp()) - 1
+    )
+    bars = []
+    if data.get("s") == "ok":
+        for t, o, h, l, c, v in zip(
+            data["t"], data["o"], data["h"], data["l"], data["c"], data["v"]
+        ):
+            bars.append(
+                Candle(
+                    symbol=symbol,
+                    ts=from_epoch(t),
+                    open=o,
+                    high=h,
+                    low=l,
+                    close=c,
+                    volume=int(v),
+                )
+            )
+    with transaction.atomic():
+        Candle.objects.bulk_create(bars, batch_size=2000, ignore_conflicts=True)
+        # Bars not published yet would be missed for good if their minutes
+        # were marked as fetched.
+        if start < settled:
+            _record_range(symbol, start, min(end, settled))
+    # They are fetched again, but only once CANDLE_TAIL_TTL has passed, so
+    # repeated chart views of the latest bars don't each go upstream.
+    if end > settled:
+        cache.set(
+            CANDLE_TAIL_KEY.format(symbol),
+            max(start, settled),
+            settings.CANDLE_TAIL_TTL,
+        )
+    return len(bars)
+
+
+def _backfill(symbol, start, end):
+    chunk = timedelta(days=settings.CANDLE_BACKFILL_CHUNK_DAYS)
+    settled = _floor_minute(
+        timezone.now() - timedelta(minutes=settings.CANDLE_SETTLE_MINUTES)
+    )
+    gaps = missing_ranges(symbol, start, end)
+    tail = cache.get(CANDLE_TAIL_KEY.format(symbol))
+    if tail is not None:
+        gaps = _before(gaps, tail)
+    calls = 0
+    for gap_start, gap_end in gaps:
+        while gap_start < gap_end:
+            chunk_end = min(gap_start + chunk, gap_end)
+            _fetch_chunk(symbol, gap_start, chunk_end, settled)
+            calls += 1
+            gap_start = chunk_end
+    return calls
+
+
+def backfill_candles(symbol, start, end):
+    """Fetch the 1-minute bars of ``[start, end)`` that are not stored yet.
+
+    Spans already fetched are skipped, as is the minute still in progress.
+    The last CANDLE_SETTLE_MINUTES are never recorded as fetched; they are
+    fetched again once CANDLE_TAIL_TTL seconds have passed. Returns the
+    number of upstream calls made.
+    """
+    symbol = normalize_ticker(symbol)
+    start = _floor_minute(start)
+    end = min(_floor_minute(end), _floor_minute(timezone.now()))
+    if start >= end:
+        return 0
+    # Concurrent requests for one symbol share a backfill; a waiter then
+    # checks its own range again, which is usually covered by now.
+    while True:
+        calls, shared = _backfill_flight.do(
+            symbol, lambda: _backfill(symbol, start, end)
+        )
+        if not shared:
+            return calls
+
+
+def max_range_days(resolution):
+    return min(
+        settings.CANDLE_MAX_RANGE_DAYS,
+        MAX_RANGE_DAYS.get(resolution, settings.CANDLE_MAX_RANGE_DAYS),
+    )
+
+
+class EpochBucket(Func):
+    """Unix time of a timestamp, floored to a multiple of ``step`` seconds."""
+
+    output_field = BigIntegerField()
+    template = (
+        "(CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT) / %(step)d * %(step)d)"
+    )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template=(
+                "(CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)"
+                " / %(step)d * %(step)d)"
+            ),
+            **extra_context,
+        )
+
+
+def _aggregate(symbol, rows, step):
+    buckets = list(
+        rows.annotate(bucket=EpochBucket("ts", step=step))
+        .values("bucket")
+        .annotate(
+            first=Min("ts"),
+            last=Max("ts"),
+            high=Max("high"),
+            low=Min("low"),
+            volume=Sum("volume"),
+        )
+        .order_by("bucket")
+    )
+    # Open and close come from the bucket's first and last bars, looked up
+    # by their (symbol, ts) key a batch of buckets at a time.
+    edges = [b["first"] for b in buckets] + [b["last"] for b in buckets]
+    prices = {}
+    for i in range(0, len(edges), 500):
+        prices.update(
+            (ts, (o, c))
+            for ts, o, c in Candle.objects.filter(
+                symbol=symbol, ts__in=edges[i : i + 500]
+            ).values_list("ts", "open", "close")
+        )
+    for b in buckets:
+        b["open"] = prices[b["first"]][0]
+        b["close"] = prices[b["last"]][1]
+    return buckets
+
+
+def get_candles(symbol, resolution, start, end):
+    """Bars of ``[start, end)`` from the local store, in Finnhub's layout.
+
+    1-minute bars are aggregated into buckets of the requested resolution,
+    aligned to UTC, by the database.
+    """
+    symbol = normalize_ticker(symbol)
+    rows = Candle.objects.filter(symbol=symbol, ts__gte=start, ts__lt=end)
+    if resolution == "1":
+        buckets = [
+            {**bar, "bucket": int(bar["ts"].timestamp())}
+            for bar in rows.order_by("ts").values(
+                "ts", "open", "high", "low", "close", "volume"
+            )
+        ]
+    else:
+        buckets = _aggregate(symbol, rows, RESOLUTIONS[resolution])
+    candles = {
+        "c": [b["close"] for b in buckets],
+        "h": [b["high"] for b in buckets],
+        "l": [b["low"] for b in buckets],
+        "o": [b["open"] for b in buckets],
+        "t": [b["bucket"] for b in buckets],
+        "v": [b["volume"] for b in buckets],
+    }
+    candles["s"] = "ok" if buckets else "no_data"
+    return candles
@@ -1,7 +1,17 @@
 from rest_framework.generics import ListAPIView, CreateAPIView, DestroyAPIView
 from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST
+from rest_framework.views import APIView
+import csv
+import json
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from .analytics import portfolio_analytics
+from .cache import get_market_data
 from .models import FavoriteStock
-from .serializers import FavoriteStockSerializer
+from .serializers import FavoriteStockSerializer, FavoriteStockQuoteSerializer
 
 
 class FavoriteStockListView(ListAPIView):
@@ -14,6 +24,205 @@ class FavoriteStockListView(ListAPIView):
         )  # Order by added_on descending
 
 
+class FavoriteStockQuoteListView(FavoriteStockListView):
+    serializer_class = FavoriteStockQuoteSerializer
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        favorites = page if page is not None else list(queryset)
+        # One parallel round of upstream lookups for the whole page.
+        self.quotes, self.profiles = get_market_data(
+            [f.stock_symbol for f in favorites]
+        )
+        serializer = self.get_serializer(favorites, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["quotes"] = getattr(self, "quotes", {})
+        context["profiles"] = getattr(self, "profiles", {})
+        return context
+
+
+class FavoriteStockAnalyticsView(APIView):
+    """Returns, volatility, drawdown and correlations of the user's favorites
+    over the last ``?window=`` days."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            window = int(
+                request.query_params.get("window", settings.ANALYTICS_DEFAULT_WINDOW)
+            )
+        except ValueError:
+            window = 0
+        if not 2 <= window <= settings.CANDLE_MAX_RANGE_DAYS:
+            return Response(
+                {
+                    "error": "window must be a number of days between 2 and "
+                    f"{settings.CANDLE_MAX_RANGE_DAYS}"
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
+        symbols = FavoriteStock.objects.filter(user=request.user).values_list(
+            "stock_symbol", flat=True
+        )
+        data, outcome = portfolio_analytics(symbols, window)
+        return Response(data, headers={"X-Cache": outcome})
+
+
+class FavoriteStockBatchView(APIView):
+    """Add (POST) or remove (DELETE) many favorites at once.
+
+    Both take ``{"symbols": [...]}`` and answer with a per-symbol report.
+    Each batch is one lookup of the symbols already saved plus a single bulk
+    INSERT or DELETE. If a concurrent request saves one of the symbols first,
+    the INSERT fails and the symbols are added one by one instead.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def clean_symbols(self, request):
+        symbols = request.data.get("symbols")
+        if not isinstance(symbols, list):
+            return None, Response(
+                {"error": "symbols must be a list of stock symbols"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+        if len(symbols) > settings.FAVORITES_BATCH_MAX:
+            return None, Response(
+                {
+                    "error": f"At most {settings.FAVORITES_BATCH_MAX} symbols per request"
+                },
+                status=HTTP_400_BAD_REQUEST,
+            )
+        max_length = FavoriteStock._meta.get_field("stock_symbol").max_length
+        valid, results = [], []
+        for symbol in symbols:
+            symbol = symbol.strip() if isinstance(symbol, str) else ""
+            if not symbol or len(symbol) > max_length:
+                results.append({"stock_symbol": symbol, "status": "invalid"})
+            elif symbol not in valid:
+                valid.append(symbol)
+        return (valid, results), None
+
+    def report(self, results):
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return Response({"counts": counts, "results": results})
+
+    def post(self, request, *args, **kwargs):
+        cleaned, error = self.clean_symbols(request)
+        if error:
+            return error
+        valid, results = cleaned
+        existing = set(
+            FavoriteStock.objects.filter(
+                user=request.user, stock_symbol__in=valid
+            ).values_list("stock_symbol", flat=True)
+        )
+        new = [s for s in valid if s not in existing]
+        try:
+            with transaction.atomic():
+                FavoriteStock.objects.bulk_create(
+                    [FavoriteStock(user=request.user, stock_symbol=s) for s in new]
+                )
+            created = set(new)
+        except IntegrityError:
+            # Another request added some of them since the lookup; add the
+            # rest one at a time to learn which ones this request created.
+            created = set()
+            for symbol in new:
+                _, was_created = FavoriteStock.objects.get_or_create(
+                    user=request.user, stock_symbol=symbol
+                )
+                if was_created:
+                    created.add(symbol)
+        for symbol in valid:
+            results.append(
+                {
+                    "stock_symbol": symbol,
+                    "status": "created" if symbol in created else "exists",
+                }
+            )
+        return self.report(results)
+
+    def delete(self, request, *args, **kwargs):
+        cleaned, error = self.clean_symbols(request)
+        if error:
+            return error
+        valid, results = cleaned
+        with transaction.atomic():
+            favorites = FavoriteStock.objects.filter(
+                user=request.user, stock_symbol__in=valid
+            )
+            existing = set(favorites.values_list("stock_symbol", flat=True))
+            favorites.delete()
+        for symbol in valid:
+            results.append(
+                {
+                    "stock_symbol": symbol,
+                    "status": "deleted" if symbol in existing else "not_found",
+                }
+            )
+        return self.report(results)
+
+
+class Echo:
+    """File-like object that returns what is written, for streaming csv."""
+
+    def write(self, value):
+        return value
+
+
+class FavoriteStockExportView(APIView):
+    """Stream the user's favorites as ``?output=json`` (default) or ``csv``."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "json")
+        if output not in ("csv", "json"):
+            return Response(
+                {"error": "output must be csv or json"}, status=HTTP_400_BAD_REQUEST
+            )
+        rows = (
+            FavoriteStock.objects.filter(user=request.user)
+            .order_by("-added_on")
+            .values_list("stock_symbol", "added_on")
+            .iterator(chunk_size=1000)
+        )
+        if output == "csv":
+            content, content_type = self.csv_rows(rows), "text/csv"
+        else:
+            content, content_type = self.json_rows(rows), "application/json"
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="favorites.{output}"'
+        return response
+
+    @staticmethod
+    def csv_rows(rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(["stock_symbol", "added_on"])
+        for symbol, added_on in rows:
+            yield writer.writerow([symbol, added_on.isoformat()])
+
+    @staticmethod
+    def json_rows(rows):
+        yield "["
+        separator = ""
+        for symbol, added_on in rows:
+            item = {"stock_symbol": symbol, "added_on": added_on.isoformat()}
+            yield separator + json.dumps(item)
+            separator = ","
+        yield "]"
+
+
 class FavoriteStockCreateView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FavoriteStockSerializer
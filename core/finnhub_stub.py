@@ -0,0 +1,184 @@
+"""A tiny stand-in for the Finnhub REST API, used by tests and benchmarks.
+
+Point ``FINNHUB_API_URL`` at ``server.base_url`` to send upstream calls here
+instead of api.finnhub.io. ``latency`` delays every answer and a fraction
+``error_rate`` of requests fail with a 500, to see how the app behaves when
+the upstream is slow or flaky.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_quote(symbol):
+    base = sum(ord(c) for c in symbol) % 400 + 10
+    return {
+        "c": base + 0.5,
+        "d": 0.5,
+        "dp": round(0.5 / base * 100, 4),
+        "h": base + 1.0,
+        "l": base - 1.0,
+        "o": base,
+        "pc": base,
+        "t": int(time.time()),
+    }
+
+
+def fake_profile(symbol):
+    return {
+        "country": "US",
+        "currency": "USD",
+        "exchange": "NASDAQ NMS - GLOBAL MARKET",
+        "name": f"{symbol} Inc",
+        "ticker": symbol,
+        "weburl": f"https://www.{symbol.lower()}.example.com/",
+    }
+
+
+def fake_lookup(query):
+    query = query.upper()
+    return {
+        "count": 1,
+        "result": [
+            {
+                "description": f"{query} INC",
+                "displaySymbol": query,
+                "symbol": query,
+                "type": "Common Stock",
+            }
+        ],
+    }
+
+
+def fake_symbols(exchange):
+    return [
+        {
+            "currency": "USD",
+            "description": f"{symbol} INC",
+            "displaySymbol": symbol,
+            "mic": "XNAS",
+            "symbol": symbol,
+            "type": "Common Stock",
+        }
+        for symbol in ["AAPL", "AMZN", "MSFT", "TSLA"]
+    ]
+
+
+def fake_candles(symbol, start, end, resolution="1"):
+    """Bars for every step of ``resolution`` in ``[start, end]`` (epoch seconds).
+
+    ``resolution`` is a number of minutes, or "D" for daily bars.
+    """
+    step = 86400 if resolution == "D" else int(resolution) * 60
+    base = sum(ord(c) for c in symbol) % 400 + 10
+    times = list(range(-(-start // step) * step, end + 1, step))
+    if not times:
+        return {"s": "no_data"}
+    # Wiggles minute to minute and drifts day to day.
+    opens = [base + (t // 60) % 10 + (t // 86400) % 7 for t in times]
+    return {
+        "c": [o + 0.5 for o in opens],
+        "h": [o + 1.0 for o in opens],
+        "l": [o - 1.0 for o in opens],
+        "o": opens,
+        "s": "ok",
+        "t": times,
+        "v": [100] * len(times),
+    }
+
+
+class FinnhubStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        # finnhub.Client joins API_URL and paths with an extra slash.
+        path = "/" + url.path.lstrip("/")
+        if path.startswith("/api/v1/"):
+            path = path[len("/api/v1") :]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.count("requests")
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self.server.count("errors")
+            return self._send(500, {"error": "Injected failure"})
+
+        if path == "/quote":
+            body = fake_quote(params.get("symbol", ""))
+        elif path == "/stock/profile2":
+            body = fake_profile(params.get("symbol", ""))
+        elif path == "/search":
+            body = fake_lookup(params.get("q", ""))
+        elif path == "/stock/symbol":
+            body = fake_symbols(params.get("exchange", ""))
+        elif path == "/stock/candle":
+            body = fake_candles(
+                params.get("symbol", ""),
+                int(params.get("from", 0)),
+                int(params.get("to", 0)),
+                params.get("resolution", "1"),
+            )
+        else:
+            return self._send(404, {"error": "Not found"})
+        return self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FinnhubStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, seed=None
+    ):
+        super().__init__((host, port), FinnhubStubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.counters = {"connections": 0, "requests": 0, "errors": 0}
+        self._counter_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._counter_lock:
+            return self._random.random() < self.error_rate
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
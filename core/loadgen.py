@@ -0,0 +1,117 @@
+"""Minimal closed-loop load generator used by the benchmark commands."""
+
+import os
+import socket
+import threading
+import time
+
+import requests
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_env(finnhub_url, **extra):
+    """Environment for a server under test, pointed at the fake Finnhub API."""
+    return dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=os.environ.get(
+            "DJANGO_SETTINGS_MODULE", "backend.settings"
+        ),
+        FINNHUB_API_URL=finnhub_url,
+        # The stub has no quota; don't let the client-side limiter skew
+        # the numbers.
+        FINNHUB_RATE_LIMIT_PER_MINUTE="1000000",
+        FINNHUB_RATE_LIMIT_BURST="100000",
+        **extra,
+    )
+
+
+def host_headers():
+    # ALLOWED_HOSTS only lists the configured host, localhost by default.
+    return {"Host": os.environ.get("ALLOWED_HOST", "localhost")}
+
+
+def wait_until_ready(url, headers=None, timeout=20):
+    """Poll ``url`` until the server answers; False if it never does."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, headers=headers, timeout=1)
+            return True
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[max(index, 0)]
+
+
+class LoadResult:
+    def __init__(self, latencies, errors, elapsed):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def rps(self):
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "rps": round(self.rps, 1),
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+        }
+
+
+def run_load(make_request, total, concurrency):
+    """Run ``make_request(session, i)`` for i in range(total) on N threads.
+
+    Each thread owns a keep-alive ``requests.Session``. A request counts as
+    an error if it raises or returns a response with status >= 400.
+    """
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    results_lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                response = make_request(session, i)
+                failed = response is not None and response.status_code >= 400
+            except Exception:
+                failed = True
+            latency = time.perf_counter() - start
+            with results_lock:
+                if failed:
+                    errors[0] += 1
+                else:
+                    latencies.append(latency)
+        session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return LoadResult(latencies, errors[0], time.perf_counter() - started)
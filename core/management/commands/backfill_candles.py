@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.candles import backfill_candles
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch the 1-minute candles of the last --days days for the given "
+        "symbols into the local store. Spans already stored are skipped, so "
+        "it can be re-run (e.g. from cron) to top the store up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="+")
+        parser.add_argument("--days", type=int, default=30)
+
+    def handle(self, *args, **options):
+        end = timezone.now()
+        start = end - timedelta(days=options["days"])
+        for symbol in options["symbols"]:
+            calls = backfill_candles(symbol, start, end)
+            self.stdout.write(f"{symbol.upper()}: {calls} upstream calls")
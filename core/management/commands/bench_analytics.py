@@ -0,0 +1,159 @@
+import math
+import statistics
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core.analytics import (
+    TRADING_DAYS,
+    analytics_key,
+    compute_metrics,
+    portfolio_analytics,
+)
+from core.cache import get_cached_quotes
+from core.finnhub_stub import FinnhubStubServer
+from core.models import DailyClose, DailySeries
+from core.throttle import upstream_bucket
+from core.utils import reset_finnhub_client
+
+
+def loop_metrics(prices):
+    """Per-symbol, per-pair Python loops: the baseline compute_metrics replaces."""
+    columns = [list(column) for column in prices.T]
+    returns = [[b / a - 1 for a, b in zip(c, c[1:])] for c in columns]
+    stats = []
+    for column, r in zip(columns, returns):
+        peak, drawdown = column[0], 0.0
+        for price in column:
+            peak = max(peak, price)
+            drawdown = min(drawdown, price / peak - 1)
+        stats.append(
+            (
+                column[-1] / column[0] - 1,
+                statistics.stdev(r) * math.sqrt(TRADING_DAYS),
+                drawdown,
+            )
+        )
+    correlation = [[statistics.correlation(a, b) for b in returns] for a in returns]
+    return stats, correlation
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the favorites analytics computation for 10 to 500 symbols on "
+        "synthetic daily prices, against a plain Python loop baseline, and "
+        "the whole request path (fetching each symbol's daily closes from the "
+        "fake Finnhub API) cold and with the closes stored, with the latency "
+        "of a one-ticker batch quote made while the cold load runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10, 50, 100, 250, 500]
+        )
+        parser.add_argument("--days", type=int, default=TRADING_DAYS)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--no-baseline",
+            action="store_true",
+            help="Skip the (slow) Python loop baseline.",
+        )
+        parser.add_argument(
+            "--no-load",
+            action="store_true",
+            help="Only time the computation, not the request path (which "
+            "writes daily closes for SYM0, SYM1, ... to the database).",
+        )
+        parser.add_argument("--window", type=int, default=365)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.02,
+            help="Seconds the fake Finnhub API takes per call.",
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        for size in options["sizes"]:
+            steps = rng.normal(0.0005, 0.02, size=(options["days"], size))
+            prices = 100 * np.exp(np.cumsum(steps, axis=0))
+
+            vectorized = self._time(compute_metrics, prices, options["repeat"])
+            line = f"{size:>4} symbols: numpy {vectorized * 1000:8.2f} ms"
+            if not options["no_baseline"]:
+                baseline = self._time(loop_metrics, prices, 1)
+                line += (
+                    f"  loops {baseline * 1000:9.2f} ms"
+                    f"  ({baseline / vectorized:.0f}x)"
+                )
+            self.stdout.write(line)
+        if not options["no_load"]:
+            self._bench_load(options)
+
+    def _bench_load(self, options):
+        stub = FinnhubStubServer(latency=options["latency"]).start()
+        # The stub has no quota; don't let the client-side limiter skew the
+        # numbers.
+        overrides = override_settings(
+            FINNHUB_API_URL=stub.base_url,
+            FINNHUB_RATE_LIMIT_PER_MINUTE=1_000_000,
+            FINNHUB_RATE_LIMIT_BURST=100_000,
+            QUOTE_CACHE_TTL=0,
+        )
+        overrides.enable()
+        reset_finnhub_client()
+        upstream_bucket.reset()
+        try:
+            for size in options["sizes"]:
+                self.stdout.write(self._load_line(size, options["window"], stub))
+        finally:
+            overrides.disable()
+            reset_finnhub_client()
+            stub.stop()
+
+    def _load_line(self, size, window, stub):
+        symbols = sorted(f"SYM{i}" for i in range(size))
+        cache.clear()
+        DailySeries.objects.filter(symbol__in=symbols).delete()
+        DailyClose.objects.filter(symbol__in=symbols).delete()
+        before = stub.counters["requests"]
+        quote = []
+
+        def quote_during_load():
+            start = time.perf_counter()
+            get_cached_quotes(["AAPL"])
+            quote.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        thread = threading.Thread(target=quote_during_load)
+        thread.start()
+        result, _ = portfolio_analytics(symbols, window)
+        cold = time.perf_counter() - started
+        thread.join()
+        # Less the quote.
+        calls = stub.counters["requests"] - before - 1
+
+        # The closes are stored now; only the result is computed again.
+        cache.delete(analytics_key(symbols, window))
+        started = time.perf_counter()
+        portfolio_analytics(symbols, window)
+        warm = time.perf_counter() - started
+        return (
+            f"{size:>4} symbols: load cold {cold * 1000:8.1f} ms"
+            f" ({calls} calls, {len(result['unavailable'])} unavailable)"
+            f"  stored {warm * 1000:7.1f} ms"
+            f"  quote during cold load {quote[0] * 1000:6.1f} ms"
+        )
+
+    @staticmethod
+    def _time(fn, prices, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(prices)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from core.loadgen import percentile
+
+MODES = {
+    # Django's default: connect at the first query, close when the request ends.
+    "per-request": {"CONN_MAX_AGE": 0},
+    "persistent": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+    "pool": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True},
+}
+
+QUERY = "SELECT id, username, email FROM core_user ORDER BY id LIMIT 1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request database overhead with a connection per request, "
+        "persistent connections and the psycopg pool (Postgres only). Each "
+        "simulated request runs one query between Django's request-start and "
+        "request-end connection handling, on --threads threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            help="Pool max_size; defaults to the thread count.",
+        )
+        parser.add_argument("--mode", choices=list(MODES), action="append")
+
+    def handle(self, *args, **options):
+        modes = options["mode"] or list(MODES)
+        vendor = connections["default"].vendor
+        if "pool" in modes and vendor != "postgresql":
+            if options["mode"]:
+                raise CommandError("The connection pool needs PostgreSQL.")
+            modes.remove("pool")
+        for mode in modes:
+            alias = f"bench_{mode}"
+            db = copy.deepcopy(connections.settings["default"])
+            db.update(MODES[mode])
+            if mode == "pool":
+                size = options["pool_size"] or options["threads"]
+                db["OPTIONS"] = dict(
+                    db["OPTIONS"], pool={"min_size": size, "max_size": size}
+                )
+            connections.settings[alias] = db
+            try:
+                result = self._bench(alias, options["requests"], options["threads"])
+                if mode == "pool":
+                    stats = connections[alias].pool.get_stats()
+                    result["pool_wait_ms"] = stats.get("requests_wait_ms", 0)
+                    result["pool_queued"] = stats.get("requests_queued", 0)
+                    # connection_created also fires for every checkout.
+                    result["connects"] = stats.get("connections_num", 0)
+            finally:
+                connections[alias].close()
+                if mode == "pool":
+                    connections[alias].close_pool()
+                del connections.settings[alias]
+            line = (
+                f"{mode:>12}: {result['rps']:8.1f} req/s  "
+                f"mean {result['mean_ms']:6.2f} ms  "
+                f"p95 {result['p95_ms']:6.2f} ms  "
+                f"connections opened {result['connects']}"
+            )
+            if mode == "pool":
+                line += (
+                    f"  waited {result['pool_queued']} times, "
+                    f"{result['pool_wait_ms']} ms in total"
+                )
+            self.stdout.write(line)
+
+    def _bench(self, alias, total, threads):
+        counter = iter(range(total))
+        lock = threading.Lock()
+        latencies = []
+        connects = [0]
+
+        def count_connect(sender, connection, **kwargs):
+            if connection.alias == alias:
+                with lock:
+                    connects[0] += 1
+
+        def worker():
+            conn = connections[alias]
+            mine = []
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        break
+                start = time.perf_counter()
+                # What close_old_connections() does on request_started and
+                # request_finished.
+                conn.close_if_unusable_or_obsolete()
+                with conn.cursor() as cursor:
+                    cursor.execute(QUERY)
+                    cursor.fetchall()
+                conn.close_if_unusable_or_obsolete()
+                mine.append(time.perf_counter() - start)
+            conn.close()
+            with lock:
+                latencies.extend(mine)
+
+        connection_created.connect(count_connect)
+        try:
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            started = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connect)
+        latencies.sort()
+        return {
+            "rps": len(latencies) / elapsed,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "connects": connects[0],
+        }
@@ -0,0 +1,70 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import finnhub
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.finnhub_stub import FinnhubStubServer
+from core.utils import get_stock_price_data, reset_finnhub_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare a fresh finnhub.Client per call against the shared pooled "
+        "client, using a local stub upstream. The stub speaks plain HTTP, so "
+        "the gap seen here is TCP setup only; against api.finnhub.io the TLS "
+        "handshake makes per-call construction considerably worse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds the stub sleeps before answering each call.",
+        )
+
+    def handle(self, *args, **options):
+        server = FinnhubStubServer(latency=options["latency"]).start()
+        try:
+            with override_settings(
+                FINNHUB_API_URL=server.base_url,
+                FINNHUB_POOL_MAXSIZE=options["threads"],
+            ):
+                reset_finnhub_client()
+                self._run(server, "per-call client", self._per_call, options)
+                self._run(server, "shared client", get_stock_price_data, options)
+                reset_finnhub_client()
+        finally:
+            server.stop()
+
+    @staticmethod
+    def _per_call(ticker):
+        client = finnhub.Client(api_key=settings.FINNHUB_API_KEY)
+        client.API_URL = settings.FINNHUB_API_URL
+        return client.quote(ticker)
+
+    def _run(self, server, label, fetch, options):
+        def timed(i):
+            start = time.perf_counter()
+            fetch(f"SYM{i % 50}")
+            return time.perf_counter() - start
+
+        connections_before = server.counters["connections"]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            latencies = sorted(pool.map(timed, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:>16}: {len(latencies) / elapsed:8.0f} req/s  "
+            f"mean {statistics.mean(latencies) * 1000:6.2f} ms  "
+            f"p95 {p95 * 1000:6.2f} ms  "
+            f"connections {server.counters['connections'] - connections_before}"
+        )
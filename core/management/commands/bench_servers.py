@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.finnhub_stub import FinnhubStubServer
+from core.loadgen import (
+    free_port,
+    host_headers,
+    run_load,
+    server_env,
+    wait_until_ready,
+)
+
+CONFIG = ["-m", "gunicorn", "-c", "gunicorn.conf.py"]
+
+# name: (server command, path requested, environment)
+DEPLOYMENTS = {
+    # Gunicorn's defaults: one sync worker. The empty config file keeps
+    # gunicorn from loading gunicorn.conf.py from the working directory.
+    "wsgi": (
+        ["-m", "gunicorn", "-c", os.devnull, "backend.wsgi:application"],
+        "/api/stock-price/",
+        {},
+    ),
+    "asgi": (
+        ["-m", "uvicorn", "backend.asgi:application", "--workers", "1"],
+        "/api/async/stock-price/",
+        {},
+    ),
+    # The production configuration in gunicorn.conf.py.
+    "gthread": (CONFIG, "/api/stock-price/", {"GUNICORN_WORKER_CLASS": "gthread"}),
+    "uvicorn": (
+        CONFIG,
+        "/api/async/stock-price/",
+        {"GUNICORN_WORKER_CLASS": "uvicorn"},
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the WSGI (sync gunicorn worker) and ASGI (uvicorn) "
+        "deployments with one worker each, and gunicorn.conf.py with gthread "
+        "and uvicorn workers, against a slow stub upstream. The quote cache "
+        "is disabled so every request goes upstream."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--latency", type=float, default=0.1)
+        parser.add_argument("--deployment", choices=list(DEPLOYMENTS), action="append")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Workers of the gunicorn.conf.py deployments.",
+        )
+
+    def handle(self, *args, **options):
+        stub = FinnhubStubServer(latency=options["latency"]).start()
+        try:
+            for name in options["deployment"] or list(DEPLOYMENTS):
+                result = self._bench(name, stub, options)
+                summary = result.summary()
+                workers = options["workers"] if DEPLOYMENTS[name][0] is CONFIG else 1
+                cores = min(workers, os.cpu_count() or 1)
+                self.stdout.write(
+                    f"{name:>7}: {summary['rps']:8.1f} req/s  "
+                    f"{summary['rps'] / cores:8.1f} req/s per core  "
+                    f"p50 {summary['p50_ms']:8.1f} ms  "
+                    f"p95 {summary['p95_ms']:8.1f} ms  "
+                    f"errors {summary['errors']}"
+                )
+        finally:
+            stub.stop()
+
+    def _bench(self, name, stub, options):
+        args, path, extra = DEPLOYMENTS[name]
+        port = free_port()
+        env = server_env(
+            stub.base_url,
+            QUOTE_CACHE_TTL="0",
+            GUNICORN_WORKERS=str(options["workers"]),
+            **extra,
+        )
+        bind = ["--bind", f"127.0.0.1:{port}"]
+        if name == "asgi":
+            bind = [
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ]
+        server = subprocess.Popen(
+            [sys.executable, *args, *bind],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}{path}"
+        headers = host_headers()
+        try:
+            if not wait_until_ready(url, headers):
+                raise CommandError(f"Server at {url} did not start")
+            return run_load(
+                lambda session, i: session.get(
+                    url, params={"ticker": f"SYM{i}"}, headers=headers, timeout=60
+                ),
+                options["requests"],
+                options["concurrency"],
+            )
+        finally:
+            server.terminate()
+            server.wait()
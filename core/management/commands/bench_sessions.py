@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.factories import UserFactory
+from core.sessions import session_stats
+
+CONFIGS = {
+    "db": {"SESSION_ENGINE": "django.contrib.sessions.backends.db"},
+    "db-every": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "SESSION_SAVE_EVERY_REQUEST": True,
+    },
+    "cached": {"SESSION_ENGINE": "core.sessions"},
+    "cached-every": {
+        "SESSION_ENGINE": "core.sessions",
+        "SESSION_SAVE_EVERY_REQUEST": True,
+    },
+}
+
+
+def session_flow(client, user):
+    """One pass over the session-authenticated flows of core/tests.py."""
+    responses = [
+        client.get(reverse("current_user")),
+        client.get(reverse("favorite-stock-list")),
+        client.post(
+            reverse("favorite-stock-create"),
+            {"stock_symbol": "AAPL", "user": user.id},
+        ),
+        client.get(reverse("favorite-stock-list")),
+        client.patch(
+            reverse("edit_user"),
+            {"bio": "Updated bio"},
+            content_type="application/json",
+        ),
+        client.delete(reverse("favorite-stock-delete", args=["AAPL"])),
+    ]
+    for response in responses:
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{response.request['PATH_INFO']} answered {response.status_code}"
+            )
+    return len(responses)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure session-authenticated request throughput with database "
+        "sessions and with cached, write-avoiding sessions (core.sessions), "
+        "with and without SESSION_SAVE_EVERY_REQUEST. Runs in-process with "
+        "the test client; everything it writes is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--config", choices=list(CONFIGS), action="append")
+
+    def handle(self, *args, **options):
+        for name in options["config"] or CONFIGS:
+            overrides = dict(
+                CONFIGS[name], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            )
+            with override_settings(**overrides), transaction.atomic():
+                rps, session_queries = self._bench(options["iterations"])
+                transaction.set_rollback(True)
+            skipped = session_stats.snapshot()["skipped"]
+            self.stdout.write(
+                f"{name:>12}: {rps:8.1f} req/s  "
+                f"{session_queries:5.2f} session queries/request  "
+                f"saves skipped {skipped}"
+            )
+
+    def _bench(self, iterations):
+        user = UserFactory()
+        client = Client()
+        client.force_login(user)
+        session_flow(client, user)
+        session_stats.reset()
+        requests = 0
+        session_queries = 0
+
+        def count_session_queries(execute, sql, params, many, context):
+            nonlocal session_queries
+            session_queries += "django_session" in sql
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_session_queries):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                requests += session_flow(client, user)
+            elapsed = time.perf_counter() - start
+        return requests / elapsed, session_queries / requests
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from core.finnhub_stub import FinnhubStubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the fake Finnhub API until interrupted. Point FINNHUB_API_URL "
+        "of the server under test at it to load-test without real upstream "
+        "calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument(
+            "--latency", type=float, default=0.0, help="Seconds added to every call."
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of calls answered with a 500.",
+        )
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        server = FinnhubStubServer(
+            options["host"],
+            options["port"],
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"Fake Finnhub API at {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.counters}")
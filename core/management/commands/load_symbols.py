@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.symbol_index import sync_exchange
+
+
+class Command(BaseCommand):
+    help = (
+        "Load or incrementally refresh the local symbol search index from "
+        "Finnhub's symbol list. Run it from cron (e.g. daily) to keep the "
+        "index current; only new, changed and delisted symbols are written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exchange",
+            action="append",
+            help="Exchange code to load, e.g. US. May be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        for exchange in options["exchange"] or ["US"]:
+            counts = sync_exchange(exchange)
+            self.stdout.write(
+                f"{exchange}: {counts['created']} created, "
+                f"{counts['updated']} updated, {counts['deleted']} deleted"
+            )
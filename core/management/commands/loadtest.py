@@ -0,0 +1,305 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.finnhub_stub import FinnhubStubServer
+from core.loadgen import (
+    free_port,
+    host_headers,
+    run_load,
+    server_env,
+    wait_until_ready,
+)
+from core.models import User
+
+PASSWORD = "Loadtest-password-1"
+
+
+def _login(run, session, i):
+    username = run.users[i % len(run.users)]
+    # A session cookie from an earlier login would make DRF demand a CSRF
+    # token; every login here is a fresh client.
+    session.cookies.clear()
+    response = session.post(
+        run.url("login/"), json={"username": username, "password": PASSWORD}, **run.kw
+    )
+    if response.status_code == 200:
+        run.tokens[username] = response.json()["access"]
+    return response
+
+
+def _auth(run, i):
+    username = run.users[i % len(run.users)]
+    headers = dict(run.kw["headers"], Authorization=f"Bearer {run.tokens[username]}")
+    return username, dict(run.kw, headers=headers)
+
+
+def _current_user(run, session, i):
+    return session.get(run.url("user/"), **_auth(run, i)[1])
+
+
+def _favorites_create(run, session, i):
+    username, kw = _auth(run, i)
+    return session.post(
+        run.url("favorite-stocks/create/"),
+        json={"stock_symbol": f"LT{i}", "user": run.user_ids[username]},
+        **kw,
+    )
+
+
+def _favorites_list(run, session, i):
+    return session.get(run.url("favorite-stocks/"), **_auth(run, i)[1])
+
+
+def _favorites_delete(run, session, i):
+    return session.delete(run.url(f"favorite-stocks/delete/LT{i}/"), **_auth(run, i)[1])
+
+
+def _stock(path):
+    def request(run, session, i):
+        return session.get(
+            run.url(path), params={"ticker": f"SYM{i % run.symbols}"}, **run.kw
+        )
+
+    return request
+
+
+# Run in this order: logins provide the tokens, creates the favorites the
+# deletes remove.
+SCENARIOS = {
+    "login": _login,
+    "user": _current_user,
+    "favorites-create": _favorites_create,
+    "favorites-list": _favorites_list,
+    "favorites-delete": _favorites_delete,
+    "stock-price": _stock("stock-price/"),
+    "stock-data": _stock("stock-data/"),
+    "stock-profile": _stock("stock-profile/"),
+}
+
+
+class LoadRun:
+    def __init__(self, base_url, symbols):
+        self.base_url = base_url.rstrip("/")
+        self.symbols = symbols
+        self.kw = {"headers": host_headers(), "timeout": 60}
+        self.users = []
+        self.user_ids = {}
+        self.tokens = {}
+
+    def url(self, path):
+        return f"{self.base_url}/api/{path}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test login, /api/user/, favorites CRUD and the stock endpoints "
+        "against a gunicorn server started here (or --url) with the fake "
+        "Finnhub API upstream. Reports p50/p95/p99 latency and req/s per "
+        "endpoint; --save writes the results as a baseline and --baseline "
+        "compares against one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument(
+            "--symbols", type=int, default=50, help="Distinct tickers requested."
+        )
+        parser.add_argument(
+            "--scenario", choices=list(SCENARIOS), action="append", dest="scenarios"
+        )
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server. Its FINNHUB_API_URL should "
+            "point at `manage.py finnhub_stub`.",
+        )
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--latency", type=float, default=0.05, help="Fake upstream latency."
+        )
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0, help="Fake upstream error rate."
+        )
+        parser.add_argument("--save", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", help="Compare with a saved JSON file.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=10.0,
+            help="Percent change in p95 or req/s reported as a regression.",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error if any endpoint regressed.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = options["scenarios"] or list(SCENARIOS)
+        if "login" not in scenarios:
+            scenarios.insert(0, "login")
+        stub = server = None
+        if options["url"]:
+            base_url = options["url"]
+        else:
+            stub = FinnhubStubServer(
+                latency=options["latency"], error_rate=options["error_rate"], seed=0
+            ).start()
+            server, base_url = self._start_server(stub, options)
+        prefix = f"loadtest{int(time.time())}_"
+        run = LoadRun(base_url, options["symbols"])
+        try:
+            self._create_users(run, prefix, options["users"])
+            results = {}
+            for name in scenarios:
+                result = run_load(
+                    lambda session, i: SCENARIOS[name](run, session, i),
+                    options["requests"],
+                    options["concurrency"],
+                )
+                results[name] = result.summary()
+                self._report(name, results[name])
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+            if stub:
+                stub.stop()
+            User.objects.filter(username__startswith=prefix).delete()
+
+        report = {
+            "commit": self._commit(),
+            "created": timezone.now().isoformat(),
+            "options": {
+                key: options[key]
+                for key in (
+                    "requests",
+                    "concurrency",
+                    "users",
+                    "symbols",
+                    "url",
+                    "workers",
+                    "threads",
+                    "latency",
+                    "error_rate",
+                )
+            },
+            "results": results,
+        }
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}")
+        if options["baseline"]:
+            regressed = self._compare(report, options["baseline"], options["tolerance"])
+            if regressed and options["fail_on_regression"]:
+                raise CommandError(f"Regressed: {', '.join(regressed)}")
+
+    def _start_server(self, stub, options):
+        port = free_port()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                # The empty config file keeps gunicorn from loading
+                # gunicorn.conf.py from the working directory.
+                "-c",
+                os.devnull,
+                "backend.wsgi:application",
+                "--workers",
+                str(options["workers"]),
+                "--threads",
+                str(options["threads"]),
+                "--bind",
+                f"127.0.0.1:{port}",
+            ],
+            cwd=settings.BASE_DIR,
+            env=server_env(stub.base_url),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        if not wait_until_ready(f"{base_url}/metrics", host_headers()):
+            server.terminate()
+            server.wait()
+            stub.stop()
+            raise CommandError(f"Server at {base_url} did not start")
+        return server, base_url
+
+    def _create_users(self, run, prefix, count):
+        for i in range(count):
+            username = f"{prefix}{i}"
+            response = requests.post(
+                run.url("user/create/"),
+                json={
+                    "username": username,
+                    "email": f"{username}@example.com",
+                    "password": PASSWORD,
+                },
+                **run.kw,
+            )
+            if response.status_code != 201:
+                raise CommandError(
+                    f"Could not create user {username}: {response.status_code}"
+                )
+            run.users.append(username)
+            run.user_ids[username] = response.json()["id"]
+
+    def _report(self, name, summary):
+        self.stdout.write(
+            f"{name:>16}: {summary['rps']:8.1f} req/s  "
+            f"p50 {summary['p50_ms']:8.1f} ms  "
+            f"p95 {summary['p95_ms']:8.1f} ms  "
+            f"p99 {summary['p99_ms']:8.1f} ms  "
+            f"errors {summary['errors']}"
+        )
+
+    def _compare(self, report, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(
+            f"Compared with {path} (commit {baseline.get('commit') or 'unknown'}):"
+        )
+        regressed = []
+        for name, summary in report["results"].items():
+            before = baseline["results"].get(name)
+            if not before:
+                continue
+            rps = self._change(before["rps"], summary["rps"])
+            p95 = self._change(before["p95_ms"], summary["p95_ms"])
+            worse = rps < -tolerance or p95 > tolerance
+            if worse:
+                regressed.append(name)
+            self.stdout.write(
+                f"{name:>16}: req/s {rps:+7.1f}%  p95 {p95:+7.1f}%"
+                + ("  REGRESSION" if worse else "")
+            )
+        return regressed
+
+    @staticmethod
+    def _change(before, after):
+        return (after - before) / before * 100 if before else 0.0
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
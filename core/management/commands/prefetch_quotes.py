@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import is_process_local
+from core.prefetch import prefetch_quotes, run_prefetcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep quotes for the most-favorited symbols warm in the cache, "
+        "refreshing them shortly before QUOTE_CACHE_TTL runs out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Run a single round and exit."
+        )
+        parser.add_argument("--limit", type=int, help="Symbols to keep warm.")
+        parser.add_argument("--interval", type=float, help="Seconds between rounds.")
+
+    def handle(self, *args, **options):
+        if is_process_local():
+            # Quotes would only be warmed in this process' own memory, at the
+            # cost of upstream quota.
+            raise CommandError(
+                "The default cache is local to this process, so the web "
+                "workers would not see the prefetched quotes. Set "
+                "CACHE_BACKEND to a shared cache, or use QUOTE_PREFETCH_THREAD=1 "
+                "to prefetch inside each worker."
+            )
+        if options["once"]:
+            refreshed = prefetch_quotes(options["limit"])
+            self.stdout.write(f"Refreshed {refreshed} quotes")
+            return
+        run_prefetcher(options["interval"], options["limit"])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.alerts import run_alert_engine
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the price alert worker: keeps active alerts in an in-memory "
+        "index and checks every fresh quote in the cache against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Seconds between rounds.")
+        parser.add_argument(
+            "--reload-interval",
+            type=float,
+            help="Seconds between reloads of active alerts from the database.",
+        )
+
+    def handle(self, *args, **options):
+        run_alert_engine(options["interval"], options["reload_interval"])
@@ -0,0 +1,431 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .profiling import record_upstream
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; Prometheus' client defaults.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    "http_requests_total": ("counter", "Requests served, by view and status."),
+    "http_request_duration_seconds": (
+        "histogram",
+        "Time to produce a response (to the first chunk for streams), by view.",
+    ),
+    "db_queries_total": ("counter", "Database queries run, by view."),
+    "db_query_seconds_total": ("counter", "Time spent in database queries, by view."),
+    "upstream_request_duration_seconds": (
+        "histogram",
+        "Finnhub call latency, by client method and outcome.",
+    ),
+    "cache_requests_total": ("counter", "Cache lookups, by cache and outcome."),
+    "upstream_throttle_total": ("counter", "Upstream rate limiter decisions."),
+    "db_pool_requests_total": ("counter", "Connections requested from the pool."),
+    "db_pool_requests_queued_total": (
+        "counter",
+        "Pool requests that had to wait for a connection.",
+    ),
+    "db_pool_wait_seconds_total": (
+        "counter",
+        "Time spent waiting for a pooled connection.",
+    ),
+    "db_pool_errors_total": ("counter", "Pool requests that timed out or failed."),
+    "db_pool_connections_total": ("counter", "Connections opened by the pool."),
+    "db_pool_size": ("gauge", "Connections currently held by the pool."),
+    "db_pool_available": ("gauge", "Idle connections in the pool."),
+    "db_pool_waiting": ("gauge", "Requests waiting for a connection right now."),
+}
+
+# Totals of exited processes, in METRICS_DIR.
+RETIRED = "metrics-retired.json"
+
+# [queries, seconds] for the request being served, if any.
+_request_db = ContextVar("request_db", default=None)
+
+
+class Registry:
+    """Per-process counters and histograms, keyed by name and label values.
+
+    Every value is a running total since the process started. With
+    METRICS_DIR set, each process writes a snapshot of its totals to its own
+    file there at most every METRICS_FLUSH_INTERVAL seconds, and a scrape
+    sums the files of all workers. The file of an exited worker is folded
+    into one file of retired totals, so totals never go backwards while the
+    directory stays small; its gauges are dropped. The directory should be
+    emptied when the server (re)starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        bucket = bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            entry[bucket] += 1
+            entry[-1] += value
+
+    def snapshot(self):
+        """Totals as JSON-friendly rows, including the cache counters."""
+        with self._lock:
+            counters = [[n, list(l), v] for (n, l), v in self._counters.items()]
+            histograms = [
+                [n, list(l), list(v)] for (n, l), v in self._histograms.items()
+            ]
+        counters += _collected_counters()
+        pool_counters, gauges = _pool_stats()
+        return {
+            "counters": counters + pool_counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _path(self):
+        return os.path.join(settings.METRICS_DIR, f"metrics-{os.getpid()}.json")
+
+    def flush(self, force=False):
+        """Write this process' snapshot to METRICS_DIR when one is due."""
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        # Requests finishing together need only one of them to write.
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._flushed_at = now
+            path = self._path()
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def retire(self, pid):
+        """Fold the snapshot of exited process ``pid`` into the retired totals."""
+        with _directory_lock():
+            _retire(pid)
+
+    def collect(self):
+        """Snapshots of all workers, or of this process without METRICS_DIR."""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        # Locked so that no worker is retired halfway through, which would
+        # count it twice or not at all.
+        with _directory_lock():
+            for name in os.listdir(settings.METRICS_DIR):
+                if name == RETIRED or not (
+                    name.startswith("metrics-") and name.endswith(".json")
+                ):
+                    continue
+                try:
+                    pid = int(name[len("metrics-") : -len(".json")])
+                    if not _alive(pid):
+                        # Normally done by gunicorn's child_exit hook.
+                        _retire(pid)
+                        continue
+                    with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping metrics snapshot {name}: {e}")
+            try:
+                with open(os.path.join(settings.METRICS_DIR, RETIRED)) as f:
+                    retired = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping retired metrics: {e}")
+            else:
+                snapshots.append(retired)
+        return snapshots
+
+
+registry = Registry()
+
+
+def _collected_counters():
+    from .cache import lookup_cache, profile_cache, quote_stats
+    from .sessions import session_stats
+    from .throttle import upstream_bucket
+    from .user_cache import user_stats
+
+    caches = {
+        "quote": quote_stats,
+        "profile": profile_cache.stats,
+        "lookup": lookup_cache.stats,
+        "user": user_stats,
+        "session": session_stats,
+    }
+    rows = [
+        ["cache_requests_total", [["cache", cache], ["outcome", outcome]], value]
+        for cache, stats in caches.items()
+        for outcome, value in stats.snapshot().items()
+    ]
+    rows += [
+        ["upstream_throttle_total", [["outcome", outcome]], value]
+        for outcome, value in upstream_bucket.stats.snapshot().items()
+    ]
+    return rows
+
+
+@contextmanager
+def _directory_lock():
+    with open(os.path.join(settings.METRICS_DIR, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire(pid):
+    path = os.path.join(settings.METRICS_DIR, f"metrics-{pid}.json")
+    retired_path = os.path.join(settings.METRICS_DIR, RETIRED)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.warning(f"Dropping metrics snapshot of process {pid}: {e}")
+        os.remove(path)
+        return
+    # Gauges describe live processes only.
+    snapshots = [dict(snapshot, gauges=[])]
+    if os.path.exists(retired_path):
+        with open(retired_path) as f:
+            snapshots.append(json.load(f))
+    counters, histograms = merge(snapshots)
+    tmp = f"{retired_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"counters": _rows(counters), "histograms": _rows(histograms)}, f)
+    os.replace(tmp, retired_path)
+    os.remove(path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _db_pools():
+    """``(alias, pool)`` for each database using a psycopg connection pool."""
+    return [
+        (alias, connections[alias].pool)
+        for alias in connections
+        if connections.settings[alias]["OPTIONS"].get("pool")
+    ]
+
+
+def _pool_stats():
+    """Pool counter and gauge rows; psycopg omits statistics still at 0."""
+    counters, gauges = [], []
+    for alias, pool in _db_pools():
+        stats = pool.get_stats()
+        labels = [["database", alias]]
+        for name, key, scale in (
+            ("db_pool_requests_total", "requests_num", 1),
+            ("db_pool_requests_queued_total", "requests_queued", 1),
+            ("db_pool_wait_seconds_total", "requests_wait_ms", 1000),
+            ("db_pool_errors_total", "requests_errors", 1),
+            ("db_pool_connections_total", "connections_num", 1),
+        ):
+            counters.append([name, labels, stats.get(key, 0) / scale])
+        for name, key in (
+            ("db_pool_size", "pool_size"),
+            ("db_pool_available", "pool_available"),
+            ("db_pool_waiting", "requests_waiting"),
+        ):
+            gauges.append([name, labels, stats.get(key, 0)])
+    return counters, gauges
+
+
+def _labels(pairs):
+    return tuple(tuple(pair) for pair in pairs)
+
+
+def _rows(merged):
+    """Snapshot rows from a dict returned by merge()."""
+    return [[n, [list(pair) for pair in l], v] for (n, l), v in merged.items()]
+
+
+def merge(snapshots):
+    """Sum snapshots into ``(counters, histograms)`` dicts.
+
+    Gauges are summed too, into ``counters``: over workers, the number of
+    pooled connections (say) is the sum of each worker's.
+    """
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"] + snapshot.get("gauges", []):
+            key = (name, _labels(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, _labels(labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render(snapshots):
+    """Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = merge(snapshots)
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        if kind in ("counter", "gauge"):
+            series = sorted((l, v) for (n, l), v in counters.items() if n == name)
+        else:
+            series = sorted((l, v) for (n, l), v in histograms.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), value[:-1]):
+                cumulative += count
+                le = _format_labels(labels + (("le", bound),))
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding a query to the current request's DB totals."""
+    totals = _request_db.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - start
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def observe_upstream(method, seconds, error=None):
+    outcome = "ok" if error is None else "error"
+    registry.observe(
+        "upstream_request_duration_seconds",
+        (("method", method), ("outcome", outcome)),
+        seconds,
+    )
+    record_upstream(method, seconds, outcome)
+
+
+class MetricsMiddleware:
+    """Record latency, status and database work of every request by view.
+
+    Views are labelled by URL name, so label sets stay bounded whatever
+    paths clients send. Queries are counted by an execute wrapper installed
+    on each database connection; queries run from ``sync_to_async`` threads
+    are attributed to the request too, as the totals travel in a context
+    variable.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._record(request, response, time.perf_counter() - start, totals)
+        return response
+
+    async def __acall__(self, request):
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._record(request, response, time.perf_counter() - start, totals)
+        return response
+
+    def _record(self, request, response, seconds, totals):
+        match = request.resolver_match
+        view = (("view", match.view_name if match else "unmatched"),)
+        registry.inc(
+            "http_requests_total",
+            view + (("method", request.method), ("status", response.status_code)),
+        )
+        registry.observe("http_request_duration_seconds", view, seconds)
+        if totals[0]:
+            registry.inc("db_queries_total", view, totals[0])
+            registry.inc("db_query_seconds_total", view, totals[1])
+        registry.flush()
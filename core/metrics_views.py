@@ -0,0 +1,47 @@
+import hmac
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+
+from .authentication import get_bearer_token, is_staff_request
+from .metrics import registry, render
+
+
+def _from_loopback(request):
+    try:
+        return ipaddress.ip_address(request.META.get("REMOTE_ADDR", "")).is_loopback
+    except ValueError:
+        return False
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint; totals are summed over all workers.
+
+    With METRICS_TOKEN set, scrapes must send it as a bearer token. Without
+    it only local scrapes and staff get the metrics.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def perform_authentication(self, request):
+        # Leave the session user from AuthenticationMiddleware in place for
+        # the staff check.
+        pass
+
+    def get(self, request, *args, **kwargs):
+        if settings.METRICS_TOKEN:
+            allowed = hmac.compare_digest(
+                get_bearer_token(request) or "", settings.METRICS_TOKEN
+            )
+        else:
+            allowed = _from_loopback(request) or is_staff_request(request._request)
+        if not allowed:
+            return HttpResponse(status=403)
+        return HttpResponse(
+            render(registry.collect()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
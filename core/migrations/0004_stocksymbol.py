@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-18 16:48
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# Search indexes only PostgreSQL understands: a pattern_ops btree for symbol
+# prefix queries and trigram GIN indexes for substring and fuzzy matching.
+SEARCH_INDEXES = [
+    "CREATE INDEX core_stocksymbol_symbol_prefix "
+    "ON core_stocksymbol (symbol varchar_pattern_ops)",
+    "CREATE INDEX core_stocksymbol_symbol_trgm "
+    "ON core_stocksymbol USING gin (symbol gin_trgm_ops)",
+    "CREATE INDEX core_stocksymbol_description_trgm "
+    "ON core_stocksymbol USING gin (UPPER(description) gin_trgm_ops)",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in SEARCH_INDEXES:
+            schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in SEARCH_INDEXES:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {sql.split()[2]}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0003_alter_favoritestock_unique_together"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name="StockSymbol",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=32, unique=True)),
+                ("display_symbol", models.CharField(max_length=32)),
+                ("description", models.CharField(blank=True, max_length=255)),
+                ("type", models.CharField(blank=True, max_length=64)),
+                ("exchange", models.CharField(max_length=16)),
+                ("updated_on", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["exchange"], name="core_stocks_exchang_4b8bce_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
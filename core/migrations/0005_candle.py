@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+# Bars are appended in time order, so a BRIN index on ts stays tiny while
+# still letting PostgreSQL skip most of the table for time-range scans.
+BRIN_INDEX = "CREATE INDEX core_candle_ts_brin ON core_candle USING brin (ts)"
+
+
+def create_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(BRIN_INDEX)
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_candle_ts_brin")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_stocksymbol"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Candle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=32)),
+                ("ts", models.DateTimeField()),
+                ("open", models.FloatField()),
+                ("high", models.FloatField()),
+                ("low", models.FloatField()),
+                ("close", models.FloatField()),
+                ("volume", models.BigIntegerField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("symbol", "ts"), name="candle_symbol_ts"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="CandleRange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=32)),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["symbol", "start"], name="core_candle_symbol_e63fd8_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_candle"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=10)),
+                (
+                    "direction",
+                    models.CharField(
+                        choices=[("above", "Above"), ("below", "Below")], max_length=5
+                    ),
+                ),
+                ("threshold", models.DecimalField(decimal_places=4, max_digits=12)),
+                ("is_active", models.BooleanField(default=True)),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("triggered_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "triggered_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=4, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "favorite",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alerts",
+                        to="core.favoritestock",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_alerts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("is_active", True)),
+                        fields=["symbol"],
+                        name="pricealert_active_symbol",
+                    )
+                ],
+            },
+        ),
+    ]
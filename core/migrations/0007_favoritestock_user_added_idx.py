@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_pricealert"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="favoritestock",
+            index=models.Index(
+                fields=["user", "-added_on", "-id"], name="favorite_user_added_idx"
+            ),
+        ),
+    ]
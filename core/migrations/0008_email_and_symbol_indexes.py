@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 17:03
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    duplicates = list(
+        User.objects.exclude(email="")
+        .values(key=Upper("email"))
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("key", flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Emails must be unique regardless of case before this migration "
+            "can add the constraint. Merge or change the accounts sharing "
+            f"these emails, then migrate again: {', '.join(sorted(duplicates))}"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("core", "0007_favoritestock_user_added_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="favoritestock",
+            index=models.Index(
+                django.db.models.functions.text.Upper("stock_symbol"),
+                name="favorite_symbol_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Upper("email"),
+                name="user_email_upper_idx",
+            ),
+        ),
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Upper("email"),
+                condition=models.Q(("email", ""), _negated=True),
+                name="user_email_ci_unique",
+            ),
+        ),
+    ]
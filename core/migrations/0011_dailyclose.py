@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=32, unique=True)),
+                ("fetched_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyClose",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=32)),
+                ("day", models.DateField()),
+                ("close", models.FloatField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("symbol", "day"), name="daily_close_symbol_day"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
 import requests
 
 
@@ -14,6 +15,31 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
+        # Emails are unique regardless of case; users without one (e.g. some
+        # social-auth accounts) are left out. The planner cannot use that
+        # partial index for plain email__iexact lookups, hence the second one.
+        constraints = [
+            models.UniqueConstraint(
+                Upper("email"),
+                condition=~models.Q(email=""),
+                name="user_email_ci_unique",
+            )
+        ]
+        indexes = [models.Index(Upper("email"), name="user_email_upper_idx")]
+
+
+class TokenUser(User):
+    """A user rebuilt from access token claims, without a database query.
+
+    Only the fields carried in the token are set, so it must never be
+    saved; load the User to change it.
+    """
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError("TokenUser is read-only; load the User to change it")
 
 
 class FavoriteStock(models.Model):
@@ -28,6 +54,158 @@ class FavoriteStock(models.Model):
             "user",
             "stock_symbol",
         )  # Ensure uniqueness for user and stock_symbol
+        # Serves the newest-first, keyset-paginated favorites list.
+        indexes = [
+            models.Index(
+                fields=["user", "-added_on", "-id"], name="favorite_user_added_idx"
+            ),
+            # Per-symbol favorite counts (popular symbols) group by this.
+            models.Index(Upper("stock_symbol"), name="favorite_symbol_upper_idx"),
+        ]
 
     def __str__(self):
         return self.stock_symbol
+
+
+class StockSymbol(models.Model):
+    """Local copy of Finnhub's symbol list, searched instead of symbol_lookup."""
+
+    symbol = models.CharField(max_length=32, unique=True)
+    display_symbol = models.CharField(max_length=32)
+    description = models.CharField(max_length=255, blank=True)
+    type = models.CharField(max_length=64, blank=True)
+    exchange = models.CharField(max_length=16)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["exchange"])]
+
+    def __str__(self):
+        return self.symbol
+
+
+class Candle(models.Model):
+    """One-minute OHLCV bar; coarser resolutions are aggregated on read."""
+
+    symbol = models.CharField(max_length=32)
+    ts = models.DateTimeField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["symbol", "ts"], name="candle_symbol_ts")
+        ]
+
+
+class CandleRange(models.Model):
+    """A span of time whose candles have been fetched for a symbol.
+
+    Recorded even when the upstream had no bars (nights, weekends), so those
+    spans are not fetched again.
+    """
+
+    symbol = models.CharField(max_length=32)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["symbol", "start"])]
+
+
+class DailyClose(models.Model):
+    """Closing price of a symbol on one trading day, for favorites analytics."""
+
+    symbol = models.CharField(max_length=32)
+    day = models.DateField()
+    close = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["symbol", "day"], name="daily_close_symbol_day"
+            )
+        ]
+
+
+class DailySeries(models.Model):
+    """When a symbol's daily closes were last fetched from the upstream."""
+
+    symbol = models.CharField(max_length=32, unique=True)
+    fetched_at = models.DateTimeField()
+
+
+class PriceAlert(models.Model):
+    """Notify the user once when a favorite's price crosses a threshold."""
+
+    ABOVE = "above"
+    BELOW = "below"
+    DIRECTION_CHOICES = [(ABOVE, "Above"), (BELOW, "Below")]
+
+    user = models.ForeignKey(
+        "User", related_name="price_alerts", on_delete=models.CASCADE
+    )
+    favorite = models.ForeignKey(
+        "FavoriteStock", related_name="alerts", on_delete=models.CASCADE
+    )
+    symbol = models.CharField(max_length=10)
+    direction = models.CharField(max_length=5, choices=DIRECTION_CHOICES)
+    threshold = models.DecimalField(max_digits=12, decimal_places=4)
+    is_active = models.BooleanField(default=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_price = models.DecimalField(
+        max_digits=12, decimal_places=4, null=True, blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["symbol"],
+                condition=models.Q(is_active=True),
+                name="pricealert_active_symbol",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.direction} {self.threshold}"
+
+
+class RequestProfile(models.Model):
+    """cProfile output and SQL log captured for one request.
+
+    Written by ProfilingMiddleware for requests sent by staff with an
+    ``X-Profile`` header or picked by REQUEST_PROFILE_SAMPLE_RATE.
+    """
+
+    HEADER = "header"
+    SAMPLE = "sample"
+    TRIGGER_CHOICES = [(HEADER, "Header"), (SAMPLE, "Sample")]
+
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey("User", null=True, blank=True, on_delete=models.SET_NULL)
+    trigger = models.CharField(max_length=6, choices=TRIGGER_CHOICES)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    # [{"sql": ..., "ms": ...}], in execution order.
+    queries = models.JSONField(default=list)
+    # [{"method": ..., "ms": ..., "outcome": ...}] for Finnhub calls.
+    upstream = models.JSONField(default=list)
+    # pstats report, sorted by cumulative time.
+    profile = models.TextField(blank=True)
+    # Raw stats in the format of cProfile's dump_stats (.prof).
+    stats = models.BinaryField(blank=True)
+
+    class Meta:
+        ordering = ["-created_on"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
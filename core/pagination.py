@@ -0,0 +1,116 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on the view's ordering plus ``id`` as a tiebreaker.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    uses an OFFSET to step over ties. Here the cursor holds the whole key of
+    the boundary row, so every page is a range scan on a matching index,
+    e.g. ``WHERE (added_on, id) < (x, y) ORDER BY added_on DESC, id DESC
+    LIMIT n``, and no COUNT(*) is issued. Rows added while a client pages
+    through do not shift later pages.
+
+    Clients that send ``?page=`` keep getting page-number pagination; a view
+    can also opt out by setting ``pagination_class``.
+    """
+
+    ordering = ("-id",)
+    page_query_param = "page"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_paginator = None
+        if self.page_query_param in request.query_params:
+            self.page_number_paginator = PageNumberPagination()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [f[1:] if f.startswith("-") else f"-{f}" for f in ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor and self.cursor.position is not None:
+            queryset = queryset.filter(
+                self.after(queryset.model, self.cursor.position, reverse)
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        if not self.page:
+            self.has_next = self.has_previous = False
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by or super().get_ordering(
+            request, queryset, view
+        )
+        ordering = tuple(ordering)
+        if not any(f.lstrip("-") == "id" for f in ordering):
+            tiebreak = "-id" if ordering[-1].startswith("-") else "id"
+            ordering += (tiebreak,)
+        return ordering
+
+    def key(self, instance):
+        return json.dumps(
+            [str(getattr(instance, f.lstrip("-"))) for f in self.ordering]
+        )
+
+    def after(self, model, position, reverse):
+        """Rows past ``position`` in (possibly reversed) ordering order."""
+        try:
+            values = json.loads(position)
+            fields = [f.lstrip("-") for f in self.ordering]
+            values = [
+                model._meta.get_field(f).to_python(v) for f, v in zip(fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        condition, equal = Q(), {}
+        for field, name, value in zip(self.ordering, fields, values):
+            lookup = "lt" if field.startswith("-") != reverse else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.key(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.key(self.page[0]))
+        )
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.page_number_paginator:
+            return self.page_number_paginator.get_html_context()
+        return super().get_html_context()
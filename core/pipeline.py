@@ -0,0 +1,23 @@
+from django.db import IntegrityError, transaction
+from social_core.exceptions import AuthException
+from social_core.pipeline import user as social_user
+
+
+class EmailInUse(AuthException):
+    def __str__(self):
+        return "An account with this email address already exists."
+
+
+def create_user(strategy, details, backend, user=None, *args, **kwargs):
+    """social_core's create_user, failing cleanly on a taken email address.
+
+    Emails are unique regardless of case, so a provider account whose email
+    matches an existing user's cannot get an account of its own.
+    """
+    try:
+        with transaction.atomic():
+            return social_user.create_user(
+                strategy, details, backend, user, *args, **kwargs
+            )
+    except IntegrityError as e:
+        raise EmailInUse(backend) from e
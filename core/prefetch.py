@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+from .cache import quote_age, refresh_quote
+from .models import FavoriteStock
+from .throttle import UpstreamThrottled, background_priority
+
+logger = logging.getLogger(__name__)
+
+
+def popular_symbols(limit):
+    """Most-favorited symbols, most popular first, in one aggregate query."""
+    return list(
+        FavoriteStock.objects.annotate(symbol=Upper("stock_symbol"))
+        .values("symbol")
+        .annotate(favorites=Count("id"))
+        .order_by("-favorites", "symbol")
+        .values_list("symbol", flat=True)[:limit]
+    )
+
+
+def needs_refresh(symbol):
+    age = quote_age(symbol)
+    return (
+        age is None or age >= settings.QUOTE_CACHE_TTL - settings.QUOTE_PREFETCH_MARGIN
+    )
+
+
+def prefetch_quotes(limit=None):
+    """Refresh cached quotes of popular symbols that are about to expire.
+
+    Runs at background priority and stops at the first throttled call, so
+    it never eats into the budget kept for user-facing requests. Returns
+    the number of quotes refreshed.
+    """
+    refreshed = 0
+    with background_priority():
+        for symbol in popular_symbols(limit or settings.QUOTE_PREFETCH_LIMIT):
+            if not needs_refresh(symbol):
+                continue
+            try:
+                refresh_quote(symbol)
+            except UpstreamThrottled:
+                logger.info("Quote prefetch paused: upstream rate budget exhausted")
+                break
+            except Exception as e:
+                logger.warning(f"Quote prefetch for {symbol} failed: {e}")
+            else:
+                refreshed += 1
+    return refreshed
+
+
+def run_prefetcher(interval=None, limit=None, stop=None):
+    """Call ``prefetch_quotes`` every ``interval`` seconds until ``stop`` is set."""
+    stop = stop or threading.Event()
+    interval = interval or settings.QUOTE_PREFETCH_INTERVAL
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            prefetch_quotes(limit)
+        except Exception as e:
+            logger.error(f"Quote prefetch round failed: {e}")
+        finally:
+            close_old_connections()
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+def start_prefetch_thread():
+    thread = threading.Thread(
+        target=run_prefetcher, name="quote-prefetcher", daemon=True
+    )
+    thread.start()
+    return thread
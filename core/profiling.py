@@ -0,0 +1,209 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .authentication import is_staff_request
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HTTP_X_PROFILE"
+
+# The Capture of the request being profiled, if any.
+_capture = ContextVar("profile_capture", default=None)
+# Held while a capture runs. Since Python 3.12 cProfile profiles every
+# thread, so a second capture in the process could not start.
+_profiling = threading.Lock()
+
+
+class Capture:
+    """What is recorded while one request is profiled."""
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.upstream = []
+        self._lock = threading.Lock()
+        self.profiler = cProfile.Profile()
+
+    def add_query(self, sql, seconds):
+        # Fan-out threads share the capture with the request thread.
+        with self._lock:
+            self.query_count += 1
+            self.query_seconds += seconds
+            if len(self.queries) < settings.REQUEST_PROFILE_MAX_QUERIES:
+                self.queries.append({"sql": sql, "ms": round(seconds * 1000, 3)})
+
+    def add_upstream(self, method, seconds, outcome):
+        with self._lock:
+            self.upstream.append(
+                {"method": method, "ms": round(seconds * 1000, 3), "outcome": outcome}
+            )
+
+    def start(self):
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler is running, e.g. a debugger's. Keep the SQL
+            # log only.
+            self.profiler = None
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def report(self):
+        """``(text report, raw stats)`` of the profiler, empty if it never ran."""
+        if self.profiler is None:
+            return "", b""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(settings.REQUEST_PROFILE_LINES)
+        self.profiler.create_stats()
+        return stream.getvalue(), marshal.dumps(self.profiler.stats)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding queries to the profiled request's SQL log."""
+    capture = _capture.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        capture.add_query(sql, time.perf_counter() - start)
+
+
+def record_upstream(method, seconds, outcome):
+    capture = _capture.get()
+    if capture is not None:
+        capture.add_upstream(method, seconds, outcome)
+
+
+def _trigger(request):
+    """Why to profile the request, or None.
+
+    The staff check for the header runs before the view, so nobody else can
+    make a worker pay for profiling.
+    """
+    if HEADER in request.META:
+        return RequestProfile.HEADER if is_staff_request(request) else None
+    rate = settings.REQUEST_PROFILE_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return RequestProfile.SAMPLE
+    return None
+
+
+def _build(request, response, capture, seconds):
+    """The RequestProfile to store."""
+    user = getattr(request, "user", None)
+    profile, stats = capture.report()
+    match = request.resolver_match
+    return RequestProfile(
+        user_id=user.pk if user and user.is_authenticated else None,
+        trigger=capture.trigger,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        view_name=match.view_name if match else "",
+        status_code=response.status_code,
+        duration_ms=seconds * 1000,
+        query_count=capture.query_count,
+        query_ms=capture.query_seconds * 1000,
+        queries=capture.queries,
+        upstream=capture.upstream,
+        profile=profile,
+        stats=stats,
+    )
+
+
+def _store(request, response, capture, seconds):
+    profile = _build(request, response, capture, seconds)
+    try:
+        profile.save()
+        RequestProfile.objects.filter(
+            pk__lte=profile.pk - settings.REQUEST_PROFILE_KEEP
+        ).delete()
+    except Exception as e:
+        logger.error(f"Could not store request profile: {e}")
+        return
+    if profile.trigger == RequestProfile.HEADER:
+        response["X-Profile-Id"] = str(profile.pk)
+
+
+class ProfilingMiddleware:
+    """Profile requests on demand and store the result as a RequestProfile.
+
+    A request is profiled when it carries an ``X-Profile`` header and comes
+    from a staff user, or when picked at REQUEST_PROFILE_SAMPLE_RATE. The
+    capture holds a cProfile report of the view (upstream helpers included)
+    and the queries it ran; staff get its id back in ``X-Profile-Id``.
+    Other requests only pay for the header check. Only the most recent
+    REQUEST_PROFILE_KEEP captures are kept.
+
+    One capture runs per process at a time; requests triggering another
+    meanwhile are served unprofiled. cProfile sees every thread, so the
+    report of a threaded worker also includes whatever its other threads
+    ran during the request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trigger = _trigger(request)
+        if trigger is None or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        capture = Capture(trigger)
+        token = _capture.set(capture)
+        start = time.perf_counter()
+        capture.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            capture.stop()
+            _capture.reset(token)
+            _profiling.release()
+        _store(request, response, capture, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if HEADER in request.META:
+            trigger = await sync_to_async(_trigger)(request)
+        else:
+            trigger = _trigger(request)
+        if trigger is None or not _profiling.acquire(blocking=False):
+            return await self.get_response(request)
+        capture = Capture(trigger)
+        token = _capture.set(capture)
+        start = time.perf_counter()
+        capture.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            capture.stop()
+            _capture.reset(token)
+            _profiling.release()
+        await sync_to_async(_store)(
+            request, response, capture, time.perf_counter() - start
+        )
+        return response
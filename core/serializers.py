@@ -1,5 +1,23 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import FavoriteStock, User
+from .models import FavoriteStock, PriceAlert, User
+
+EMAIL_CONSTRAINT = "user_email_ci_unique"
+
+
+def _save_user(save):
+    """Run ``save``, reporting a concurrent duplicate email as a 400.
+
+    validate_email only catches duplicates that existed when the request was
+    validated; the database constraint catches the rest.
+    """
+    try:
+        with transaction.atomic():
+            return save()
+    except IntegrityError as e:
+        if EMAIL_CONSTRAINT in str(e):
+            raise serializers.ValidationError({"email": "Email already exists"})
+        raise
 
 
 class FavoriteStockSerializer(serializers.ModelSerializer):
@@ -9,6 +27,67 @@ class FavoriteStockSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "added_on"]
 
 
+class FavoriteStockQuoteSerializer(FavoriteStockSerializer):
+    """A favorite enriched with the quote and profile maps passed in context."""
+
+    quote = serializers.SerializerMethodField()
+    profile = serializers.SerializerMethodField()
+
+    class Meta(FavoriteStockSerializer.Meta):
+        fields = FavoriteStockSerializer.Meta.fields + ["quote", "profile"]
+
+    def get_quote(self, obj):
+        return self.context["quotes"].get(obj.stock_symbol.upper())
+
+    def get_profile(self, obj):
+        return self.context["profiles"].get(obj.stock_symbol.upper())
+
+
+class PriceAlertSerializer(serializers.ModelSerializer):
+    stock_symbol = serializers.CharField(write_only=True, max_length=10)
+
+    class Meta:
+        model = PriceAlert
+        fields = [
+            "id",
+            "stock_symbol",
+            "symbol",
+            "direction",
+            "threshold",
+            "is_active",
+            "created_on",
+            "triggered_at",
+            "triggered_price",
+        ]
+        read_only_fields = [
+            "id",
+            "symbol",
+            "is_active",
+            "created_on",
+            "triggered_at",
+            "triggered_price",
+        ]
+
+    def validate_threshold(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Threshold must be positive")
+        return value
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        favorite = FavoriteStock.objects.filter(
+            user=user, stock_symbol__iexact=attrs.pop("stock_symbol").strip()
+        ).first()
+        if favorite is None:
+            raise serializers.ValidationError(
+                {"stock_symbol": "Alerts can only be set on favorite stocks"}
+            )
+        attrs["user"] = user
+        attrs["favorite"] = favorite
+        attrs["symbol"] = favorite.stock_symbol.upper()
+        return attrs
+
+
 class UserSerializer(serializers.ModelSerializer):
     birth_date = serializers.DateField(
         format="%Y/%m/%d", input_formats=["%Y/%m/%d"], required=False, allow_null=True
@@ -31,6 +110,18 @@ class UserSerializer(serializers.ModelSerializer):
             "profile_picture",
         ]
 
+    def validate_email(self, value):
+        others = User.objects.filter(email__iexact=value)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("Email already exists")
+        return value
+
+    def update(self, instance, validated_data):
+        update = super().update
+        return _save_user(lambda: update(instance, validated_data))
+
 
 class CreateUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -41,12 +132,12 @@ class CreateUserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         email = validated_data.get("email")
-        if User.objects.filter(email=email).exists():
+        if User.objects.filter(email__iexact=email).exists():
             raise serializers.ValidationError("Email already exists")
         groups = validated_data.pop("groups", None)
         user_permissions = validated_data.pop("user_permissions", None)
 
-        user = User.objects.create_user(**validated_data)
+        user = _save_user(lambda: User.objects.create_user(**validated_data))
         user.is_active = True
         user.save()
         if groups:
@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+from .stats import Counters
+
+# When the session was last written, kept in the session itself so a
+# request can tell whether the stored expiry needs pushing forward.
+SAVED_AT_KEY = "_session_saved_at"
+
+session_stats = Counters("saved", "skipped")
+
+
+class SessionStore(CachedDBStore):
+    """Cached database sessions that skip saves which change nothing.
+
+    Reads come from the SESSION_CACHE_ALIAS cache and only fall back to the
+    database on a miss. Django saves a session whenever it is marked
+    modified, even if a view wrote back the values it already held, and on
+    every request with SESSION_SAVE_EVERY_REQUEST. Here such a save is
+    skipped when the data is the same as when it was loaded, unless the
+    last write is more than SESSION_TOUCH_INTERVAL seconds old; sliding
+    expiry then lags by at most that interval.
+    """
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded = None
+
+    def _fingerprint(self, data):
+        return self.serializer().dumps(
+            {k: v for k, v in data.items() if k != SAVED_AT_KEY}
+        )
+
+    def load(self):
+        data = super().load()
+        self._loaded = self._fingerprint(data)
+        return data
+
+    def _unchanged(self):
+        data = getattr(self, "_session_cache", None)
+        return (
+            self.session_key is not None
+            and data is not None
+            and self._loaded is not None
+            and self._fingerprint(data) == self._loaded
+            and time.time() - data.get(SAVED_AT_KEY, 0)
+            < settings.SESSION_TOUCH_INTERVAL
+        )
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not must_create and self._unchanged():
+            session_stats.incr("skipped")
+            return
+        self._session[SAVED_AT_KEY] = int(time.time())
+        super().save(must_create)
+        self._loaded = self._fingerprint(self._session)
+        session_stats.incr("saved")
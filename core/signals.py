@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import instrument_connection
+from .models import User
+from .profiling import record_query
+from .user_cache import invalidate_user_payload
+
+
+def _invalidate(user_ids):
+    # Once now and once the change is committed, so a request that reads the
+    # old row in between cannot cache it for long.
+    for user_id in user_ids:
+        invalidate_user_payload(user_id)
+    transaction.on_commit(lambda: [invalidate_user_payload(i) for i in user_ids])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    _invalidate([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_cache_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _invalidate([instance.pk])
+    elif pk_set:
+        _invalidate(list(pk_set))
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
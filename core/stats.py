@@ -0,0 +1,22 @@
+import threading
+
+
+class Counters:
+    """Thread-safe in-process counters."""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(names, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._values[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            for name in self._values:
+                self._values[name] = 0
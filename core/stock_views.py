@@ -1,11 +1,72 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from rest_framework.permissions import IsAdminUser
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_503_SERVICE_UNAVAILABLE,
+)
 import logging
-from .utils import get_stock_data, get_stock_price_data, get_stock_profile
+import math
+import time
+from datetime import timedelta
+from django.conf import settings
+from .cache import (
+    get_cached_quote,
+    get_cached_quotes,
+    quote_stats,
+    profile_cache,
+    lookup_cache,
+)
+from .breaker import CircuitOpen, breaker_states
+from .candles import (
+    RESOLUTIONS,
+    from_epoch,
+    backfill_candles,
+    get_candles,
+    max_range_days,
+)
+from .models import StockSymbol
+from .symbol_index import as_lookup_response, search_symbols
+from .throttle import UpstreamThrottled, upstream_bucket
 
 logger = logging.getLogger(__name__)
 
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+def upstream_error(e):
+    """Return ``(message, status, retry_after)`` describing a failed lookup."""
+    if isinstance(e, UpstreamThrottled):
+        return (
+            "Upstream rate limit reached, try again shortly",
+            HTTP_429_TOO_MANY_REQUESTS,
+            math.ceil(e.retry_after),
+        )
+    if isinstance(e, CircuitOpen):
+        return (
+            "Stock data is temporarily unavailable",
+            HTTP_503_SERVICE_UNAVAILABLE,
+            math.ceil(e.retry_after),
+        )
+    return "Failed to fetch stock data", HTTP_400_BAD_REQUEST, None
+
+
+def upstream_error_response(ticker, e):
+    message, status, retry_after = upstream_error(e)
+    if status == HTTP_400_BAD_REQUEST:
+        logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+    headers = {"Retry-After": str(retry_after)} if retry_after else None
+    return Response({"error": message}, status=status, headers=headers)
+
+
+def cache_headers(outcome):
+    headers = {"X-Cache": outcome}
+    if outcome == "stale":
+        headers["Warning"] = STALE_WARNING
+    return headers
+
 
 class StockDataView(APIView):
     def get(self, request, *args, **kwargs):
@@ -14,31 +75,73 @@ class StockDataView(APIView):
             return Response(
                 {"error": "Ticker is required"}, status=HTTP_400_BAD_REQUEST
             )
-        try:
-            data = get_stock_data(ticker)
-            return Response(data, status=HTTP_200_OK)
-        except Exception as e:
-            logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+        symbols = search_symbols(ticker)
+        if symbols or StockSymbol.objects.exists():
             return Response(
-                {"error": "Failed to fetch stock data"}, status=HTTP_400_BAD_REQUEST
+                as_lookup_response(symbols),
+                status=HTTP_200_OK,
+                headers={"X-Cache": "index"},
             )
+        # The local index has not been loaded yet; ask Finnhub.
+        try:
+            data, outcome = lookup_cache.get(ticker)
+            return Response(data, status=HTTP_200_OK, headers=cache_headers(outcome))
+        except Exception as e:
+            return upstream_error_response(ticker, e)
 
 
 class StockPriceView(APIView):
+    """Quote for ``?ticker=X``, or a batch for ``?tickers=A,B`` / POST ``tickers``."""
+
     def get(self, request, *args, **kwargs):
+        tickers = request.query_params.get("tickers")
+        if tickers is not None:
+            return self.batch([t for t in tickers.split(",") if t.strip()])
         ticker = request.query_params.get("ticker")
         if not ticker:
             return Response(
                 {"error": "Ticker is required"}, status=HTTP_400_BAD_REQUEST
             )
         try:
-            data = get_stock_price_data(ticker)
-            return Response(data, status=HTTP_200_OK)
+            data, outcome = get_cached_quote(ticker)
+            return Response(data, status=HTTP_200_OK, headers=cache_headers(outcome))
         except Exception as e:
-            logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+            return upstream_error_response(ticker, e)
+
+    def post(self, request, *args, **kwargs):
+        tickers = request.data.get("tickers")
+        if not isinstance(tickers, list) or not all(
+            isinstance(t, str) for t in tickers
+        ):
+            return Response(
+                {"error": "tickers must be a list of symbols"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+        return self.batch([t for t in tickers if t.strip()])
+
+    def batch(self, tickers):
+        if not tickers:
             return Response(
-                {"error": "Failed to fetch stock data"}, status=HTTP_400_BAD_REQUEST
+                {"error": "Ticker is required"}, status=HTTP_400_BAD_REQUEST
+            )
+        if len(tickers) > settings.QUOTE_BATCH_MAX_TICKERS:
+            return Response(
+                {
+                    "error": f"At most {settings.QUOTE_BATCH_MAX_TICKERS} "
+                    "tickers per request"
+                },
+                status=HTTP_400_BAD_REQUEST,
             )
+        quotes, errors = get_cached_quotes(tickers)
+        for ticker, e in errors.items():
+            logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+        return Response(
+            {
+                "quotes": quotes,
+                "errors": {t: upstream_error(e)[0] for t, e in errors.items()},
+            },
+            status=HTTP_200_OK,
+        )
 
 
 class StockProfileView(APIView):
@@ -47,10 +150,84 @@ class StockProfileView(APIView):
         if not ticker:
             return Response(request.query_params, status=HTTP_400_BAD_REQUEST)
         try:
-            data = get_stock_profile(ticker)
-            return Response(data, status=HTTP_200_OK)
+            data, outcome = profile_cache.get(ticker)
+            return Response(data, status=HTTP_200_OK, headers=cache_headers(outcome))
         except Exception as e:
-            logger.error(f"Error fetching stock data for ticker {ticker}: {e}")
+            return upstream_error_response(ticker, e)
+
+
+class StockCandlesView(APIView):
+    """OHLCV bars for ``?ticker=X&resolution=R&from=T1&to=T2`` (epoch seconds).
+
+    Bars come from the local store; only spans never fetched before, and the
+    latest unsettled minutes once CANDLE_TAIL_TTL has passed, are requested
+    from Finnhub. Defaults to hourly bars for the last week.
+    """
+
+    def get(self, request, *args, **kwargs):
+        ticker = request.query_params.get("ticker")
+        if not ticker:
+            return Response(
+                {"error": "Ticker is required"}, status=HTTP_400_BAD_REQUEST
+            )
+        resolution = request.query_params.get("resolution", "60")
+        if resolution not in RESOLUTIONS:
+            return Response(
+                {"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+        try:
+            end = int(request.query_params.get("to", time.time()))
+            start = int(request.query_params.get("from", end - 7 * 24 * 3600))
+            start, end = from_epoch(start), from_epoch(end)
+        except (ValueError, OverflowError, OSError):
+            # Not a number, or outside the dates datetime can represent.
             return Response(
-                {"error": "Failed to fetch stock data"}, status=HTTP_400_BAD_REQUEST
+                {"error": "from and to must be Unix timestamps"},
+                status=HTTP_400_BAD_REQUEST,
             )
+        if start >= end:
+            return Response(
+                {"error": "from must be before to"}, status=HTTP_400_BAD_REQUEST
+            )
+        max_days = max_range_days(resolution)
+        if end - start > timedelta(days=max_days):
+            return Response(
+                {"error": f"At most {max_days} days per request at this resolution"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+
+        headers = {"X-Cache": "hit"}
+        try:
+            if backfill_candles(ticker, start, end):
+                headers["X-Cache"] = "miss"
+        except Exception as e:
+            # Serve what is stored; the rest is fetched on a later request.
+            candles = get_candles(ticker, resolution, start, end)
+            if candles["s"] != "ok":
+                return upstream_error_response(ticker, e)
+            logger.warning(f"Partial candles for ticker {ticker}: {e}")
+            headers = {"X-Cache": "partial", "Warning": STALE_WARNING}
+            return Response(candles, status=HTTP_200_OK, headers=headers)
+        return Response(
+            get_candles(ticker, resolution, start, end),
+            status=HTTP_200_OK,
+            headers=headers,
+        )
+
+
+class StockCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        stats = {
+            "quote": quote_stats.snapshot(),
+            "profile": profile_cache.stats.snapshot(),
+            "lookup": lookup_cache.stats.snapshot(),
+            "rate_limit": {
+                **upstream_bucket.stats.snapshot(),
+                "wait_seconds": round(upstream_bucket.wait_seconds, 3),
+            },
+            "breakers": breaker_states(),
+        }
+        return Response(stats, status=HTTP_200_OK)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import weakref
+
+from django.conf import settings
+
+from .cache import aget_cached_quote, normalize_ticker
+from .throttle import background_priority
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteHub:
+    """Fan quote updates out from one poller per symbol to every subscriber.
+
+    Upstream load depends on the number of distinct symbols being watched,
+    not on the number of open streams. Pollers go through the quote cache,
+    so several workers watching the same symbol share one fetch per TTL.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._pollers = {}
+        self._last = {}
+
+    def subscribe(self, symbols):
+        """Return a queue of ``(symbol, quote)`` updates for ``symbols``."""
+        queue = asyncio.Queue(maxsize=settings.QUOTE_STREAM_QUEUE_SIZE)
+        for symbol in {normalize_ticker(s) for s in symbols}:
+            self._subscribers.setdefault(symbol, set()).add(queue)
+            if symbol in self._last:
+                self._offer(queue, (symbol, self._last[symbol]))
+            if symbol not in self._pollers:
+                self._pollers[symbol] = asyncio.create_task(self._poll(symbol))
+        return queue
+
+    def unsubscribe(self, queue):
+        for symbol in [s for s, queues in self._subscribers.items() if queue in queues]:
+            queues = self._subscribers[symbol]
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[symbol]
+                self._last.pop(symbol, None)
+                self._pollers.pop(symbol).cancel()
+
+    def watched_symbols(self):
+        return set(self._pollers)
+
+    async def _poll(self, symbol):
+        with background_priority():
+            while True:
+                try:
+                    quote, _ = await aget_cached_quote(symbol)
+                except Exception as e:
+                    logger.warning(f"Quote stream poll for {symbol} failed: {e}")
+                else:
+                    if quote != self._last.get(symbol):
+                        self._last[symbol] = quote
+                        for queue in self._subscribers.get(symbol, ()):
+                            self._offer(queue, (symbol, quote))
+                await asyncio.sleep(settings.QUOTE_STREAM_INTERVAL)
+
+    @staticmethod
+    def _offer(queue, item):
+        # A slow client only ever misses intermediate quotes, never the latest.
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_quote_hub():
+    """Return the hub for the running event loop (one per ASGI worker)."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = QuoteHub()
+    return hub
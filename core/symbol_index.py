@@ -0,0 +1,108 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import StockSymbol
+from .utils import call_finnhub
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ["display_symbol", "description", "type"]
+
+
+def search_symbols(query, limit=None):
+    """Search the local symbol index, best matches first.
+
+    Symbol prefix matches come first (shortest symbol first), then
+    description substring matches and, on PostgreSQL, trigram-similar
+    symbols to tolerate typos. Returns a list of StockSymbol.
+    """
+    limit = limit or settings.SYMBOL_SEARCH_LIMIT
+    query = query.strip().upper()
+    found = {}
+
+    def take(queryset):
+        for row in queryset.exclude(symbol__in=list(found))[: limit - len(found)]:
+            found[row.symbol] = row
+
+    take(
+        StockSymbol.objects.filter(symbol__startswith=query).order_by(
+            Length("symbol"), "symbol"
+        )
+    )
+    if len(found) < limit:
+        take(
+            StockSymbol.objects.filter(description__icontains=query).order_by("symbol")
+        )
+    if len(found) < limit and connection.vendor == "postgresql":
+        take(
+            StockSymbol.objects.filter(symbol__trigram_similar=query).order_by("symbol")
+        )
+    return list(found.values())
+
+
+def as_lookup_response(symbols):
+    """Shape search results like Finnhub's symbol_lookup response."""
+    return {
+        "count": len(symbols),
+        "result": [
+            {
+                "description": s.description,
+                "displaySymbol": s.display_symbol,
+                "symbol": s.symbol,
+                "type": s.type,
+            }
+            for s in symbols
+        ],
+    }
+
+
+def sync_exchange(exchange):
+    """Bring the local index for one exchange in line with Finnhub.
+
+    Only new, changed and delisted symbols are written. Returns a dict of
+    created/updated/deleted counts.
+    """
+    upstream = {}
+    for item in call_finnhub("stock_symbols", exchange):
+        symbol = item["symbol"].upper()
+        upstream[symbol] = {
+            "display_symbol": item.get("displaySymbol") or symbol,
+            "description": (item.get("description") or "")[:255],
+            "type": item.get("type") or "",
+        }
+
+    existing = {
+        row.symbol: row
+        for row in StockSymbol.objects.filter(exchange=exchange).only(
+            "id", "symbol", *FIELDS
+        )
+    }
+    now = timezone.now()
+    created, changed = [], []
+    for symbol, values in upstream.items():
+        row = existing.get(symbol)
+        if row is None:
+            created.append(StockSymbol(symbol=symbol, exchange=exchange, **values))
+        elif any(getattr(row, f) != v for f, v in values.items()):
+            for field, value in values.items():
+                setattr(row, field, value)
+            row.updated_on = now
+            changed.append(row)
+    delisted = [row.id for symbol, row in existing.items() if symbol not in upstream]
+
+    with transaction.atomic():
+        StockSymbol.objects.bulk_create(created, batch_size=1000, ignore_conflicts=True)
+        StockSymbol.objects.bulk_update(
+            changed, FIELDS + ["updated_on"], batch_size=1000
+        )
+        for start in range(0, len(delisted), 1000):
+            StockSymbol.objects.filter(id__in=delisted[start : start + 1000]).delete()
+    logger.info(
+        f"Symbol index {exchange}: {len(created)} new, {len(changed)} changed, "
+        f"{len(delisted)} delisted"
+    )
+    return {"created": len(created), "updated": len(changed), "deleted": len(delisted)}
@@ -1,14 +1,84 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+import finnhub
+import jwt
+import numpy as np
+import requests
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Upper
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 from core.factories import UserFactory, FavoriteStockFactory
-from core.models import User, FavoriteStock
+from core.models import (
+    User,
+    FavoriteStock,
+    StockSymbol,
+    Candle,
+    CandleRange,
+    PriceAlert,
+    RequestProfile,
+)
 from core.serializers import FavoriteStockSerializer
+from core.finnhub_stub import FinnhubStubServer
+from core.utils import get_finnhub_client, get_stock_price_data, reset_finnhub_client
+from core.async_utils import aget_stock_price_data, get_async_client
+from core.cache import (
+    QUOTE_KEY,
+    AsyncSingleFlight,
+    get_cached_quote,
+    get_refresh_pool,
+    lookup_cache,
+    profile_cache,
+    quote_stats,
+)
+from core.authentication import issue_tokens, revoked_tokens, user_from_claims
+from core.metrics import registry
+from core.pipeline import EmailInUse, create_user as social_create_user
+from core.profiling import _profiling
+from core.sessions import SessionStore, session_stats
+from core.alerts import AlertEngine, alert_triggered, check_quotes, load_alerts
+from core.analytics import compute_metrics, portfolio_analytics
+from core.candles import CANDLE_TAIL_KEY, backfill_candles, from_epoch, get_candles
+from core.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitOpen,
+    get_breaker,
+    reset_breakers,
+)
+from core.prefetch import popular_symbols, prefetch_quotes
+from core.streaming import QuoteHub
+from core.symbol_index import search_symbols, sync_exchange
+from core.throttle import (
+    TokenBucket,
+    UpstreamThrottled,
+    background_priority,
+    upstream_bucket,
+)
 
 
 class CurrentUserViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = UserFactory()
         self.client.force_authenticate(user=self.user)
@@ -23,6 +93,111 @@ class CurrentUserViewTest(TestCase):
         response = self.client.get(reverse("current_user"))
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_current_user_is_cached(self):
+        first = self.client.get(reverse("current_user"))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse("current_user"))
+        self.assertEqual(second.data, first.data)
+
+    def test_edits_invalidate_cached_user(self):
+        self.client.get(reverse("current_user"))
+        self.client.patch(reverse("edit_user"), {"bio": "Updated bio"})
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.data["bio"], "Updated bio")
+
+        group = Group.objects.create(name="traders")
+        group.user_set.add(self.user)
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.data["groups"], [group.id])
+
+    @override_settings(USER_CACHE_TTL=3600, USER_CACHE_LOCAL_TTL=5)
+    def test_process_local_cache_keeps_payload_briefly(self):
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.client.get(reverse("current_user"))
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+
+class TokenAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        revoked_tokens.clear()
+        self.client = APIClient()
+        self.user = UserFactory()
+
+    def login(self):
+        response = self.client.post(
+            reverse("login"),
+            {"username": self.user.username, "password": "password123"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only the token should authenticate the requests below.
+        self.client.logout()
+        return response.data
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_access_token_needs_no_queries(self):
+        self.bearer(self.login()["access"])
+        self.client.get(reverse("current_user"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.data["bio"], self.user.bio)
+        FavoriteStockFactory(user=self.user, stock_symbol="AAPL")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("favorite-stock-list"))
+        self.assertEqual(response.data["results"][0]["stock_symbol"], "AAPL")
+
+    def test_edit_with_token_loads_user(self):
+        self.bearer(self.login()["access"])
+        response = self.client.patch(reverse("edit_user"), {"bio": "New bio"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.bio, "New bio")
+        self.assertEqual(
+            response.data["birth_date"], self.user.birth_date.strftime("%Y/%m/%d")
+        )
+
+    def test_rejected_tokens(self):
+        tokens = self.login()
+        self.bearer(tokens["refresh"])
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(JWT_ACCESS_TTL=-1):
+            expired = issue_tokens(self.user)["access"]
+        self.bearer(expired)
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.data["detail"], "Token has expired")
+
+        self.bearer(tokens["access"])
+        self.client.post(reverse("logout"))
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.data["detail"], "Token has been revoked")
+
+    def test_refresh_rotates_tokens(self):
+        refresh = self.login()["refresh"]
+        response = self.client.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", response.data)
+        # The old refresh token was used up.
+        response = self.client.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_password_change_voids_refresh_token(self):
+        refresh = self.login()["refresh"]
+        self.user.set_password("new-password")
+        self.user.save()
+        response = self.client.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_token_user_cannot_be_saved(self):
+        claims = jwt.decode(
+            issue_tokens(self.user)["access"], options={"verify_signature": False}
+        )
+        with self.assertRaises(TypeError):
+            user_from_claims(claims).save()
+
 
 class LogoutViewTest(TestCase):
     def setUp(self):
@@ -36,6 +211,65 @@ class LogoutViewTest(TestCase):
         self.assertEqual(response.data["message"], "Logged out successfully")
 
 
+@override_settings(SESSION_ENGINE="core.sessions")
+class CachedSessionTest(TestCase):
+    def setUp(self):
+        caches["sessions"].clear()
+        self.user = UserFactory()
+        self.client.force_login(self.user)
+        session_stats.reset()
+
+    def get_with_session_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q["sql"] for q in queries if "django_session" in q["sql"]]
+
+    def test_session_is_read_from_cache(self):
+        response, queries = self.get_with_session_queries(reverse("current_user"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+    def test_session_falls_back_to_database(self):
+        caches["sessions"].clear()
+        response, queries = self.get_with_session_queries(reverse("current_user"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        _, queries = self.get_with_session_queries(reverse("current_user"))
+        self.assertEqual(queries, [])
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_unchanged_session_is_not_saved(self):
+        response, queries = self.get_with_session_queries(reverse("current_user"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+        self.assertEqual(session_stats.snapshot(), {"saved": 0, "skipped": 1})
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True, SESSION_TOUCH_INTERVAL=0)
+    def test_unchanged_session_is_touched_after_interval(self):
+        _, queries = self.get_with_session_queries(reverse("current_user"))
+        self.assertTrue(any(q.startswith("UPDATE") for q in queries))
+        self.assertEqual(session_stats.snapshot(), {"saved": 1, "skipped": 0})
+
+    def test_changed_session_is_saved(self):
+        store = SessionStore()
+        store["theme"] = "dark"
+        store.save()
+        store = SessionStore(store.session_key)
+        store["theme"] = "dark"
+        store.save()
+        self.assertEqual(session_stats.snapshot()["skipped"], 1)
+        store["theme"] = "light"
+        store.save()
+        caches["sessions"].clear()
+        self.assertEqual(SessionStore(store.session_key)["theme"], "light")
+
+    def test_logout_ends_session(self):
+        response = self.client.post(reverse("logout"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
 class CreateUserViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -90,6 +324,33 @@ class RegisterUserViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("Email already exists", str(response.data))
 
+    def test_concurrent_duplicate_email_is_rejected(self):
+        UserFactory(email="race@example.com")
+        payload = {
+            "username": "racer",
+            "email": "RACE@example.com",
+            "password": "password123",
+        }
+        # As if the other account was created after the check ran.
+        with mock.patch.object(QuerySet, "exists", return_value=False):
+            response = self.client.post(reverse("create_user"), payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Email already exists", str(response.data))
+
+    def test_social_signup_with_taken_email(self):
+        UserFactory(email="social@example.com")
+        strategy = mock.Mock()
+        strategy.create_user.side_effect = lambda **fields: User.objects.create_user(
+            **fields
+        )
+        backend = mock.Mock(setting=lambda name, default=None: ["username", "email"])
+        with self.assertRaises(EmailInUse):
+            social_create_user(
+                strategy,
+                {"username": "social", "email": "Social@example.com"},
+                backend,
+            )
+
 
 class EditUserDetailsViewTest(TestCase):
     def setUp(self):
@@ -112,6 +373,1146 @@ class EditUserDetailsViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class PriceAlertTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.favorite = FavoriteStockFactory(user=self.user, stock_symbol="aapl")
+        cache.clear()
+
+    def add_alert(self, direction, threshold):
+        return PriceAlert.objects.create(
+            user=self.user,
+            favorite=self.favorite,
+            symbol="AAPL",
+            direction=direction,
+            threshold=threshold,
+        )
+
+    def test_engine_finds_crossed_thresholds(self):
+        engine = AlertEngine()
+        engine.load(
+            [
+                (1, "AAPL", "above", 200),
+                (2, "AAPL", "above", 150),
+                (3, "AAPL", "above", 100),
+                (4, "AAPL", "below", 90),
+                (5, "AAPL", "below", 50),
+                (6, "MSFT", "above", 10),
+            ]
+        )
+        self.assertEqual(engine.symbols(), {"AAPL", "MSFT"})
+        self.assertEqual(sorted(engine.evaluate("AAPL", 150)), [2, 3])
+        self.assertEqual(engine.evaluate("AAPL", 150), [])
+        self.assertEqual(engine.evaluate("AAPL", 80), [4])
+        self.assertEqual(len(engine), 3)
+
+    def test_check_quotes_triggers_alerts(self):
+        above = self.add_alert("above", 200)
+        below = self.add_alert("below", 100)
+        engine = AlertEngine()
+        load_alerts(engine)
+        cache.set(
+            QUOTE_KEY.format("AAPL"),
+            {"data": {"c": 210.5}, "fetched_at": time.time()},
+        )
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs)
+
+        alert_triggered.connect(receiver)
+        self.addCleanup(alert_triggered.disconnect, receiver)
+        seen = {}
+        with mock.patch("core.alerts.refresh_quote") as refresh, self.assertNumQueries(
+            2
+        ):
+            self.assertEqual(check_quotes(engine, seen), 1)
+        refresh.assert_not_called()
+        # The same quote is not evaluated twice.
+        self.assertEqual(check_quotes(engine, seen), 0)
+
+        above.refresh_from_db()
+        below.refresh_from_db()
+        self.assertFalse(above.is_active)
+        self.assertEqual(float(above.triggered_price), 210.5)
+        self.assertTrue(below.is_active)
+        self.assertEqual(received[0]["alerts"], [above.id])
+
+    def test_create_alert_requires_favorite(self):
+        response = self.client.post(
+            reverse("price-alerts"),
+            {"stock_symbol": "AAPL", "direction": "above", "threshold": "200"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["symbol"], "AAPL")
+        self.assertEqual(PriceAlert.objects.get().favorite, self.favorite)
+
+        response = self.client.post(
+            reverse("price-alerts"),
+            {"stock_symbol": "MSFT", "direction": "above", "threshold": "200"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("stock_symbol", response.data)
+
+    def test_list_and_delete_alerts(self):
+        alert = self.add_alert("below", 100)
+        FavoriteStockFactory(user=UserFactory())
+        response = self.client.get(reverse("price-alerts"))
+        self.assertEqual(len(response.data["results"]), 1)
+        response = self.client.delete(reverse("price-alert-delete", args=[alert.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(PriceAlert.objects.exists())
+
+
+class FinnhubClientTest(TestCase):
+    def setUp(self):
+        self.server = FinnhubStubServer().start()
+        self.settings_override = override_settings(FINNHUB_API_URL=self.server.base_url)
+        self.settings_override.enable()
+        reset_finnhub_client()
+        upstream_bucket.reset()
+
+    def tearDown(self):
+        reset_finnhub_client()
+        self.settings_override.disable()
+        self.server.stop()
+
+    def test_client_is_shared(self):
+        self.assertIs(get_finnhub_client(), get_finnhub_client())
+
+    def test_stub_injects_errors(self):
+        self.addCleanup(reset_breakers)
+        self.server.error_rate = 1.0
+        with self.assertRaises(finnhub.FinnhubAPIException) as raised:
+            get_stock_price_data("AAPL")
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(self.server.counters["errors"], 1)
+
+    def test_connections_are_reused(self):
+        for ticker in ["AAPL", "MSFT", "AAPL"]:
+            data = get_stock_price_data(ticker)
+            self.assertIn("c", data)
+        self.assertEqual(self.server.counters["requests"], 3)
+        self.assertEqual(self.server.counters["connections"], 1)
+
+    @override_settings(FINNHUB_POOL_MAXSIZE=1)
+    def test_short_pool_does_not_queue_requests(self):
+        reset_finnhub_client()
+        self.server.latency = 0.2
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(get_stock_price_data, ["AAPL", "MSFT"]))
+        # Both went out at once, the second on a connection of its own.
+        self.assertEqual(self.server.counters["connections"], 2)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        registry.reset()
+
+    def scrape(self, **extra):
+        response = self.client.get(reverse("metrics"), **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_requests_are_recorded_by_view(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("favorite-stock-list"))
+        self.client.get(reverse("favorite-stock-list"))
+        body = self.scrape()
+        self.assertIn(
+            'http_requests_total{view="favorite-stock-list",method="GET",'
+            'status="200"} 2',
+            body,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{view="favorite-stock-list"} 2', body
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{view="favorite-stock-list",'
+            'le="+Inf"} 2',
+            body,
+        )
+        self.assertIn('db_queries_total{view="favorite-stock-list"} 2', body)
+
+    def test_upstream_calls_are_recorded(self):
+        server = FinnhubStubServer().start()
+        try:
+            with override_settings(FINNHUB_API_URL=server.base_url):
+                reset_finnhub_client()
+                get_stock_price_data("AAPL")
+        finally:
+            reset_finnhub_client()
+            server.stop()
+        self.assertIn(
+            'upstream_request_duration_seconds_count{method="quote",outcome="ok"} 1',
+            self.scrape(),
+        )
+
+    def test_cache_counters_are_exported(self):
+        quote_stats.reset()
+        quote_stats.incr("hit")
+        self.assertIn(
+            'cache_requests_total{cache="quote",outcome="hit"} 1', self.scrape()
+        )
+
+    def test_snapshots_of_all_workers_are_summed(self):
+        self.client.get(reverse("metrics"))
+        with tempfile.TemporaryDirectory() as directory:
+            other = {
+                "counters": [
+                    [
+                        "http_requests_total",
+                        [["view", "metrics"], ["method", "GET"], ["status", 200]],
+                        4,
+                    ]
+                ],
+                "histograms": [],
+            }
+            with open(os.path.join(directory, "metrics-1.json"), "w") as f:
+                json.dump(other, f)
+            with override_settings(METRICS_DIR=directory):
+                body = self.scrape()
+                self.assertIn(f"metrics-{os.getpid()}.json", os.listdir(directory))
+        self.assertIn(
+            'http_requests_total{view="metrics",method="GET",status="200"} 5', body
+        )
+
+    def test_pool_statistics_are_exported(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            "requests_num": 10,
+            "requests_queued": 2,
+            "requests_wait_ms": 1500,
+            "pool_size": 4,
+            "pool_available": 3,
+        }
+        with mock.patch("core.metrics._db_pools", return_value=[("default", pool)]):
+            body = self.scrape()
+        self.assertIn('db_pool_requests_total{database="default"} 10.0', body)
+        self.assertIn('db_pool_wait_seconds_total{database="default"} 1.5', body)
+        self.assertIn('db_pool_errors_total{database="default"} 0.0', body)
+        self.assertIn("# TYPE db_pool_available gauge", body)
+        self.assertIn('db_pool_available{database="default"} 3', body)
+
+    def test_exited_workers_are_folded_into_retired_totals(self):
+        row = [
+            "http_requests_total",
+            [["view", "metrics"], ["method", "GET"], ["status", 200]],
+            2,
+        ]
+        gauge = ["db_pool_size", [["database", "default"]], 4]
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in (1_000_001, 1_000_002):
+                with open(os.path.join(directory, f"metrics-{pid}.json"), "w") as f:
+                    json.dump(
+                        {"counters": [row], "gauges": [gauge], "histograms": []}, f
+                    )
+            with override_settings(METRICS_DIR=directory), mock.patch(
+                "core.metrics._alive", side_effect=lambda pid: pid == os.getpid()
+            ):
+                registry.retire(1_000_001)
+                body = self.scrape()
+                self.assertCountEqual(
+                    [n for n in os.listdir(directory) if n.endswith(".json")],
+                    ["metrics-retired.json", f"metrics-{os.getpid()}.json"],
+                )
+        self.assertIn(
+            'http_requests_total{view="metrics",method="GET",status="200"} 4', body
+        )
+        self.assertNotIn("db_pool_size", body)
+
+    def test_remote_scrapes_need_staff_without_token(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_login(UserFactory(is_staff=True))
+        self.scrape(REMOTE_ADDR="10.0.0.5")
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_token_is_required_when_configured(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.scrape(HTTP_AUTHORIZATION="Bearer scrape-secret")
+
+
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.staff = UserFactory(is_staff=True, is_superuser=True)
+        FavoriteStockFactory(user=self.staff, stock_symbol="AAPL")
+
+    def test_staff_header_captures_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("favorite-stock-list"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(profile.trigger, RequestProfile.HEADER)
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.view_name, "favorite-stock-list")
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertTrue(any("core_favoritestock" in q["sql"] for q in profile.queries))
+        self.assertIn("favorite_views.py", profile.profile)
+        self.assertTrue(profile.stats)
+
+    def test_staff_bearer_token_captures_profile(self):
+        access = issue_tokens(self.staff)["access"]
+        response = self.client.get(
+            reverse("favorite-stock-list"),
+            HTTP_X_PROFILE="1",
+            HTTP_AUTHORIZATION=f"Bearer {access}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(RequestProfile.objects.filter(pk=response["X-Profile-Id"]))
+
+    @mock.patch("core.profiling.Capture")
+    def test_header_from_non_staff_is_ignored(self, capture):
+        self.client.force_login(UserFactory())
+        response = self.client.get(reverse("favorite-stock-list"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.logout()
+        self.client.get(reverse("favorite-stock-list"), HTTP_X_PROFILE="1")
+        capture.assert_not_called()
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_one_capture_at_a_time(self):
+        self.client.force_login(self.staff)
+        with _profiling:
+            response = self.client.get(
+                reverse("favorite-stock-list"), HTTP_X_PROFILE="1"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("X-Profile-Id", response)
+
+    @override_settings(REQUEST_PROFILE_SAMPLE_RATE=1.0)
+    @mock.patch("core.utils.get_finnhub_client")
+    def test_sampled_request_records_upstream_calls(self, get_client):
+        get_client.return_value.quote.return_value = {"c": 1.0}
+        response = self.client.get(reverse("stock_price"), {"ticker": "AAPL"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("X-Profile-Id", response)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.trigger, RequestProfile.SAMPLE)
+        self.assertEqual(profile.upstream[0]["method"], "quote")
+        self.assertEqual(profile.upstream[0]["outcome"], "ok")
+
+    @override_settings(REQUEST_PROFILE_KEEP=2)
+    def test_old_profiles_are_pruned(self):
+        self.client.force_login(self.staff)
+        for _ in range(3):
+            self.client.get(reverse("favorite-stock-list"), HTTP_X_PROFILE="1")
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_admin_shows_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("favorite-stock-list"), HTTP_X_PROFILE="1")
+        profile_id = response["X-Profile-Id"]
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("admin:core_requestprofile_change", args=[profile_id])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "core_favoritestock")
+        response = self.client.post(
+            reverse("admin:core_requestprofile_changelist"),
+            {"action": "download_stats", "_selected_action": [profile_id]},
+        )
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+
+
+class GunicornConfigTest(TestCase):
+    def load(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, "gunicorn.conf.py"))
+
+    def test_threaded_workers_by_default(self):
+        with mock.patch("os.cpu_count", return_value=2):
+            config = self.load()
+        self.assertEqual(config["worker_class"], "gthread")
+        self.assertEqual(config["wsgi_app"], "backend.wsgi:application")
+        self.assertEqual(config["workers"], 5)
+        self.assertTrue(config["preload_app"])
+        self.assertGreater(config["max_requests_jitter"], 0)
+
+    def test_uvicorn_workers_serve_the_asgi_application(self):
+        config = self.load(GUNICORN_WORKER_CLASS="uvicorn", GUNICORN_WORKERS="3")
+        self.assertEqual(config["worker_class"], "uvicorn.workers.UvicornWorker")
+        self.assertEqual(config["wsgi_app"], "backend.asgi:application")
+        self.assertEqual(config["workers"], 3)
+
+    @override_settings(QUOTE_PREFETCH_THREAD=True)
+    @mock.patch("core.prefetch.start_prefetch_thread")
+    @mock.patch("core.utils.reset_finnhub_client")
+    def test_worker_starts_prefetch_thread_after_fork(self, reset, start):
+        config = self.load()
+        config["post_fork"](None, None)
+        reset.assert_called_once_with()
+        start.assert_called_once_with()
+
+    def test_stale_metrics_are_removed_on_start(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stale = os.path.join(directory, "metrics-1.json")
+            with open(stale, "w") as f:
+                f.write("{}")
+            config = self.load(METRICS_DIR=directory)
+            with mock.patch.dict(os.environ, METRICS_DIR=directory):
+                config["on_starting"](None)
+            self.assertFalse(os.path.exists(stale))
+
+
+class StockPriceCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        quote_stats.reset()
+
+    @mock.patch("core.cache.get_stock_price_data", return_value={"c": 1.0})
+    def test_second_request_is_cache_hit(self, upstream):
+        first = self.client.get(reverse("stock_price"), {"ticker": "AAPL"})
+        second = self.client.get(reverse("stock_price"), {"ticker": "aapl"})
+        self.assertEqual(first["X-Cache"], "miss")
+        self.assertEqual(second["X-Cache"], "hit")
+        self.assertEqual(second.data, {"c": 1.0})
+        upstream.assert_called_once_with("AAPL")
+
+    def test_concurrent_misses_are_coalesced(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_quote(ticker):
+            calls.append(ticker)
+            release.wait(5)
+            return {"c": 2.0}
+
+        with mock.patch("core.cache.get_stock_price_data", side_effect=slow_quote):
+            threads = [
+                threading.Thread(target=get_cached_quote, args=("MSFT",))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            while not calls:
+                time.sleep(0.001)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        stats = quote_stats.snapshot()
+        self.assertEqual(stats["miss"] + stats["coalesced"] + stats["hit"], 5)
+        self.assertEqual(stats["miss"], 1)
+
+    async def test_cancelled_leader_releases_waiters(self):
+        flight = AsyncSingleFlight()
+        started = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                await asyncio.sleep(10)
+            return "quote"
+
+        leader = asyncio.ensure_future(flight.do("AAPL", fetch))
+        await started.wait()
+        waiter = asyncio.ensure_future(flight.do("AAPL", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await asyncio.wait_for(waiter, 1), ("quote", False))
+        self.assertEqual(await flight.do("AAPL", fetch), ("quote", False))
+        self.assertEqual(len(calls), 3)
+
+
+class ReferenceCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        profile_cache.clear()
+
+    def test_profile_is_cached(self):
+        with mock.patch.object(
+            profile_cache, "fetch", return_value={"name": "Apple"}
+        ) as upstream:
+            self.client.get(reverse("stock_profile"), {"ticker": "AAPL"})
+            response = self.client.get(reverse("stock_profile"), {"ticker": "AAPL"})
+        self.assertEqual(response["X-Cache"], "hit")
+        self.assertEqual(response.data, {"name": "Apple"})
+        upstream.assert_called_once_with("AAPL")
+
+    def test_stale_profile_served_while_refreshing(self):
+        refreshed = threading.Event()
+
+        def fetch(ticker):
+            refreshed.set()
+            return {"name": "New"}
+
+        with mock.patch.object(profile_cache, "fetch", return_value={"name": "Old"}):
+            profile_cache.get("AAPL")
+        with override_settings(PROFILE_CACHE_TTL=0), mock.patch.object(
+            profile_cache, "fetch", side_effect=fetch
+        ):
+            data, outcome = profile_cache.get("AAPL")
+            self.assertTrue(refreshed.wait(5))
+        self.assertEqual((data, outcome), ({"name": "Old"}, "stale"))
+        deadline = time.time() + 5
+        while profile_cache.get("AAPL")[0] != {"name": "New"}:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+    def test_refreshes_are_skipped_when_the_pool_is_busy(self):
+        release = threading.Event()
+        calls = []
+
+        def fetch(ticker):
+            calls.append(ticker)
+            release.wait(5)
+            return {"name": "New"}
+
+        with mock.patch.object(profile_cache, "fetch", return_value={"name": "Old"}):
+            profile_cache.get("AAPL")
+            profile_cache.get("MSFT")
+        get_refresh_pool()
+        slots = threading.BoundedSemaphore(1)
+        with override_settings(PROFILE_CACHE_TTL=0), mock.patch.object(
+            profile_cache, "fetch", side_effect=fetch
+        ), mock.patch("core.cache._refresh_slots", slots):
+            self.assertEqual(profile_cache.get("AAPL")[1], "stale")
+            self.assertEqual(profile_cache.get("MSFT")[1], "stale")
+            release.set()
+            deadline = time.time() + 5
+            while profile_cache._refreshing:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.01)
+            # The slot is free again, so MSFT's refresh is scheduled now.
+            profile_cache.get("MSFT")
+            while len(calls) < 2 or profile_cache._refreshing:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.01)
+        self.assertEqual(calls, ["AAPL", "MSFT"])
+
+    @override_settings(REFERENCE_CACHE_MAXSIZE=2)
+    def test_lru_is_bounded(self):
+        with mock.patch.object(profile_cache, "fetch", return_value={}) as upstream:
+            for ticker in ["A", "B", "A", "C", "A", "B"]:
+                profile_cache.get(ticker)
+        # B was least recently used when C arrived, so only it is refetched.
+        self.assertEqual(
+            [c.args[0] for c in upstream.call_args_list], ["A", "B", "C", "B"]
+        )
+
+
+class StockPriceBatchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_batch_quotes_with_per_symbol_errors(self):
+        def quote(ticker):
+            if ticker == "BAD":
+                raise Exception("upstream error")
+            return {"c": len(ticker)}
+
+        with mock.patch("core.cache.get_stock_price_data", side_effect=quote) as up:
+            response = self.client.get(
+                reverse("stock_price"), {"tickers": "AAPL,msft,BAD,aapl"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["quotes"], {"AAPL": {"c": 4}, "MSFT": {"c": 4}})
+        self.assertEqual(list(response.data["errors"]), ["BAD"])
+        self.assertEqual(up.call_count, 3)
+
+    @mock.patch("core.cache.get_stock_price_data", return_value={"c": 1.0})
+    def test_batch_quotes_post(self, upstream):
+        response = self.client.post(
+            reverse("stock_price"), {"tickers": ["AAPL", "MSFT"]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["quotes"]), {"AAPL", "MSFT"})
+
+    @override_settings(QUOTE_BATCH_MAX_TICKERS=2)
+    def test_batch_too_many_tickers(self):
+        response = self.client.get(reverse("stock_price"), {"tickers": "A,B,C"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncStockViewsTest(TestCase):
+    def setUp(self):
+        self.server = FinnhubStubServer().start()
+        self.settings_override = override_settings(FINNHUB_API_URL=self.server.base_url)
+        self.settings_override.enable()
+        cache.clear()
+        profile_cache.clear()
+        upstream_bucket.reset()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+
+    def test_async_price(self):
+        response = self.client.get(reverse("async_stock_price"), {"ticker": "AAPL"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("c", response.json())
+        self.assertEqual(response["X-Cache"], "miss")
+
+    def test_async_price_shares_sync_cache(self):
+        self.client.get(reverse("async_stock_price"), {"ticker": "AAPL"})
+        response = self.client.get(reverse("stock_price"), {"ticker": "AAPL"})
+        self.assertEqual(response["X-Cache"], "hit")
+
+    def test_async_batch_price(self):
+        response = self.client.get(
+            reverse("async_stock_price"), {"tickers": "AAPL,MSFT,aapl"}
+        )
+        self.assertEqual(set(response.json()["quotes"]), {"AAPL", "MSFT"})
+        self.assertEqual(self.server.counters["requests"], 2)
+
+    def test_async_profile_and_lookup(self):
+        profile = self.client.get(reverse("async_stock_profile"), {"ticker": "AAPL"})
+        self.assertEqual(profile.json()["ticker"], "AAPL")
+        lookup = self.client.get(reverse("async_stock_data"), {"ticker": "AAPL"})
+        self.assertEqual(lookup.json()["result"][0]["symbol"], "AAPL")
+
+    def test_async_missing_ticker(self):
+        response = self.client.get(reverse("async_stock_price"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(QUOTE_STREAM_INTERVAL=0.01)
+class QuoteStreamTest(TestCase):
+    async def test_one_poller_per_symbol(self):
+        calls = []
+
+        async def quote(ticker):
+            calls.append(ticker)
+            return {"c": 1.0}, "miss"
+
+        hub = QuoteHub()
+        with mock.patch("core.streaming.aget_cached_quote", side_effect=quote):
+            first = hub.subscribe(["AAPL", "MSFT"])
+            second = hub.subscribe(["aapl"])
+            self.assertEqual(hub.watched_symbols(), {"AAPL", "MSFT"})
+            self.assertEqual((await asyncio.wait_for(second.get(), 1))[0], "AAPL")
+            received = {(await asyncio.wait_for(first.get(), 1))[0] for _ in "ab"}
+            self.assertEqual(received, {"AAPL", "MSFT"})
+            await asyncio.sleep(0.05)
+            hub.unsubscribe(first)
+            self.assertEqual(hub.watched_symbols(), {"AAPL"})
+            hub.unsubscribe(second)
+            self.assertEqual(hub.watched_symbols(), set())
+        # Unchanged quotes are polled but not re-sent.
+        self.assertTrue(first.empty())
+        self.assertGreater(len(calls), 2)
+
+    async def test_stream_pushes_favorite_quotes(self):
+        user = await User.objects.acreate(username="streamer")
+        await FavoriteStock.objects.acreate(user=user, stock_symbol="AAPL")
+        client = AsyncClient()
+        await client.aforce_login(user)
+        with mock.patch(
+            "core.streaming.aget_cached_quote", return_value=({"c": 3.0}, "hit")
+        ):
+            response = await client.get(reverse("favorite-stock-stream"))
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            chunks = aiter(response.streaming_content)
+            self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+            event = (await asyncio.wait_for(anext(chunks), 1)).decode()
+            await chunks.aclose()
+        data = json.loads(event.split("data: ", 1)[1])
+        self.assertEqual(data, {"symbol": "AAPL", "quote": {"c": 3.0}})
+
+    async def test_stream_unauthenticated(self):
+        response = await AsyncClient().get(reverse("favorite-stock-stream"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stream_needs_asgi(self):
+        self.client.force_login(UserFactory())
+        response = self.client.get(reverse("favorite-stock-stream"))
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+
+@override_settings(
+    FINNHUB_RATE_LIMIT_PER_MINUTE=60,
+    FINNHUB_RATE_LIMIT_BURST=3,
+    FINNHUB_RATE_LIMIT_RESERVE=2,
+    FINNHUB_RATE_LIMIT_MAX_WAIT=0,
+    FINNHUB_RATE_LIMIT_BACKGROUND_MAX_WAIT=0,
+)
+class UpstreamRateLimitTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        upstream_bucket.reset()
+
+    def tearDown(self):
+        upstream_bucket.reset()
+
+    def test_background_calls_leave_reserve_for_users(self):
+        bucket = TokenBucket()
+        with background_priority():
+            bucket.acquire()
+            with self.assertRaises(UpstreamThrottled):
+                bucket.acquire()
+        bucket.acquire()
+        bucket.acquire()
+        with self.assertRaises(UpstreamThrottled):
+            bucket.acquire()
+        self.assertEqual(bucket.stats.snapshot()["throttled"], 2)
+
+    @override_settings(FINNHUB_RATE_LIMIT_SHARED=True)
+    def test_shared_bucket_lives_in_cache(self):
+        first, second = TokenBucket(), TokenBucket()
+        for _ in range(3):
+            first.acquire()
+        with self.assertRaises(UpstreamThrottled):
+            second.acquire()
+
+    @override_settings(FINNHUB_RATE_LIMIT_SHARED=True)
+    async def test_shared_bucket_does_not_block_the_loop(self):
+        loop_thread = threading.get_ident()
+
+        def off_loop(method):
+            def call(*args, **kwargs):
+                self.assertNotEqual(threading.get_ident(), loop_thread)
+                return method(*args, **kwargs)
+
+            return call
+
+        bucket = TokenBucket()
+        with mock.patch.multiple(
+            cache,
+            add=off_loop(cache.add),
+            get=off_loop(cache.get),
+            set=off_loop(cache.set),
+            delete=off_loop(cache.delete),
+        ):
+            for _ in range(3):
+                await bucket.aacquire()
+            with self.assertRaises(UpstreamThrottled):
+                await TokenBucket().aacquire()
+            await bucket.arejected()
+
+    @override_settings(FINNHUB_RATE_LIMIT_MAX_WAIT=5)
+    def test_over_quota_request_waits_for_token(self):
+        with override_settings(FINNHUB_RATE_LIMIT_PER_MINUTE=600):
+            bucket = TokenBucket()
+            for _ in range(3):
+                bucket.acquire()
+            started = time.monotonic()
+            bucket.acquire()
+        self.assertGreater(time.monotonic() - started, 0.05)
+        self.assertEqual(bucket.stats.snapshot()["waited"], 1)
+
+    def test_throttled_view_returns_429(self):
+        with mock.patch.object(get_finnhub_client(), "quote", return_value={"c": 1}):
+            for ticker in ["A", "B", "C"]:
+                self.client.get(reverse("stock_price"), {"ticker": ticker})
+            response = self.client.get(reverse("stock_price"), {"ticker": "D"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_upstream_429_drains_bucket(self):
+        rejected = finnhub.FinnhubAPIException(
+            mock.Mock(status_code=429, json=lambda: {"error": "API limit reached"})
+        )
+        with mock.patch.object(get_finnhub_client(), "quote", side_effect=rejected):
+            response = self.client.get(reverse("stock_price"), {"ticker": "A"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(upstream_bucket.stats.snapshot()["upstream_429"], 1)
+        self.assertGreater(upstream_bucket.try_acquire(), 0)
+
+
+@override_settings(QUOTE_CACHE_TTL=60, QUOTE_PREFETCH_MARGIN=10)
+class QuotePrefetchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for symbol in ["AAPL", "aapl", "AAPL", "MSFT", "MSFT", "TSLA"]:
+            FavoriteStockFactory(stock_symbol=symbol)
+
+    def test_popular_symbols_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(popular_symbols(2), ["AAPL", "MSFT"])
+
+    @mock.patch("core.cache.get_stock_price_data", return_value={"c": 1.0})
+    def test_prefetch_refreshes_only_expiring_quotes(self, upstream):
+        self.assertEqual(prefetch_quotes(limit=2), 2)
+        self.assertEqual(prefetch_quotes(limit=2), 0)
+        cache.set(
+            QUOTE_KEY.format("MSFT"), {"data": {}, "fetched_at": time.time() - 55}
+        )
+        self.assertEqual(prefetch_quotes(limit=2), 1)
+        self.assertEqual(upstream.call_count, 3)
+
+    def test_prefetch_stops_when_throttled(self):
+        with mock.patch(
+            "core.cache.get_stock_price_data", side_effect=UpstreamThrottled(1)
+        ) as upstream:
+            self.assertEqual(prefetch_quotes(limit=3), 0)
+        upstream.assert_called_once_with("AAPL")
+
+    @mock.patch("core.cache.get_stock_price_data")
+    def test_command_needs_a_shared_cache(self, upstream):
+        with self.assertRaises(CommandError):
+            call_command("prefetch_quotes", "--once")
+        upstream.assert_not_called()
+
+
+class SymbolIndexTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        lookup_cache.clear()
+
+    def add_symbols(self, *rows):
+        StockSymbol.objects.bulk_create(
+            StockSymbol(
+                symbol=symbol,
+                display_symbol=symbol,
+                description=description,
+                exchange="US",
+            )
+            for symbol, description in rows
+        )
+
+    def test_search_prefix_then_description(self):
+        self.add_symbols(
+            ("AAPL", "APPLE INC"),
+            ("AA", "ALCOA CORP"),
+            ("APLE", "APPLE HOSPITALITY REIT"),
+            ("MSFT", "MICROSOFT CORP"),
+        )
+        found = [s.symbol for s in search_symbols("aa")]
+        self.assertEqual(found, ["AA", "AAPL"])
+        found = [s.symbol for s in search_symbols("apple")]
+        self.assertEqual(found, ["AAPL", "APLE"])
+
+    def test_search_view_uses_index(self):
+        self.add_symbols(("AAPL", "APPLE INC"))
+        with mock.patch.object(lookup_cache, "fetch") as upstream:
+            response = self.client.get(reverse("stock_data"), {"ticker": "aap"})
+            empty = self.client.get(reverse("stock_data"), {"ticker": "zzz"})
+            async_response = self.client.get(
+                reverse("async_stock_data"), {"ticker": "aap"}
+            )
+        self.assertEqual(async_response.json(), response.data)
+        self.assertEqual(response["X-Cache"], "index")
+        self.assertEqual(response.data["result"][0]["symbol"], "AAPL")
+        self.assertEqual(empty.data, {"count": 0, "result": []})
+        upstream.assert_not_called()
+
+    def test_search_view_falls_back_when_index_empty(self):
+        with mock.patch.object(
+            lookup_cache, "fetch", return_value={"count": 0, "result": []}
+        ) as upstream:
+            self.client.get(reverse("stock_data"), {"ticker": "AAPL"})
+        upstream.assert_called_once_with("AAPL")
+
+    def test_sync_exchange_is_incremental(self):
+        self.add_symbols(("AAPL", "OLD NAME"), ("GONE", "DELISTED INC"), ("MSFT", ""))
+        StockSymbol.objects.filter(symbol="MSFT").update(
+            description="MSFT INC", type="Common Stock"
+        )
+        server = FinnhubStubServer().start()
+        try:
+            with override_settings(FINNHUB_API_URL=server.base_url):
+                reset_finnhub_client()
+                counts = sync_exchange("US")
+        finally:
+            reset_finnhub_client()
+            server.stop()
+        self.assertEqual(counts, {"created": 2, "updated": 1, "deleted": 1})
+        self.assertEqual(StockSymbol.objects.get(symbol="AAPL").description, "AAPL INC")
+        self.assertFalse(StockSymbol.objects.filter(symbol="GONE").exists())
+
+
+class CandleStoreTest(TestCase):
+    start = 1_700_000_000 // 86400 * 86400
+
+    def setUp(self):
+        self.client = APIClient()
+        self.server = FinnhubStubServer().start()
+        self.settings_override = override_settings(FINNHUB_API_URL=self.server.base_url)
+        self.settings_override.enable()
+        reset_finnhub_client()
+        upstream_bucket.reset()
+        reset_breakers()
+        cache.clear()
+
+    def tearDown(self):
+        reset_finnhub_client()
+        self.settings_override.disable()
+        self.server.stop()
+
+    def hours(self, a, b):
+        return from_epoch(self.start + a * 3600), from_epoch(self.start + b * 3600)
+
+    def test_backfill_fetches_only_missing_ranges(self):
+        self.assertEqual(backfill_candles("aapl", *self.hours(0, 2)), 1)
+        self.assertEqual(backfill_candles("AAPL", *self.hours(1, 3)), 1)
+        self.assertEqual(backfill_candles("AAPL", *self.hours(0, 3)), 0)
+        self.assertEqual(self.server.counters["requests"], 2)
+        self.assertEqual(Candle.objects.filter(symbol="AAPL").count(), 180)
+        self.assertEqual(
+            list(CandleRange.objects.values_list("start", "end")),
+            [self.hours(0, 3)],
+        )
+
+    def test_downsampling(self):
+        backfill_candles("AAPL", *self.hours(0, 2))
+        minutes = get_candles("AAPL", "1", *self.hours(0, 2))
+        hourly = get_candles("AAPL", "60", *self.hours(0, 2))
+        daily = get_candles("AAPL", "D", *self.hours(0, 2))
+        self.assertEqual(len(minutes["t"]), 120)
+        self.assertEqual(hourly["t"], [self.start, self.start + 3600])
+        self.assertEqual(hourly["o"][1], minutes["o"][60])
+        self.assertEqual(hourly["c"][0], minutes["c"][59])
+        self.assertEqual(hourly["h"][0], max(minutes["h"][:60]))
+        self.assertEqual(hourly["v"][0], 6000)
+        self.assertEqual(daily["t"], [self.start])
+        self.assertEqual(daily["l"], [min(minutes["l"])])
+
+    def test_candles_view(self):
+        params = {
+            "ticker": "AAPL",
+            "resolution": "60",
+            "from": self.start,
+            "to": self.start + 7200,
+        }
+        first = self.client.get(reverse("stock_candles"), params)
+        second = self.client.get(reverse("stock_candles"), params)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first["X-Cache"], "miss")
+        self.assertEqual(second["X-Cache"], "hit")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(first.data["s"], "ok")
+        self.assertEqual(len(first.data["t"]), 2)
+        self.assertEqual(self.server.counters["requests"], 1)
+
+        bad = self.client.get(reverse("stock_candles"), {**params, "resolution": "W"})
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+        bad = self.client.get(
+            reverse("stock_candles"), {**params, "to": 100_000_000_000_000}
+        )
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+        month = {**params, "to": self.start + 30 * 86400}
+        bad = self.client.get(reverse("stock_candles"), {**month, "resolution": "1"})
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            bad.data["error"], "At most 7 days per request at this resolution"
+        )
+
+    def test_recent_bars_are_fetched_again_after_tail_ttl(self):
+        now = timezone.now()
+        start = now - timedelta(hours=1)
+        self.assertEqual(backfill_candles("AAPL", start, now), 1)
+        later = now + timedelta(seconds=30)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(backfill_candles("AAPL", start, later), 0)
+        covered = CandleRange.objects.get(symbol="AAPL")
+        self.assertLess(covered.end, now - timedelta(minutes=14))
+        cache.delete(CANDLE_TAIL_KEY.format("AAPL"))
+        self.assertEqual(backfill_candles("AAPL", start, now), 1)
+        self.assertEqual(self.server.counters["requests"], 2)
+
+    def test_candles_view_serves_stored_bars_when_upstream_down(self):
+        backfill_candles("AAPL", *self.hours(0, 1))
+        breaker = get_breaker("stock_candles")
+        for _ in range(5):
+            breaker.record_failure()
+        params = {"ticker": "AAPL", "from": self.start, "to": self.start + 7200}
+        response = self.client.get(reverse("stock_candles"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Cache"], "partial")
+        self.assertEqual(len(response.data["t"]), 1)
+
+        response = self.client.get(
+            reverse("stock_candles"), {**params, "ticker": "MSFT"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class FavoriteStockAnalyticsTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.server = FinnhubStubServer().start()
+        self.settings_override = override_settings(FINNHUB_API_URL=self.server.base_url)
+        self.settings_override.enable()
+        reset_finnhub_client()
+        upstream_bucket.reset()
+        cache.clear()
+
+    def tearDown(self):
+        reset_finnhub_client()
+        self.settings_override.disable()
+        self.server.stop()
+
+    def test_compute_metrics(self):
+        prices = np.array(
+            [[100.0, 10.0, np.nan], [110.0, 12.0, 5.0], [99.0, 9.0, np.nan]]
+        )
+        stats = compute_metrics(prices)
+        np.testing.assert_allclose(stats["return"], [-0.01, -0.1, 0.0])
+        np.testing.assert_allclose(stats["max_drawdown"], [-0.1, -0.25, 0.0])
+        np.testing.assert_allclose(
+            stats["correlation"][:2, :2],
+            np.corrcoef(np.diff(prices[:, :2], axis=0).T / prices[:-1, :2].T),
+        )
+        # Equal weights; the third symbol only joins on day two.
+        self.assertAlmostEqual(
+            stats["portfolio"]["return"], (1 + 0.15) * (1 + (-0.1 - 0.25) / 3) - 1
+        )
+
+    def test_drawdown_from_the_first_day(self):
+        stats = compute_metrics(np.array([[100.0], [90.0], [94.5]]))
+        self.assertAlmostEqual(stats["max_drawdown"][0], -0.1)
+        self.assertAlmostEqual(stats["portfolio"]["max_drawdown"], -0.1)
+
+    # Closes are fetched on their own pool, never the shared fan-out pool.
+    @mock.patch("core.cache.get_fanout_pool", mock.Mock(side_effect=AssertionError))
+    def test_analytics_view_is_cached(self):
+        for symbol in ["AAPL", "MSFT"]:
+            FavoriteStockFactory(user=self.user, stock_symbol=symbol)
+        url = reverse("favorite-stock-analytics")
+        first = self.client.get(url, {"window": 3})
+        second = self.client.get(url, {"window": 3})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first["X-Cache"], "miss")
+        self.assertEqual(second["X-Cache"], "hit")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(first.data["symbols"], ["AAPL", "MSFT"])
+        self.assertEqual(
+            set(first.data["metrics"]["AAPL"]), {"return", "volatility", "max_drawdown"}
+        )
+        self.assertEqual(first.data["correlation"][0][0], 1.0)
+        self.assertEqual(self.server.counters["requests"], 2)
+
+        bad = self.client.get(url, {"window": "week"})
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(FINNHUB_RATE_LIMIT_BURST=1, FINNHUB_RATE_LIMIT_MAX_WAIT=0)
+    def test_partial_results_are_cached_briefly(self):
+        symbols = ["AAPL", "MSFT", "TSLA"]
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            result, _ = portfolio_analytics(symbols, 30)
+        # Once throttled, the rest are not even tried.
+        self.assertEqual(self.server.counters["requests"], 1)
+        self.assertEqual(len(result["unavailable"]), 2)
+        key, value, ttl = cache_set.call_args.args
+        self.assertEqual((value, ttl), (result, settings.ANALYTICS_PARTIAL_CACHE_TTL))
+
+        # Once that expires, only the missing series are fetched.
+        cache.delete(key)
+        upstream_bucket.reset()
+        with override_settings(FINNHUB_RATE_LIMIT_BURST=10):
+            result, _ = portfolio_analytics(symbols, 30)
+        self.assertEqual(result["unavailable"], [])
+        self.assertEqual(self.server.counters["requests"], 3)
+        self.assertEqual(set(result["metrics"]), set(symbols))
+
+
+@override_settings(CIRCUIT_BREAKER_FAILURES=2, CIRCUIT_BREAKER_RESET_TIMEOUT=30)
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        profile_cache.clear()
+        reset_breakers()
+        upstream_bucket.reset()
+
+    def tearDown(self):
+        reset_breakers()
+
+    def fail_quotes(self):
+        return mock.patch.object(
+            get_finnhub_client(),
+            "quote",
+            side_effect=requests.ConnectTimeout("connect timed out"),
+        )
+
+    def test_breaker_opens_and_fails_fast(self):
+        with self.fail_quotes() as upstream:
+            for ticker in ["A", "B"]:
+                response = self.client.get(reverse("stock_price"), {"ticker": ticker})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.get(reverse("stock_price"), {"ticker": "C"})
+        self.assertEqual(upstream.call_count, 2)
+        self.assertEqual(get_breaker("quote").state, OPEN)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_open_breaker_serves_last_known_good_quote(self):
+        with mock.patch.object(get_finnhub_client(), "quote", return_value={"c": 9}):
+            self.client.get(reverse("stock_price"), {"ticker": "AAPL"})
+        cache.delete(QUOTE_KEY.format("AAPL"))
+        with self.fail_quotes():
+            for ticker in ["X", "Y"]:
+                self.client.get(reverse("stock_price"), {"ticker": ticker})
+        response = self.client.get(reverse("stock_price"), {"ticker": "AAPL"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"c": 9})
+        self.assertEqual(response["X-Cache"], "stale")
+        self.assertIn("Stale", response["Warning"])
+
+    def test_half_open_probe_closes_breaker(self):
+        breaker = get_breaker("quote")
+        for _ in range(2):
+            breaker.record(requests.ConnectionError())
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.opened_at -= 31
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(None)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_unfinished_probe_is_replaced(self):
+        breaker = get_breaker("quote")
+        for _ in range(2):
+            breaker.record(requests.ConnectionError())
+        breaker.opened_at -= 31
+        breaker.before_call()
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.opened_at -= 31
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+    async def test_cancelled_probe_releases_breaker(self):
+        breaker = get_breaker("quote")
+        for _ in range(2):
+            breaker.record(requests.ConnectionError())
+        breaker.opened_at -= 31
+
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with mock.patch.object(get_async_client(), "get", side_effect=hang):
+            task = asyncio.ensure_future(aget_stock_price_data("AAPL"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(breaker.state, OPEN)
+        breaker.opened_at -= 31
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+    def test_client_errors_do_not_open_breaker(self):
+        not_found = finnhub.FinnhubAPIException(
+            mock.Mock(status_code=404, json=lambda: {"error": "not found"})
+        )
+        with mock.patch.object(get_finnhub_client(), "quote", side_effect=not_found):
+            for ticker in ["A", "B", "C"]:
+                self.client.get(reverse("stock_price"), {"ticker": ticker})
+        self.assertEqual(get_breaker("quote").state, CLOSED)
+
+
 # finnhub disabled my account when I run these tests
 
 # class StockPriceViewTest(TestCase):
@@ -137,6 +1538,67 @@ class EditUserDetailsViewTest(TestCase):
 #         self.assertIn('Ticker is required', str(response.data))
 
 
+@skipUnless(connection.vendor == "postgresql", "query plans are checked on PostgreSQL")
+class QueryPlanTest(TestCase):
+    """The queries behind hot views must be answerable from an index.
+
+    Sequential scans are disabled for the planner, so a query still planned
+    as one has no usable index (tiny test tables would otherwise always be
+    scanned).
+    """
+
+    def setUp(self):
+        self.user = UserFactory(email="someone@example.com")
+        FavoriteStockFactory(user=self.user, stock_symbol="AAPL")
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertNoSeqScan(self, queryset):
+        plans = [json.loads(queryset.explain(format="json"))[0]["Plan"]]
+        while plans:
+            plan = plans.pop()
+            self.assertNotEqual(
+                plan["Node Type"],
+                "Seq Scan",
+                f"Sequential scan on {plan.get('Relation Name')}: {queryset.query}",
+            )
+            plans += plan.get("Plans", [])
+
+    def test_user_lookups(self):
+        # CreateUserSerializer and UserSerializer.validate_email.
+        self.assertNoSeqScan(User.objects.filter(email__iexact="SomeOne@example.com"))
+
+    def test_favorite_lookups(self):
+        favorites = FavoriteStock.objects.filter(user=self.user)
+        added_on = timezone.now()
+        # FavoriteStockListView, first and later keyset pages.
+        self.assertNoSeqScan(favorites.order_by("-added_on", "-id")[:11])
+        self.assertNoSeqScan(
+            favorites.filter(
+                Q(added_on__lt=added_on) | Q(added_on=added_on, id__lt=10)
+            ).order_by("-added_on", "-id")[:11]
+        )
+        # FavoriteStockDeleteView and the batch endpoints.
+        self.assertNoSeqScan(favorites.filter(stock_symbol="AAPL"))
+        self.assertNoSeqScan(favorites.filter(stock_symbol__in=["AAPL", "MSFT"]))
+        # Per-symbol favorite counts.
+        self.assertNoSeqScan(
+            FavoriteStock.objects.annotate(symbol=Upper("stock_symbol")).filter(
+                symbol="AAPL"
+            )
+        )
+
+    def test_market_data_lookups(self):
+        now = timezone.now()
+        self.assertNoSeqScan(
+            Candle.objects.filter(
+                symbol="AAPL", ts__gte=now - timedelta(days=1), ts__lt=now
+            ).order_by("ts")
+        )
+        self.assertNoSeqScan(StockSymbol.objects.filter(symbol__startswith="AA"))
+        self.assertNoSeqScan(PriceAlert.objects.filter(is_active=True))
+
+
 class FavoriteStockSerializerTest(TestCase):
     def test_favorite_stock_serializer(self):
         user = UserFactory()
@@ -175,6 +1637,83 @@ class FavoriteStockListViewTest(TestCase):
         response = self.client.get(reverse("favorite-stock-list"))
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_keyset_pagination(self):
+        # Ties on added_on must neither repeat nor skip rows across pages.
+        FavoriteStock.objects.bulk_create(
+            FavoriteStock(user=self.user, stock_symbol=f"S{i}") for i in range(24)
+        )
+        FavoriteStock.objects.filter(user=self.user).update(
+            added_on=self.favorite_stock.added_on
+        )
+        expected = list(
+            FavoriteStock.objects.filter(user=self.user)
+            .order_by("-added_on", "-id")
+            .values_list("stock_symbol", flat=True)
+        )
+        seen, pages, url = [], [], reverse("favorite-stock-list")
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            pages.append(response.data)
+            seen += [f["stock_symbol"] for f in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["previous"])
+
+        response = self.client.get(pages[2]["previous"])
+        self.assertEqual(response.data["results"], pages[1]["results"])
+
+    def test_page_number_opt_in(self):
+        FavoriteStockFactory.create_batch(11, user=self.user)
+        response = self.client.get(reverse("favorite-stock-list"), {"page": 2})
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("favorite-stock-list"), {"cursor": "junk"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FavoriteStockQuoteListViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+        profile_cache.clear()
+
+    def test_favorites_enriched_with_quotes_and_profiles(self):
+        FavoriteStockFactory(user=self.user, stock_symbol="AAPL")
+        FavoriteStockFactory(user=self.user, stock_symbol="BAD")
+        FavoriteStockFactory(stock_symbol="MSFT")
+
+        def quote(ticker):
+            if ticker == "BAD":
+                raise Exception("upstream error")
+            return {"c": 1.0}
+
+        with mock.patch(
+            "core.cache.get_stock_price_data", side_effect=quote
+        ) as quotes, mock.patch.object(
+            profile_cache, "fetch", return_value={"name": "Apple"}
+        ) as profiles:
+            response = self.client.get(reverse("favorite-stock-quotes"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {r["stock_symbol"]: r for r in response.data["results"]}
+        self.assertEqual(set(results), {"AAPL", "BAD"})
+        self.assertEqual(results["AAPL"]["quote"], {"c": 1.0})
+        self.assertEqual(results["AAPL"]["profile"], {"name": "Apple"})
+        self.assertIsNone(results["BAD"]["quote"])
+        self.assertEqual(quotes.call_count, 2)
+        self.assertEqual(profiles.call_count, 2)
+
+    def test_favorites_with_quotes_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse("favorite-stock-quotes"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 
 class FavoriteStockCreateViewTest(TestCase):
     def setUp(self):
@@ -200,6 +1739,89 @@ class FavoriteStockCreateViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class FavoriteStockBatchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        FavoriteStockFactory(user=self.user, stock_symbol="AAPL")
+
+    def test_batch_create(self):
+        symbols = ["AAPL", "MSFT", " TSLA ", "MSFT", "", "TOOLONGSYMBOL"]
+        # One lookup, then savepoint, one INSERT, release.
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                reverse("favorite-stock-batch"), {"symbols": symbols}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["counts"], {"invalid": 2, "exists": 1, "created": 2}
+        )
+        self.assertIn(
+            {"stock_symbol": "TSLA", "status": "created"}, response.data["results"]
+        )
+        self.assertEqual(
+            set(self.user.favorite_stocks.values_list("stock_symbol", flat=True)),
+            {"AAPL", "MSFT", "TSLA"},
+        )
+
+    def test_batch_create_racing_another_request(self):
+        # AAPL is saved by someone else between the lookup and the INSERT.
+        with mock.patch.object(QuerySet, "values_list", return_value=[]):
+            response = self.client.post(
+                reverse("favorite-stock-batch"),
+                {"symbols": ["AAPL", "MSFT"]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["counts"], {"exists": 1, "created": 1})
+        self.assertIn(
+            {"stock_symbol": "AAPL", "status": "exists"}, response.data["results"]
+        )
+        self.assertEqual(
+            set(self.user.favorite_stocks.values_list("stock_symbol", flat=True)),
+            {"AAPL", "MSFT"},
+        )
+
+    def test_batch_delete(self):
+        FavoriteStockFactory(user=self.user, stock_symbol="MSFT")
+        other = FavoriteStockFactory(stock_symbol="AAPL")
+        response = self.client.delete(
+            reverse("favorite-stock-batch"),
+            {"symbols": ["AAPL", "MSFT", "GOOG"]},
+            format="json",
+        )
+        self.assertEqual(response.data["counts"], {"deleted": 2, "not_found": 1})
+        self.assertFalse(self.user.favorite_stocks.exists())
+        self.assertTrue(FavoriteStock.objects.filter(id=other.id).exists())
+
+    def test_batch_rejects_bad_payload(self):
+        response = self.client.post(
+            reverse("favorite-stock-batch"), {"symbols": "AAPL"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(FAVORITES_BATCH_MAX=2):
+            response = self.client.post(
+                reverse("favorite-stock-batch"),
+                {"symbols": ["A", "B", "C"]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export(self):
+        FavoriteStockFactory(user=self.user, stock_symbol="MSFT")
+        response = self.client.get(reverse("favorite-stock-export"))
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([f["stock_symbol"] for f in data], ["MSFT", "AAPL"])
+
+        response = self.client.get(reverse("favorite-stock-export"), {"output": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "stock_symbol,added_on")
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], ["MSFT", "AAPL"])
+
+
 class FavoriteStockDeleteViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
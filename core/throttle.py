@@ -0,0 +1,219 @@
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stats import Counters
+
+_background = contextvars.ContextVar("upstream_background", default=False)
+
+
+class UpstreamThrottled(Exception):
+    """The Finnhub quota is exhausted for longer than the caller may wait."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream rate limit reached, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Mark upstream calls made inside the block as background work.
+
+    Background calls (cache refreshes, prefetching, stream polling) leave
+    FINNHUB_RATE_LIMIT_RESERVE tokens untouched, so requests a user is
+    waiting on are served first.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class TokenBucket:
+    """Token bucket for the upstream API quota.
+
+    With FINNHUB_RATE_LIMIT_SHARED the bucket lives in the default cache and
+    is shared by every worker using it; updates are serialised with a
+    short-lived ``cache.add`` lock. Otherwise each process has its own bucket.
+    """
+
+    key = "throttle:finnhub"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self.stats = Counters("acquired", "waited", "throttled", "upstream_429")
+        self._wait_lock = threading.Lock()
+        self.wait_seconds = 0.0
+
+    @property
+    def rate(self):
+        return settings.FINNHUB_RATE_LIMIT_PER_MINUTE / 60
+
+    @property
+    def capacity(self):
+        return settings.FINNHUB_RATE_LIMIT_BURST
+
+    def try_acquire(self, reserve=0):
+        """Take a token if one is available above ``reserve``.
+
+        Returns 0 on success, otherwise the seconds until one will be.
+        """
+        return self._update(self._take(reserve))
+
+    async def atry_acquire(self, reserve=0):
+        """Async counterpart of ``try_acquire``."""
+        return await self._aupdate(self._take(reserve))
+
+    def drain(self):
+        """Empty the bucket, e.g. after the upstream answered 429."""
+        self._update(self._empty)
+
+    async def adrain(self):
+        """Async counterpart of ``drain``."""
+        await self._aupdate(self._empty)
+
+    def rejected(self):
+        """Record a 429 from the upstream and return the exception to raise."""
+        self.stats.incr("upstream_429")
+        # Stop every worker sharing the bucket from piling on more calls.
+        self.drain()
+        return UpstreamThrottled(1 / self.rate)
+
+    async def arejected(self):
+        """Async counterpart of ``rejected``."""
+        self.stats.incr("upstream_429")
+        await self.adrain()
+        return UpstreamThrottled(1 / self.rate)
+
+    def acquire(self):
+        """Block until a token is available or the wait deadline passes."""
+        deadline, reserve = self._deadline_and_reserve()
+        waited = False
+        while True:
+            wait = self.try_acquire(reserve)
+            if not wait:
+                return self._acquired(waited)
+            now = time.monotonic()
+            if now + wait > deadline:
+                self.stats.incr("throttled")
+                raise UpstreamThrottled(wait)
+            waited = True
+            self._add_wait(wait)
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Async counterpart of ``acquire``."""
+        deadline, reserve = self._deadline_and_reserve()
+        waited = False
+        while True:
+            wait = await self.atry_acquire(reserve)
+            if not wait:
+                return self._acquired(waited)
+            now = time.monotonic()
+            if now + wait > deadline:
+                self.stats.incr("throttled")
+                raise UpstreamThrottled(wait)
+            waited = True
+            self._add_wait(wait)
+            await asyncio.sleep(wait)
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+        cache.delete(self.key)
+
+    def _deadline_and_reserve(self):
+        if _background.get():
+            max_wait = settings.FINNHUB_RATE_LIMIT_BACKGROUND_MAX_WAIT
+            reserve = settings.FINNHUB_RATE_LIMIT_RESERVE
+        else:
+            max_wait = settings.FINNHUB_RATE_LIMIT_MAX_WAIT
+            reserve = 0
+        return time.monotonic() + max_wait, reserve
+
+    def _acquired(self, waited):
+        self.stats.incr("acquired")
+        if waited:
+            self.stats.incr("waited")
+
+    def _add_wait(self, seconds):
+        with self._wait_lock:
+            self.wait_seconds += seconds
+
+    def _take(self, reserve):
+        def take(state, now):
+            tokens = min(
+                self.capacity, state["tokens"] + (now - state["ts"]) * self.rate
+            )
+            if tokens >= 1 + reserve:
+                return {"tokens": tokens - 1, "ts": now}, 0.0
+            return {"tokens": tokens, "ts": now}, (1 + reserve - tokens) / self.rate
+
+        return take
+
+    @staticmethod
+    def _empty(state, now):
+        return {"tokens": 0.0, "ts": now}, None
+
+    def _initial(self, now):
+        return {"tokens": float(self.capacity), "ts": now}
+
+    def _update_local(self, fn, now):
+        with self._lock:
+            self._state, result = fn(self._state or self._initial(now), now)
+        return result
+
+    def _update(self, fn):
+        now = time.time()
+        if not settings.FINNHUB_RATE_LIMIT_SHARED:
+            return self._update_local(fn, now)
+
+        lock_key = f"{self.key}:lock"
+        locked = False
+        for _ in range(50):
+            if cache.add(lock_key, 1, 1):
+                locked = True
+                break
+            time.sleep(0.001)
+        try:
+            state, result = fn(cache.get(self.key) or self._initial(now), now)
+            cache.set(self.key, state, 3600)
+        finally:
+            # Without the lock a concurrent update may be lost; that errs
+            # towards a few extra calls rather than stalling the request.
+            if locked:
+                cache.delete(lock_key)
+        return result
+
+    async def _aupdate(self, fn):
+        # Same as _update, but the shared bucket's cache round trips and the
+        # lock spin must not block the event loop.
+        now = time.time()
+        if not settings.FINNHUB_RATE_LIMIT_SHARED:
+            return self._update_local(fn, now)
+
+        lock_key = f"{self.key}:lock"
+        locked = False
+        for _ in range(50):
+            if await cache.aadd(lock_key, 1, 1):
+                locked = True
+                break
+            await asyncio.sleep(0.001)
+        try:
+            state = await cache.aget(self.key) or self._initial(now)
+            state, result = fn(state, now)
+            await cache.aset(self.key, state, 3600)
+        finally:
+            if locked:
+                await cache.adelete(lock_key)
+        return result
+
+
+upstream_bucket = TokenBucket()
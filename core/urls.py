@@ -5,10 +5,28 @@ from core.user_views import (
     CreateUserView,
     EditUserView,
     LoginView,
+    TokenRefreshView,
 )
-from core.stock_views import StockDataView, StockPriceView, StockProfileView
+from core.stock_views import (
+    StockDataView,
+    StockPriceView,
+    StockProfileView,
+    StockCandlesView,
+    StockCacheStatsView,
+)
+from core.async_stock_views import (
+    AsyncStockDataView,
+    AsyncStockPriceView,
+    AsyncStockProfileView,
+    FavoriteQuoteStreamView,
+)
+from core.alert_views import PriceAlertListCreateView, PriceAlertDeleteView
 from core.favorite_views import (
     FavoriteStockListView,
+    FavoriteStockQuoteListView,
+    FavoriteStockAnalyticsView,
+    FavoriteStockBatchView,
+    FavoriteStockExportView,
     FavoriteStockCreateView,
     FavoriteStockDeleteView,
 )
@@ -20,12 +38,51 @@ urlpatterns = [
     path("user/edit/", EditUserView.as_view(), name="edit_user"),
     path("user/", CurrentUserView.as_view(), name="current_user"),
     path("login/", LoginView.as_view(), name="login"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("stock-data/", StockDataView.as_view(), name="stock_data"),
     path("stock-price/", StockPriceView.as_view(), name="stock_price"),
     path("stock-profile/", StockProfileView.as_view(), name="stock_profile"),
+    path("stock-candles/", StockCandlesView.as_view(), name="stock_candles"),
+    path(
+        "stock-cache-stats/", StockCacheStatsView.as_view(), name="stock_cache_stats"
+    ),
+    path("async/stock-data/", AsyncStockDataView.as_view(), name="async_stock_data"),
+    path(
+        "async/stock-price/", AsyncStockPriceView.as_view(), name="async_stock_price"
+    ),
+    path(
+        "async/stock-profile/",
+        AsyncStockProfileView.as_view(),
+        name="async_stock_profile",
+    ),
     path(
         "favorite-stocks/", FavoriteStockListView.as_view(), name="favorite-stock-list"
     ),
+    path(
+        "favorite-stocks/quotes/",
+        FavoriteStockQuoteListView.as_view(),
+        name="favorite-stock-quotes",
+    ),
+    path(
+        "favorite-stocks/analytics/",
+        FavoriteStockAnalyticsView.as_view(),
+        name="favorite-stock-analytics",
+    ),
+    path(
+        "favorite-stocks/stream/",
+        FavoriteQuoteStreamView.as_view(),
+        name="favorite-stock-stream",
+    ),
+    path(
+        "favorite-stocks/batch/",
+        FavoriteStockBatchView.as_view(),
+        name="favorite-stock-batch",
+    ),
+    path(
+        "favorite-stocks/export/",
+        FavoriteStockExportView.as_view(),
+        name="favorite-stock-export",
+    ),
     path(
         "favorite-stocks/create/",
         FavoriteStockCreateView.as_view(),
@@ -36,4 +93,10 @@ urlpatterns = [
         FavoriteStockDeleteView.as_view(),
         name="favorite-stock-delete",
     ),
+    path("price-alerts/", PriceAlertListCreateView.as_view(), name="price-alerts"),
+    path(
+        "price-alerts/delete/<int:pk>/",
+        PriceAlertDeleteView.as_view(),
+        name="price-alert-delete",
+    ),
 ]
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import is_process_local
+from .models import User
+from .serializers import UserSerializer
+from .stats import Counters
+
+USER_KEY = "user:{}:{}"
+USER_VERSION_KEY = "user:{}:version"
+
+user_stats = Counters("hit", "miss")
+
+
+def _version(user_id):
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_user_payload(user_id, context=None):
+    """The UserSerializer payload for a user, from the cache when possible.
+
+    Payloads are keyed by user id and a per-user version. Invalidating bumps
+    the version instead of deleting the payload, so a request that read the
+    user before an edit cannot put its stale payload back under the new key.
+    On a miss the user is loaded, as ``request.user`` may be built from
+    token claims and lack most fields.
+
+    With a process-local cache an edit only bumps the version in the worker
+    that served it, so payloads are then kept for USER_CACHE_LOCAL_TTL
+    seconds only.
+    """
+    key = USER_KEY.format(user_id, _version(user_id))
+    data = cache.get(key)
+    user_stats.incr("hit" if data is not None else "miss")
+    if data is None:
+        user = User.objects.get(pk=user_id)
+        # Store a plain dict; ReturnDict holds on to its serializer.
+        data = dict(UserSerializer(user, context=context).data)
+        if is_process_local():
+            ttl = settings.USER_CACHE_LOCAL_TTL
+        else:
+            ttl = settings.USER_CACHE_TTL
+        cache.set(key, data, ttl)
+    return data
+
+
+def invalidate_user_payload(user_id):
+    cache.set(USER_VERSION_KEY.format(user_id), time.time_ns(), None)
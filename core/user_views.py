@@ -5,7 +5,14 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
 from django.contrib.auth import get_user_model, authenticate, login
 import logging
+from .authentication import (
+    get_bearer_token,
+    issue_tokens,
+    refresh_tokens,
+    revoke_token,
+)
 from .serializers import UserSerializer, CreateUserSerializer
+from .user_cache import get_user_payload, invalidate_user_payload
 from django.contrib.auth import logout
 
 logger = logging.getLogger(__name__)
@@ -20,12 +27,14 @@ class CurrentUserView(RetrieveAPIView):
         logger.debug(f"Current user: {self.request.user}")
 
         if self.request.user.is_authenticated:
-            try:
-                return User.objects.get(email=self.request.user.email)
-            except User.DoesNotExist:
-                self.permission_denied(self.request, message="User not found")
+            # Already loaded by authentication (or built from token claims).
+            return self.request.user
         self.permission_denied(self.request, message="Not authenticated")
 
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        return Response(get_user_payload(user.pk, self.get_serializer_context()))
+
 
 class CreateUserView(CreateAPIView):
     serializer_class = CreateUserSerializer
@@ -36,11 +45,22 @@ class EditUserView(UpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user may be a TokenUser holding only the token's claims.
+        return User.objects.get(pk=self.request.user.pk)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_user_payload(serializer.instance.pk)
 
 
 class LogoutView(APIView):
     def post(self, request, *args, **kwargs):
+        access = get_bearer_token(request)
+        if access:
+            revoke_token(access)
+        refresh = request.data.get("refresh")
+        if isinstance(refresh, str):
+            revoke_token(refresh)
         logout(request)
         return Response({"message": "Logged out successfully"}, status=200)
 
@@ -54,5 +74,21 @@ class LoginView(APIView):
         user = authenticate(request, username=email, password=password)
         if user:
             login(request, user)
-            return Response({"message": "Login successful"}, status=HTTP_200_OK)
+            return Response(
+                {"message": "Login successful", **issue_tokens(user)},
+                status=HTTP_200_OK,
+            )
         return Response({"error": "Invalid credentials"}, status=HTTP_400_BAD_REQUEST)
+
+
+class TokenRefreshView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        refresh = request.data.get("refresh")
+        if not isinstance(refresh, str):
+            return Response(
+                {"error": "Refresh token is required"}, status=HTTP_400_BAD_REQUEST
+            )
+        return Response(refresh_tokens(refresh), status=HTTP_200_OK)
@@ -1,16 +1,102 @@
+import threading
+import time
+
 import finnhub
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .breaker import get_breaker
+from .metrics import observe_upstream
+from .throttle import upstream_bucket
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_finnhub_client():
+    """Return the process-wide Finnhub client, building it on first use.
+
+    The client wraps a single requests session, so connections to the
+    upstream are kept alive and reused by every thread in the worker.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def reset_finnhub_client():
+    """Drop the shared client so the next call builds a fresh one.
+
+    Needed after fork (sockets must not be shared between workers) and when
+    the Finnhub settings change, e.g. in tests.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def _build_client():
+    client = finnhub.Client(api_key=settings.FINNHUB_API_KEY)
+    client.API_URL = settings.FINNHUB_API_URL
+    client.DEFAULT_TIMEOUT = (
+        settings.FINNHUB_CONNECT_TIMEOUT,
+        settings.FINNHUB_READ_TIMEOUT,
+    )
+    # The pool is sized for every thread that can call Finnhub at once. If
+    # it is ever short, a thread opens a throwaway connection rather than
+    # waiting for a free one with no time limit.
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.FINNHUB_POOL_MAXSIZE,
+    )
+    client._session.mount("https://", adapter)
+    client._session.mount("http://", adapter)
+    return client
+
+
+def call_finnhub(method, *args, **kwargs):
+    """Call a ``finnhub.Client`` method through its circuit breaker and the
+    rate limiter.
+
+    Raises CircuitOpen straight away while the method's circuit is open.
+    """
+    breaker = get_breaker(method)
+    breaker.before_call()
+    try:
+        upstream_bucket.acquire()
+    except BaseException:
+        breaker.abort()
+        raise
+    start = time.perf_counter()
+    try:
+        result = getattr(get_finnhub_client(), method)(*args, **kwargs)
+    except Exception as e:
+        observe_upstream(method, time.perf_counter() - start, e)
+        breaker.record(e)
+        if isinstance(e, finnhub.FinnhubAPIException) and e.status_code == 429:
+            raise upstream_bucket.rejected() from e
+        raise
+    except BaseException:
+        # Interrupted without an outcome; don't hold on to a probe.
+        breaker.abort()
+        raise
+    observe_upstream(method, time.perf_counter() - start)
+    breaker.record(None)
+    return result
 
 
 def get_stock_data(ticker):
-    finnhub_client = finnhub.Client(api_key="d01tecpr01qt2u30mpkgd01tecpr01qt2u30mpl0")
-    return finnhub_client.symbol_lookup(ticker)
+    return call_finnhub("symbol_lookup", ticker)
 
 
 def get_stock_price_data(ticker):
-    finnhub_client = finnhub.Client(api_key="d01tecpr01qt2u30mpkgd01tecpr01qt2u30mpl0")
-    return finnhub_client.quote(ticker)
+    return call_finnhub("quote", ticker)
 
 
 def get_stock_profile(ticker):
-    finnhub_client = finnhub.Client(api_key="d01tecpr01qt2u30mpkgd01tecpr01qt2u30mpl0")
-    return finnhub_client.company_profile2(symbol=ticker)
+    return call_finnhub("company_profile2", symbol=ticker)
@@ -0,0 +1,101 @@
+"""
+Production gunicorn configuration, picked up from the working directory:
+
+    gunicorn -c gunicorn.conf.py
+
+Every value can be overridden from the environment. GUNICORN_WORKERS and
+GUNICORN_THREADS are also read by backend.settings to size the database
+and Finnhub connection pools, so both see the same numbers.
+"""
+
+import glob
+import os
+
+# The stock views spend most of their time waiting on Finnhub, so a worker
+# serves several requests at once: gthread runs GUNICORN_THREADS of them in
+# threads, uvicorn runs the ASGI application on an event loop (only the
+# /api/async/ views avoid blocking it; sync views share one thread there).
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class == "uvicorn":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    wsgi_app = "backend.asgi:application"
+else:
+    wsgi_app = "backend.wsgi:application"
+
+workers = int(os.environ.get("GUNICORN_WORKERS", str(2 * (os.cpu_count() or 1) + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", "10"))
+os.environ["GUNICORN_WORKERS"] = str(workers)
+os.environ["GUNICORN_THREADS"] = str(threads)
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+# Import Django and the project once in the master; workers fork with it
+# loaded, which starts them faster and shares the read-only memory. Threads
+# started while loading would only run in the master, so settings learns of
+# it from GUNICORN_PRELOAD and post_fork starts them in each worker instead.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+os.environ["GUNICORN_PRELOAD"] = "1" if preload_app else "0"
+
+# Recycle workers so slow leaks can't build up. The jitter keeps them from
+# all restarting at the same moment.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# A request may wait on several Finnhub calls of up to
+# FINNHUB_CONNECT_TIMEOUT + FINNHUB_READ_TIMEOUT each before failing, so
+# workers get well beyond that before being killed, and in-flight requests
+# get as long to finish on a restart or deploy.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# The heartbeat file is written on every request; keep it off the
+# container's overlay filesystem.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Snapshots left by a previous run would be summed into the new totals.
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    # Nothing should have connected in the master, but a socket inherited
+    # from it would be shared by every worker.
+    from django.conf import settings
+    from django.db import connections
+
+    from core.utils import reset_finnhub_client
+
+    connections.close_all()
+    reset_finnhub_client()
+    if settings.QUOTE_PREFETCH_THREAD:
+        from core.prefetch import start_prefetch_thread
+
+        start_prefetch_thread()
+
+
+def worker_exit(server, worker):
+    # Keep the last counts of a recycled worker in the metrics totals.
+    from core.metrics import registry
+
+    registry.flush(force=True)
+
+
+def child_exit(server, worker):
+    # Fold the exited worker's totals into METRICS_DIR's retired totals, so
+    # recycling doesn't leave a file per worker behind. Without preloading
+    # the master has no Django; a scrape does it instead.
+    if preload_app and os.environ.get("METRICS_DIR"):
+        from core.metrics import registry
+
+        registry.retire(worker.pid)